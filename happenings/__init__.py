@@ -1,2 +1,4 @@
 __version__ = '0.3.3'
 __url__ = 'https://github.com/wreckage/django-happenings'
+
+default_app_config = 'happenings.apps.HappeningsConfig'
@@ -43,8 +43,12 @@ class EventAdmin(admin.ModelAdmin):
     date_hierarchy = 'start_date'
     inlines = [CancellationInline]
 
+
+class LocationAdmin(admin.ModelAdmin):
+    prepopulated_fields = {'slug': ('name',)}
+
 admin.site.register(Event, EventAdmin)
-admin.site.register(Location)
+admin.site.register(Location, LocationAdmin)
 admin.site.register(Category)
 admin.site.register(Tag)
 admin.site.register(Cancellation)
@@ -0,0 +1,94 @@
+from __future__ import unicode_literals
+
+from datetime import timedelta
+from multiprocessing.pool import ThreadPool
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Q
+
+from happenings.models import Event
+from happenings.utils.common import get_now
+from happenings.utils.materialize import (
+    extend_events, get_horizon, materialize_event
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Backfills the Occurrence table, or extends the occurrences of "
+        "events that repeat forever up to the horizon."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--horizon', type=int, default=None,
+            help="Number of days from today to materialize open-ended "
+                 "series up to (default: CALENDAR_OCCURRENCE_HORIZON)."
+        )
+        parser.add_argument(
+            '--rebuild', action='store_true', default=False,
+            help="Rewrite the occurrences of every event instead of only "
+                 "adding the missing ones."
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help="Number of events handled by each batch."
+        )
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help="Number of batches handled in parallel."
+        )
+
+    def get_event_pks(self, rebuild):
+        events = Event.objects.all()
+        if not rebuild:
+            # new events, events that haven't been recorded as
+            # materialized, and events that repeat forever
+            events = events.filter(
+                Q(occurrence=None) | Q(materialized_until=None) |
+                Q(end_repeat=None) & ~Q(repeat='NEVER')
+            ).distinct()
+        return list(events.order_by('pk').values_list('pk', flat=True))
+
+    def handle_batch(self, pks):
+        events = Event.objects.filter(pk__in=pks).prefetch_related(
+            'cancellations')
+        if self.rebuild:
+            return sum(
+                materialize_event(event, self.horizon) for event in events
+            )
+        return extend_events(events, self.horizon)
+
+    def handle_batch_in_thread(self, pks):
+        try:
+            return self.handle_batch(pks)
+        finally:
+            # each worker thread opens its own connection
+            connection.close()
+
+    def handle(self, *args, **options):
+        self.rebuild = options['rebuild']
+        self.horizon = get_horizon()
+        if options['horizon'] is not None:
+            self.horizon = get_now().date() + timedelta(
+                days=options['horizon'])
+
+        pks = self.get_event_pks(self.rebuild)
+        size = max(options['batch_size'], 1)
+        batches = [pks[i:i + size] for i in range(0, len(pks), size)]
+
+        if options['workers'] > 1:
+            pool = ThreadPool(options['workers'])
+            try:
+                written = sum(pool.map(self.handle_batch_in_thread, batches))
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            written = sum(self.handle_batch(batch) for batch in batches)
+
+        self.stdout.write(
+            "Materialized %d occurrence(s) of %d event(s) up to %s." % (
+                written, len(pks), self.horizon)
+        )
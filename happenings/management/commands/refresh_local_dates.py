@@ -0,0 +1,26 @@
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand
+
+from happenings.models import Event
+
+
+class Command(BaseCommand):
+    help = (
+        "Fills in the local date columns of every event again, e.g. after "
+        "changing TIME_ZONE."
+    )
+
+    def handle(self, *args, **options):
+        fields = [
+            'local_start_date', 'local_end_date', 'start_weekday',
+            'start_day', 'start_month',
+        ]
+        count = 0
+        for event in Event.objects.all().iterator():
+            event.set_local_dates()
+            Event.objects.filter(pk=event.pk).update(
+                **dict((f, getattr(event, f)) for f in fields)
+            )
+            count += 1
+        self.stdout.write("Updated %d events." % count)
@@ -3,23 +3,146 @@ from __future__ import unicode_literals
 import datetime
 from calendar import monthrange
 
+import six
 from django.db import models
-from django.db.models import Q
+from django.db.models import Exists, F, OuterRef, Prefetch, Q
+from django.utils import timezone
 from django.utils.timezone import make_aware, get_default_timezone
 
+from happenings.utils.cache import get_filter_ids
+from happenings.utils.common import merge_sorted
+from happenings.utils.routing import get_read_db
+
+
+# The fields needed to work out an event's occurrences
+OCCURRENCE_FIELDS = (
+    'start_date', 'end_date', 'repeat', 'end_repeat', 'updated_at',
+    'local_start_date', 'local_end_date',
+)
+COLOR_FIELDS = (
+    'background_color', 'background_color_custom', 'font_color',
+    'font_color_custom',
+)
+
 
 class EventManager(models.Manager):
-    def _get_kwargs(self, category, tag):
-        """Helper function for getting category/tag kwargs."""
-        vals = {
-            'categories__title__iexact': category,
-            'tags__name__iexact': tag
-        }
-        kwargs = {}
-        for k, v in vals.items():
-            if v:
-                kwargs[k] = v
-        return kwargs
+    # The fields each way of displaying events uses; everything else (e.g.
+    # a long description) is left in the database. Deferred fields are
+    # loaded one event at a time if they're used after all, so use 'full'
+    # when events are serialized.
+    PROJECTIONS = {
+        # mini calendar: times and titles
+        'mini': OCCURRENCE_FIELDS + ('title',),
+        # calendar cells and event lists: times, titles and colors
+        'grid': OCCURRENCE_FIELDS + ('title',) + COLOR_FIELDS,
+        # calendar cells with popovers: plus the description
+        'popover': OCCURRENCE_FIELDS + ('title', 'description') +
+        COLOR_FIELDS,
+        'full': None,
+    }
+
+    def _read(self):
+        """Returns all events, read from the calendar's read database."""
+        return self.model.objects.using(get_read_db())
+
+    def _project(self, events, projection):
+        """Returns 'events' with only the fields 'projection' needs."""
+        fields = self.PROJECTIONS[projection]
+        if fields is None:
+            return events
+        return events.only(*fields)
+
+    def _category_tag_filters(self, category, tag):
+        """
+        Yields a (param, m2m name, model, field, values) tuple for each of
+        the category and tag filters that's set, 'values' being a list.
+        """
+        filters = (
+            ('category', 'categories', 'title', category),
+            ('tag', 'tags', 'name', tag),
+        )
+        for param, name, field, values in filters:
+            if not values:
+                continue
+            if isinstance(values, six.string_types):
+                values = [values]
+            model = self.model._meta.get_field(name).related_model
+            yield param, name, model, field, values
+
+    def _filter_category_tag(self, events, category, tag, location=None):
+        """
+        Filters 'events' down to the ones in the given category and/or
+        with the given tag and/or at the given location (a Location pk or
+        slug). Each filter is a correlated EXISTS subquery against the
+        resolved category/tag/location ids, so no rows are joined in and
+        distinct() isn't needed.
+        'category' and 'tag' can also be lists, which keep the events in
+        any of the categories (or with any of the tags). Each of their
+        values is then annotated as matched_<name>_<i> (e.g.
+        matched_categories_0), which is True if the event matched it; see
+        set_matched_filters().
+        """
+        for param, name, model, field, values in self._category_tag_filters(
+                category, tag):
+            events = self._filter_m2m(
+                events, name, get_filter_ids(model, field, values))
+            if len(values) == 1:
+                continue  # every event that's left matched it
+            for i, value in enumerate(values):
+                alias = 'matched_%s_%d' % (name, i)
+                events = events.annotate(**{alias: self._exists_m2m(
+                    name, get_filter_ids(model, field, value))})
+        if location:
+            try:
+                # a pk is matched on the through table's own index
+                ids = [int(location)]
+            except ValueError:
+                ids = get_filter_ids(
+                    self.model._meta.get_field('location').related_model,
+                    'slug', location, lookup='exact'
+                )
+            events = self._filter_m2m(events, 'location', ids)
+        return events
+
+    def set_matched_filters(self, events, category=None, tag=None):
+        """
+        Sets the matched_filters of 'events', which were filtered on
+        'category' and 'tag', to the ('category', value) and ('tag', value)
+        pairs each one matched, from their matched_* annotations. Returns
+        'events'.
+        """
+        filters = list(self._category_tag_filters(category, tag))
+        for event in events:
+            event.matched_filters = [
+                (param, value)
+                for param, name, model, field, values in filters
+                for i, value in enumerate(values)
+                if len(values) == 1 or
+                getattr(event, 'matched_%s_%d' % (name, i))
+            ]
+        return events
+
+    def _exists_m2m(self, name, ids):
+        """
+        Returns an EXISTS subquery that's true for the events related to
+        any of 'ids' (a list or a queryset of pks) through the
+        many-to-many field 'name'.
+        """
+        m2m = self.model._meta.get_field(name)
+        through = m2m.remote_field.through
+        return Exists(through.objects.filter(**{
+            m2m.m2m_field_name(): OuterRef('pk'),
+            m2m.m2m_reverse_field_name() + '__in': ids,
+        }))
+
+    def _filter_m2m(self, events, name, ids):
+        """
+        Filters 'events' down to the ones related to any of 'ids' (a list
+        or a queryset of pks) through the many-to-many field 'name'.
+        """
+        alias = 'in_%s' % name
+        return events.annotate(
+            **{alias: self._exists_m2m(name, ids)}).filter(**{alias: True})
 
     @staticmethod
     def get_first_and_last(year, month):
@@ -34,13 +157,110 @@ class EventManager(models.Manager):
         )
         return ym_first, ym_last
 
+    def month_filter(self, year, month):
+        """
+        Returns a Q object matching the events that may occur in the given
+        month. Every branch is a range over an indexed column (see
+        Event.Meta.index_together), so the database never has to scan the
+        whole table: no date part extracts, and no negated conditions.
+        """
+        # The local date columns are in the default timezone, like the
+        # month's days. The month is the half-open range [first, after).
+        first = datetime.date(year, month, 1)
+        after = first + datetime.timedelta(days=monthrange(year, month)[1])
+        prev_month = (first - datetime.timedelta(days=1)).month
+        started = Q(local_start_date__lt=after)
+        # repeating events that haven't stopped repeating before the month;
+        # two terms so that each can use the (repeat, end_repeat, ...) index
+        forever = Q(end_repeat=None) & started
+        until = Q(end_repeat__gte=first) & started
+        # A yearly chunk that starts late in the month before can end in
+        # this one (it lasts 7 days at most, and months have 28 or more).
+        yearly = Q(repeat='YEARLY') & (
+            Q(start_month=month) |
+            Q(start_month=prev_month, start_day__gte=22)
+        )
+        others = Q(repeat__in=[
+            r for r, _ in self.model.REPEAT_CHOICES
+            if r not in ('NEVER', 'YEARLY')
+        ])
+        return (
+            # non-repeating events that overlap the month. Events can't
+            # span more than 7 days, which bounds the range of start dates.
+            Q(repeat='NEVER', local_end_date__gte=first,
+              local_start_date__gte=first - datetime.timedelta(days=7)) &
+            started |
+            yearly & forever | yearly & until |
+            others & forever | others & until |
+            # events saved without save() (e.g. with bulk_create()) don't
+            # have their local dates filled in, so they're always included
+            Q(local_start_date=None)
+        )
+
+    def day_filter(self, d):
+        """
+        Returns a Q object matching the events that may occur on the date
+        'd'. Occurrences that last a single day are only matched on the
+        weekday, day of the month and month they can fall on, so few events
+        that don't occur on 'd' are left for day_display() to rule out.
+        """
+        started = Q(local_start_date__lte=d)
+        live = (Q(end_repeat=None) | Q(end_repeat__gte=d)) & started
+        # multi-day ('chunk') occurrences can start on another day
+        chunk = Q(local_end_date__gt=F('local_start_date'))
+        prev_month = (d.replace(day=1) - datetime.timedelta(days=1)).month
+        daily = Q(repeat='DAILY')
+        weekday = Q(repeat='WEEKDAY')
+        if d.weekday() >= 5:
+            weekday &= chunk
+        weekly = Q(repeat__in=['WEEKLY', 'BIWEEKLY']) & (
+            Q(start_weekday=d.weekday()) | chunk)
+        monthly = Q(repeat='MONTHLY') & (Q(start_day=d.day) | chunk)
+        yearly = Q(repeat='YEARLY') & (
+            Q(start_month=d.month, start_day=d.day) |
+            chunk & (
+                Q(start_month=d.month) |
+                Q(start_month=prev_month, start_day__gte=22)
+            )
+        )
+        return (
+            Q(repeat='NEVER', local_end_date__gte=d,
+              local_start_date__range=(d - datetime.timedelta(days=7), d)) |
+            (daily | weekday | weekly | monthly | yearly) & live |
+            # see month_filter()
+            Q(local_start_date=None)
+        )
+
+    def all_day_events(self, d, category=None, tag=None, loc=False,
+                       projection='full', location=None):
+        """
+        Returns the events that may occur on the date 'd', ordered by start
+        date. Unless occurrences are materialized, some of them may not;
+        day_display() checks each one.
+        """
+        # imported here to avoid circular imports
+        from happenings.models import Occurrence
+        from happenings.utils.materialize import use_materialized
+        if use_materialized(d):
+            events = self._read().filter(pk__in=Occurrence.objects.filter(
+                date=d).values('event'))
+        else:
+            events = self._read().filter(self.day_filter(d))
+
+        events = self._filter_category_tag(events, category, tag, location)
+        if loc:
+            events = events.prefetch_related('location')
+        return self._project(events, projection).order_by('start_date')
+
     def all_month_events(self, year, month, category=None, tag=None,
-                         loc=False, cncl=False):
+                         loc=False, cncl=False, projection='full',
+                         location=None):
         """
         Returns all events that have an occurrence within the given
-        month & year.
+        month & year. 'projection' picks the fields that are loaded (see
+        PROJECTIONS). 'location' (a Location pk or slug) only keeps the
+        events at that location; 'loc' prefetches the events' locations.
         """
-        kwargs = self._get_kwargs(category, tag)
         ym_first, ym_last = self.get_first_and_last(year, month)
 
         pref = []
@@ -49,23 +269,59 @@ class EventManager(models.Manager):
         if cncl:
             pref.append("cancellations")
 
-        # for yearly repeat, we need to check the start and end date months
-        # b/c yearly events should occur every year in the same month
-        r = Q(repeat="YEARLY")
-        dstart_mo = Q(start_date__month=month)
-        dend_mo = Q(end_date__month=month)
+        # imported here to avoid circular imports
+        from happenings.models import Occurrence
+        from happenings.utils.materialize import use_materialized
+        if use_materialized(ym_last.date()):
+            # an indexed range scan over the materialized occurrence dates
+            events = self._read().filter(pk__in=Occurrence.objects.filter(
+                date__range=(ym_first.date(), ym_last.date())
+            ).values('event'))
+        else:
+            events = self._read().filter(self.month_filter(year, month))
+
+        events = self._filter_category_tag(events, category, tag, location)
+        return self._project(events, projection).prefetch_related(
+            *pref).order_by('start_date')
+
+    def occurrences_between(self, start, end, category=None, tag=None,
+                            loc=False, cncl=False, projection='full',
+                            location=None):
+        """
+        Yields a (local_start, local_end, event) tuple for every occurrence
+        going on from 'start' up to (but not including) 'end', which should
+        both be aware datetimes, in chronological order.
+        All of the candidate events are fetched with a single query, and
+        their occurrences are merged lazily, so callers that only want the
+        first few occurrences can stop early.
+        """
+        # imported here to avoid circular imports
+        from happenings.utils.occurrences import iter_occurrences
+
+        pref = []
+        if loc:
+            pref.append("location")
+        if cncl:
+            pref.append("cancellations")
+
+        events = self._read().filter(
+            Q(repeat="NEVER", end_date__gte=start) |
+            (~Q(repeat="NEVER") & (
+                Q(end_repeat=None) |
+                Q(end_repeat__gte=timezone.localtime(start).date())
+            )),
+            start_date__lt=end
+        )
+        events = self._project(self._filter_category_tag(
+            events, category, tag, location), projection).prefetch_related(
+            *pref)
 
-        dstart_yr = Q(start_date__year=year)
-        dend_yr = Q(end_date__year=year)
+        def occurrences(event):
+            for local_start, local_end in iter_occurrences(event, start, end):
+                yield local_start, local_end, event
 
-        return self.model.objects.filter(
-            # only events that are still repeating
-            r & (dstart_mo | dend_mo) |  # yearly repeat
-            (~Q(repeat="NEVER")) |  # all other repeats
-            ((dstart_yr | dend_yr) & (dstart_mo | dend_yr)),  # non-repeating
-            Q(end_repeat=None) | Q(end_repeat__gte=ym_first),
-            start_date__lte=ym_last  # no events that haven't started yet
-        ).filter(**kwargs).prefetch_related(*pref).order_by('start_date').distinct()
+        for item in merge_sorted([occurrences(event) for event in events]):
+            yield item
 
 #    XXX These are no longer used since all_month_events() (above) was created.
 #    def month_events(self, year, month, category=None, tag=None):
@@ -85,15 +341,26 @@ class EventManager(models.Manager):
 #            Q(start_date__month=month) | Q(end_date__month=month)
 #        )
 
-    def live(self, now):
+    def live(self, now, finish=None, projection='full', location=None):
         """
         Returns a queryset of events that will occur again after 'now'.
-        Used to help generate a list of upcoming events.
+        Used to help generate a list of upcoming events. If 'finish' is
+        given, events whose first occurrence starts after it (e.g. one-off
+        events further in the future) are left out too. 'location' (a
+        Location pk or slug) only keeps the events at that location.
         """
-        return self.model.objects.filter(
+        events = self._read().filter(
             Q(end_repeat=None) | Q(end_repeat__gte=now) |
             Q(start_date__gte=now) | Q(end_date__gte=now)
         ).exclude(  # exclude single day events that won't occur again
             start_date__lt=now, end_date__lt=now,
             repeat="NEVER", end_repeat=None,
-        ).prefetch_related('cancellations')
+        )
+        if finish is not None:
+            events = events.filter(start_date__lte=finish)
+        events = self._filter_category_tag(events, None, None, location)
+        # only the cancellations of occurrences that haven't passed yet
+        cancellations = self.model.cancellations.field.model.objects.using(
+            events.db).filter(date__gte=timezone.localtime(now).date())
+        return self._project(events, projection).prefetch_related(
+            Prefetch('cancellations', queryset=cancellations))
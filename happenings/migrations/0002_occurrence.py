@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('happenings', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Occurrence',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('date', models.DateField(db_index=True, verbose_name='date')),
+                ('cancelled', models.BooleanField(default=False, verbose_name='cancelled')),
+                ('event', models.ForeignKey(related_query_name='occurrence', related_name='occurrences', to='happenings.Event')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='occurrence',
+            unique_together=set([('event', 'date')]),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+from django.utils import timezone
+
+
+def fill_local_dates(apps, schema_editor):
+    Event = apps.get_model('happenings', 'Event')
+    tz = timezone.get_default_timezone()
+    for event in Event.objects.all().iterator():
+        start = timezone.localtime(event.start_date, tz).date()
+        Event.objects.filter(pk=event.pk).update(
+            local_start_date=start,
+            local_end_date=timezone.localtime(event.end_date, tz).date(),
+            start_weekday=start.weekday(),
+            start_day=start.day,
+            start_month=start.month,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('happenings', '0003_event_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='local_end_date',
+            field=models.DateField(db_index=True, editable=False, null=True, verbose_name='local end date'),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='local_start_date',
+            field=models.DateField(db_index=True, editable=False, null=True, verbose_name='local start date'),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='start_day',
+            field=models.PositiveSmallIntegerField(db_index=True, editable=False, null=True, verbose_name='start day'),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='start_month',
+            field=models.PositiveSmallIntegerField(db_index=True, editable=False, null=True, verbose_name='start month'),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='start_weekday',
+            field=models.PositiveSmallIntegerField(db_index=True, editable=False, null=True, verbose_name='start weekday'),
+        ),
+        migrations.RunPython(fill_local_dates, migrations.RunPython.noop),
+    ]
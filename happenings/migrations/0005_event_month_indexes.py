@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('happenings', '0004_event_local_dates'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='event',
+            index_together=set([('repeat', 'end_repeat', 'local_start_date'), ('repeat', 'local_start_date', 'local_end_date')]),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('happenings', '0005_event_month_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='cancellation',
+            name='date',
+            field=models.DateField(db_index=True, verbose_name='date'),
+        ),
+    ]
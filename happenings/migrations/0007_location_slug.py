@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('happenings', '0006_cancellation_date_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='slug',
+            field=models.SlugField(
+                blank=True, max_length=255, verbose_name='Slug',
+                help_text='Used to show the calendar of this location only '
+                          '(?cal_location=slug)'
+            ),
+        ),
+    ]
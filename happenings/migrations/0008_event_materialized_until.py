@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('happenings', '0007_location_slug'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='materialized_until',
+            field=models.DateField(db_index=True, editable=False, null=True, verbose_name='materialized until'),
+        ),
+    ]
@@ -14,6 +14,7 @@ from django.utils.translation import ugettext_lazy as _
 
 
 from .managers import EventManager
+from .utils.recurrence import Recurrence, get_recurrence_key
 
 auth_user_model = getattr(settings, "AUTH_USER_MODEL", "auth.User")
 
@@ -66,6 +67,35 @@ class Event(models.Model):
         'Category', verbose_name=_('categories'), blank=True
     )
     tags = models.ManyToManyField('Tag', verbose_name=_('tags'), blank=True)
+    # changes every time the event is saved; used to tell if memoized
+    # occurrences are still valid
+    updated_at = models.DateTimeField(_("updated at"), auto_now=True)
+
+    # ---------------------------LOCAL DATE COLUMNS--------------------------- #
+    # The start and end dates in the default timezone (settings.TIME_ZONE),
+    # filled in on save so that months can be filtered on by the database,
+    # and occurrences worked out without converting timezones.
+    local_start_date = models.DateField(
+        _("local start date"), null=True, editable=False, db_index=True
+    )
+    local_end_date = models.DateField(
+        _("local end date"), null=True, editable=False, db_index=True
+    )
+    start_weekday = models.PositiveSmallIntegerField(
+        _("start weekday"), null=True, editable=False, db_index=True
+    )
+    start_day = models.PositiveSmallIntegerField(
+        _("start day"), null=True, editable=False, db_index=True
+    )
+    start_month = models.PositiveSmallIntegerField(
+        _("start month"), null=True, editable=False, db_index=True
+    )
+    # the last day the event's Occurrence rows are complete up to (date.max
+    # if they all are), or None if they haven't been materialized; see
+    # happenings/utils/materialize.py
+    materialized_until = models.DateField(
+        _("materialized until"), null=True, editable=False, db_index=True
+    )
 
     # --------------------------------COLORS-------------------------------- #
     background_color = models.CharField(
@@ -88,8 +118,28 @@ class Event(models.Model):
         self._last_popover_html = None
         self._last_check_if_cancelled = None
         self._check_if_cancelled_cache = {}
+        self._recurrence = None
+        # a CancellationIndex shared with the other events being displayed
+        self.cancellation_index = None
+        # the ('category'/'tag', value) filters the event was found by (see
+        # EventManager.set_matched_filters())
+        self.matched_filters = []
         self.title_extra = ''
 
+    def save(self, *args, **kwargs):
+        self.set_local_dates()
+        super(Event, self).save(*args, **kwargs)
+
+    def set_local_dates(self):
+        """Fills in the local date columns from start_date and end_date."""
+        tz = timezone.get_default_timezone()
+        start = timezone.localtime(self.start_date, tz).date()
+        self.local_start_date = start
+        self.local_end_date = timezone.localtime(self.end_date, tz).date()
+        self.start_weekday = start.weekday()
+        self.start_day = start.day
+        self.start_month = start.month
+
     def get_l_start_date(self):
         """Localized start date."""
         return timezone.localtime(self.start_date)
@@ -106,33 +156,30 @@ class Event(models.Model):
     def l_end_date(self):
         return self.get_l_end_date()
 
+    @property
+    def recurrence(self):
+        """
+        The compiled Recurrence of the event. It's built once, and only
+        rebuilt if the dates, repeat, end_repeat or timezone change.
+        """
+        if self._recurrence is None or \
+                self._recurrence.key != get_recurrence_key(self):
+            self._recurrence = Recurrence(self)
+        return self._recurrence
+
     def is_happening(self, now):
         """Return True if the event is happening 'now', False if not."""
         start = self.l_start_date
         end = self.l_end_date
-        happening = False
-        # check that the event has started and 'now' is btwn start & end:
-        if (now >= start) and (start.time() <= now.time() <= end.time()):
-            if self.repeats('WEEKDAY'):
-                if not now.weekday() > 4:  # must be weekday
-                    happening = True
-            elif self.repeats('DAILY') or self.repeats('NEVER'):
-                    happening = True
-            elif self.repeats('MONTHLY'):
-                if start.day <= now.day <= end.day:
-                    happening = True
-            elif self.repeats('YEARLY'):
-                if (start.month <= now.month <= end.month) and \
-                        (start.day <= now.day <= end.day):
-                    happening = True
-            else:
-                repeat = {'WEEKLY': 7, 'BIWEEKLY': 14}
-                while end <= now:
-                    start += datetime.timedelta(days=repeat[self.repeat])
-                    end += datetime.timedelta(days=repeat[self.repeat])
-                if start <= now <= end:
-                    happening = True
-        return happening
+        # the event must have started, and be on at this time of day...
+        if now < start or not (start.time() <= now.time() <= end.time()):
+            return False
+        if self.repeats('WEEKLY') or self.repeats('BIWEEKLY'):
+            # ...during an occurrence that hasn't just ended
+            last = self.recurrence.before(now, inc=True)
+            return last is not None and now < self.recurrence.get_end(last)
+        # ...on a day that one of its occurrences covers
+        return self.recurrence.occurs_on(now.date())
 
     def repeats(self, repeat):
         return self.repeat == repeat
@@ -209,8 +256,14 @@ class Event(models.Model):
         """Return True if event was in cancelled state at 'date'. Also set self.title_extra to ' (CANCELLED)' if it was so.
 
         Warning! Results are memoized on instance level. If you need to reset "cache" of results then set ``instance._prefetched_objects_cache = {}``
+
+        If a CancellationIndex covering 'date' is attached to the event (see happenings/utils/cancellations.py), it's used instead of querying.
         """
         result = self._check_if_cancelled_cache.get(date, None)
+        index = self.cancellation_index
+        if result is None and index is not None and index.covers(date):
+            result = index.is_cancelled(self, date)
+            self._check_if_cancelled_cache[date] = result
         if result is None:
             try:
                 # if cancellations are prefetched then use iteration
@@ -224,11 +277,18 @@ class Event(models.Model):
 
             self._check_if_cancelled_cache[date] = result
 
-        if result:
-            self.title_extra = _(" (CANCELLED)")
+        self.title_extra = _(" (CANCELLED)") if result else ''
         self._last_check_if_cancelled = result
         return result
 
+    @property
+    def popover_html(self):
+        """
+        The html of the event's popover on the month calendar, once the
+        calendar has rendered it (see EventCalendar.get_popover_html()).
+        """
+        return self._last_popover_html
+
     @property
     def last_check_if_cancelled(self):
         if self._last_check_if_cancelled is None:
@@ -290,11 +350,21 @@ class Event(models.Model):
     class Meta:
         verbose_name = _('event')
         verbose_name_plural = _('events')
+        # used by EventManager.month_filter()
+        index_together = [
+            ('repeat', 'end_repeat', 'local_start_date'),
+            ('repeat', 'local_start_date', 'local_end_date'),
+        ]
 
 
 @python_2_unicode_compatible
 class Location(models.Model):
     name = models.CharField(_('Name'), max_length=255)
+    slug = models.SlugField(
+        _('Slug'), max_length=255, blank=True,
+        help_text=_('Used to show the calendar of this location only '
+                    '(?cal_location=slug)')
+    )
     address_line_1 = models.CharField(
         _('Address Line 1'), max_length=255, blank=True)
     address_line_2 = models.CharField(
@@ -338,7 +408,27 @@ class Cancellation(models.Model):
         Event, related_name="cancellations", related_query_name="cancellation"
     )
     reason = models.CharField(_("reason"), max_length=255)
-    date = models.DateField(_("date"))
+    date = models.DateField(_("date"), db_index=True)
+
+    def __str__(self):
+        return self.event.title + ' - ' + str(self.date)
+
+
+@python_2_unicode_compatible
+class Occurrence(models.Model):
+    """
+    A day (in local time) on which an event happens. Rows are only kept
+    up to date when CALENDAR_MATERIALIZE_OCCURRENCES is True; see
+    happenings/utils/materialize.py.
+    """
+    event = models.ForeignKey(
+        Event, related_name="occurrences", related_query_name="occurrence"
+    )
+    date = models.DateField(_("date"), db_index=True)
+    cancelled = models.BooleanField(_("cancelled"), default=False)
 
     def __str__(self):
         return self.event.title + ' - ' + str(self.date)
+
+    class Meta:
+        unique_together = ('event', 'date')
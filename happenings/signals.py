@@ -0,0 +1,71 @@
+from __future__ import unicode_literals
+
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from happenings.models import Event, Cancellation, Category, Tag, Location
+from happenings.utils.cache import bump_generation, bump_fragment_generation
+from happenings.utils.materialize import (
+    materialize_enabled, materialize_event, sync_cancellations
+)
+from happenings.utils.memo import occurrence_memo
+
+
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+def evict_memoized_occurrences(sender, instance, **kwargs):
+    occurrence_memo.evict(instance.pk)
+
+
+@receiver(post_save, sender=Event)
+def materialize_saved_event(sender, instance, raw=False, **kwargs):
+    if raw or not materialize_enabled():
+        return
+    # the start and end dates may have changed since they were localized
+    for attr in ('l_start_date', 'l_end_date', 'start_end_diff'):
+        instance.__dict__.pop(attr, None)
+    materialize_event(instance)
+
+
+@receiver(post_save, sender=Cancellation)
+@receiver(post_delete, sender=Cancellation)
+def sync_cancelled_occurrences(sender, instance, raw=False, **kwargs):
+    if raw or not materialize_enabled():
+        return
+    sync_cancellations(instance.event_id)
+
+
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+@receiver(post_save, sender=Cancellation)
+@receiver(post_delete, sender=Cancellation)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Location)
+@receiver(post_delete, sender=Location)
+def invalidate_cached_calendars(sender, **kwargs):
+    bump_generation()
+
+
+@receiver(m2m_changed, sender=Event.categories.through)
+@receiver(m2m_changed, sender=Event.tags.through)
+@receiver(m2m_changed, sender=Event.location.through)
+def invalidate_cached_calendars_m2m(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_generation()
+
+
+# Cached day cells and popovers key on the events' updated_at, which
+# doesn't change when their locations do.
+@receiver(post_save, sender=Location)
+@receiver(post_delete, sender=Location)
+def invalidate_cached_fragments(sender, **kwargs):
+    bump_fragment_generation()
+
+
+@receiver(m2m_changed, sender=Event.location.through)
+def invalidate_cached_fragments_m2m(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_fragment_generation()
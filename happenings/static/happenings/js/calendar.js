@@ -79,18 +79,61 @@ if (window.jQuery) {
             }
         }
 
+        // With CALENDAR_LAZY_POPOVERS, the events only carry the item their
+        // popover is fetched with (data-popover); a cell's popovers are
+        // fetched in one request when the mouse enters it, and bootstrap
+        // reads data-content when a popover is shown.
+        $(document).on('mouseenter', 'table[data-popovers-url] td', function() {
+            var url = $(this).closest('table').data('popovers-url')
+            , els = $(this).find('.calendar-event[data-popover]')
+                .not('[data-content]')
+            , items = []
+            ;
+
+            els.each(function() {
+                var item = $(this).attr('data-popover');
+                if (item.split(':')[1]) {
+                    items.push(item);
+                    $(this).attr('data-content', '');  // loading
+                }
+            });
+            if (!items.length)
+                return;
+
+            $.ajax({
+                type: "GET",
+                url: url,
+                data: {p: items},
+                traditional: true,
+                dataType: 'json',
+                success: function(data) {
+                    els.each(function() {
+                        var html = data.popovers[$(this).attr('data-popover')];
+                        if (html !== undefined)
+                            $(this).attr('data-content', html);
+                    });
+                },
+                error: function() {
+                    els.removeAttr('data-content');  // try again next time
+                }
+            });
+        });
+
         // event listener for day view's next/prev
         $(document).on('click', '.cal-day', function(event) {
             event.preventDefault();
             var qs = ''
             , cat = $('#cal-day-category').html()
             , tag = $('#cal-day-tag').html()
+            , location = $('#cal-day-location').html()
             ;
 
             if (cat !== undefined)
                 qs += '&cal_category=' + cat;
             if (tag !== undefined)
                 qs += '&cal_tag=' + tag;
+            if (location !== undefined)
+                qs += '&cal_location=' + location;
         
             $.ajax({ 
                 type: "GET",
@@ -139,7 +182,8 @@ if (window.jQuery) {
 
                     for (var i = 0; i < t.length; i++) {
                         var name = t[i].split('=')[0];
-                        if (name === 'cal_category' || name === 'cal_tag')
+                        if (name === 'cal_category' || name === 'cal_tag' ||
+                                name === 'cal_location')
                            qs += t[i] + '&'; 
                     }
 
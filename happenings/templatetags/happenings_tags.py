@@ -1,16 +1,15 @@
 from __future__ import unicode_literals
 
-import heapq
-
 from django.template import Library, TemplateSyntaxError
 from django.conf import settings
 from django.utils import timezone
 
-from happenings.utils.upcoming import UpcomingEvents
+from happenings.utils.upcoming import merge_upcoming_events
 from happenings.models import Event
-from happenings.utils.displays import month_display
+from happenings.utils.displays import month_display, cached_month_display
 from happenings.utils.common import (
     get_net_category_tag,
+    get_location,
     get_qs,
     clean_year_month,
     get_now
@@ -27,40 +26,48 @@ def show_calendar(context, req=None, mini=False, inherit_context=False):
         raise TemplateSyntaxError(r"{% show_calendar %} should be called with HttpRequest instance as first argument or it should be available as `request` variable in template context")
     now = get_now()
     net, category, tag = get_net_category_tag(req)
+    location = get_location(req)
     year = now.year
     month = now.month + net
     year, month, error = clean_year_month(year, month, None)
 
-    prefetch = {'loc': True, 'cncl': True}
+    # cancellations are looked up by the calendar (see render_month())
+    prefetch = {'loc': True, 'projection': 'popover'}
     if mini:
-        prefetch['loc'] = False  # locations aren't displayed on mini calendar
+        # locations and descriptions aren't displayed on mini calendar
+        prefetch.update(loc=False, projection='mini')
+
+    def get_events():
+        events = list(Event.objects.all_month_events(
+            year, month, category, tag, location=location, **prefetch
+        ))
+        events.sort(key=lambda x: x.l_start_date.hour)
+        return Event.objects.set_matched_filters(events, category, tag)
 
-    all_month_events = list(Event.objects.all_month_events(
-        year, month, category, tag, **prefetch
-    ))
-    all_month_events.sort(key=lambda x: x.l_start_date.hour)
     qs = req.META['QUERY_STRING']
     if qs:  # get any querystrings that are not next/prev
         qs = get_qs(qs)
-    if not inherit_context:
-        context = {}
-    return month_display(
-        year, month, all_month_events, start_day, net, qs, mini=mini, request=req, context=context,
-    )
+    if inherit_context:
+        # the page's context may change the html, so it can't be cached
+        return month_display(
+            year, month, get_events(), start_day, net, qs, mini=mini,
+            request=req, context=context,
+        )
+    return cached_month_display(
+        year, month, get_events, start_day, net, qs, category, tag,
+        mini=mini, request=req, location=location,
+    )[0]
 
 
 @register.inclusion_tag('happenings/partials/upcoming_events.html')
-def upcoming_events(now=None, finish=90, num=5):
+def upcoming_events(now=None, finish=90, num=5, location=None):
     if now is None:
         now = get_now()
     finish = now + timezone.timedelta(days=finish)
     finish = finish.replace(hour=23, minute=59, second=59, microsecond=999)
-    all_upcoming = (UpcomingEvents(x, now, finish, num).get_upcoming_events()
-                    for x in Event.objects.live(now))
-    upcoming = heapq.nsmallest(
-        num,
-        (item for sublist in all_upcoming for item in sublist),
-        key=lambda x: x[0]
+    upcoming = merge_upcoming_events(
+        Event.objects.live(now, finish, projection='grid', location=location),
+        now, finish, num
     )
     return {'upcoming_events': upcoming}
 
@@ -77,6 +84,7 @@ def current_happenings(now=None):
         microsecond=x.l_start_date.microsecond
     )
     the_haps = (
-        (drepl(x), x) for x in Event.objects.live(now) if x.is_happening(now)
+        (drepl(x), x) for x in Event.objects.live(now, projection='grid')
+        if x.is_happening(now)
     )
     return {'events_happening_now': the_haps}
@@ -0,0 +1,229 @@
+# Shared caching of rendered month calendars
+
+from __future__ import unicode_literals
+
+import hashlib
+import time
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.encoding import force_bytes
+from django.utils.translation import get_language
+
+from .routing import get_read_db, note_write
+
+GENERATION_KEY = 'happenings:generation'
+# only bumped by the changes that rendered cells & popovers don't key on
+FRAGMENT_GENERATION_KEY = 'happenings:fragment-generation'
+
+
+def get_calendar_cache():
+    """
+    Returns the cache month calendars are stored in, or None if calendar
+    caching is turned off (CALENDAR_CACHE_TIMEOUT isn't set).
+    """
+    if not getattr(settings, "CALENDAR_CACHE_TIMEOUT", 0):
+        return None
+    return caches[getattr(settings, "CALENDAR_CACHE_ALIAS", 'default')]
+
+
+def new_generation():
+    # Start from the current time rather than from 0, so that entries
+    # written before the counter was lost (e.g. evicted) can't come back.
+    return int(time.time() * 1000)
+
+
+def get_generation(cache, key=GENERATION_KEY):
+    """
+    Returns the current generation. Every cached calendar is stored under
+    a key that includes it, so bumping it invalidates them all at once.
+    """
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, new_generation(), None)
+        generation = cache.get(key)
+    return generation
+
+
+def bump_generation(key=GENERATION_KEY):
+    """Invalidates every cached calendar, on all processes and hosts."""
+    cache = get_calendar_cache()
+    if cache is None:
+        return
+    # before the bump, so that whoever sees the new generation reads the
+    # write too
+    note_write(cache)
+    try:
+        cache.incr(key)
+    except ValueError:  # the counter isn't in the cache
+        cache.set(key, new_generation(), None)
+
+
+def bump_fragment_generation():
+    """Invalidates every cached day cell and popover (see FragmentCache)."""
+    bump_generation(FRAGMENT_GENERATION_KEY)
+
+
+def get_month_key(cache, year, month, net, qs, category, tag, mini,
+                  start_day, location=None):
+    """
+    Returns the cache key of a rendered month calendar. Besides the
+    filters, the key covers everything else the html depends on: the
+    active language and timezone, and today's date (which is highlighted).
+    """
+    if not isinstance(qs, (list, tuple)):
+        qs = [qs] if qs else []
+    parts = (
+        get_generation(cache), year, month, net, '&'.join(qs), category,
+        tag, location, bool(mini), start_day, get_language(),
+        timezone.get_current_timezone_name(),
+        timezone.localtime(timezone.now()).date().isoformat(),
+    )
+    digest = hashlib.md5(force_bytes(repr(parts))).hexdigest()
+    return 'happenings:month:%s' % digest
+
+
+def get_response_cache():
+    """
+    Returns the cache whole responses are stored in, or None if response
+    caching is turned off (it needs CALENDAR_CACHE_RESPONSES as well as
+    CALENDAR_CACHE_TIMEOUT).
+    """
+    if not getattr(settings, "CALENDAR_CACHE_RESPONSES", False):
+        return None
+    return get_calendar_cache()
+
+
+def get_response_etag(cache, request, parts=()):
+    """
+    Returns the (strong) ETag of the response to 'request', made from the
+    current generation, the request's path, querystrings and kind (ajax or
+    not), the active language and timezone, and the view's 'parts' (e.g.
+    today's date). It's also the response's cache key.
+    """
+    key_parts = (
+        get_generation(cache), request.path,
+        sorted(request.GET.lists()), request.is_ajax(), get_language(),
+        timezone.get_current_timezone_name(),
+    ) + tuple(parts)
+    return '"%s"' % hashlib.md5(force_bytes(repr(key_parts))).hexdigest()
+
+
+def get_cached_month(cache, key):
+    """Returns a cached (html, {pk: mask}) tuple, or None."""
+    return cache.get(key)
+
+
+def set_cached_month(cache, key, html, count):
+    """Stores the html of a month and the masks of its MonthOccurrences."""
+    cache.set(
+        key, (html, dict(count.masks)),
+        getattr(settings, "CALENDAR_CACHE_TIMEOUT", 0)
+    )
+
+
+def get_filter_ids(model, field, value, lookup='iexact'):
+    """
+    Returns the pks of the 'model' objects whose 'field' matches 'value'
+    (case-insensitively, unless another 'lookup' is given), e.g. the
+    categories a calendar is filtered on. 'value' can also be a list, to
+    get the objects that match any of its values.
+    They're stored in the calendar cache if it's turned on (saving a
+    category, tag or location bumps the generation); otherwise a queryset
+    is returned, which the database runs as a subquery.
+    """
+    values = value if isinstance(value, (list, tuple)) else [value]
+    ids = model.objects.filter(reduce(or_, (
+        Q(**{field + '__' + lookup: v}) for v in values
+    ))).values_list('pk', flat=True)
+    cache = get_calendar_cache()
+    if cache is None:
+        return ids
+    key = 'happenings:ids:%s' % hashlib.md5(force_bytes(repr((
+        get_generation(cache), model._meta.label_lower, field, lookup,
+        tuple(v.lower() if lookup == 'iexact' else v for v in values)
+    )))).hexdigest()
+    cached = cache.get(key)
+    if cached is None:
+        cached = list(ids.using(get_read_db()))
+        cache.set(key, cached, getattr(settings, "CALENDAR_CACHE_TIMEOUT", 0))
+    return cached
+
+
+def get_fragment_cache():
+    """
+    Returns a FragmentCache for rendering a month calendar, or None if
+    calendar caching (or fragment caching, CALENDAR_CACHE_FRAGMENTS) is
+    turned off.
+    """
+    cache = get_calendar_cache()
+    if cache is None or not getattr(settings, "CALENDAR_CACHE_FRAGMENTS", True):
+        return None
+    return FragmentCache(cache)
+
+
+class FragmentCache(object):
+    """
+    Rendered pieces of a month calendar (day cells and event popovers),
+    stored in the calendar cache. Their keys are made from what they
+    depend on (e.g. a cell's date and the pks, updated_at and cancellation
+    state of its events), not from the calendar generation, so when one
+    event is edited a month is rebuilt by re-rendering only the cells and
+    popover of that event.
+    Lookups are batched: prefetch() gets many fragments with a single
+    get_many(), and save() stores the newly rendered ones with a single
+    set_many().
+    """
+    def __init__(self, cache):
+        self.cache = cache
+        # the fragments depend on these, as well as on their own parts
+        self.shared = (
+            get_generation(cache, FRAGMENT_GENERATION_KEY), get_language(),
+            timezone.get_current_timezone_name(),
+        )
+        self.fragments = {}
+        # the keys prefetch() looked up, found or not
+        self.fetched = set()
+        self.new = {}
+
+    def key(self, parts):
+        """Returns the cache key of the fragment described by 'parts'."""
+        digest = hashlib.md5(force_bytes(repr(self.shared + tuple(parts))))
+        return 'happenings:fragment:%s' % digest.hexdigest()
+
+    def prefetch(self, parts_list):
+        """Gets the fragments of each of 'parts_list' from the cache."""
+        keys = [
+            key for key in (self.key(parts) for parts in parts_list)
+            if key not in self.fetched
+        ]
+        self.fragments.update(self.cache.get_many(keys))
+        self.fetched.update(keys)
+
+    def __contains__(self, parts):
+        return self.key(parts) in self.fragments
+
+    def get(self, parts, render):
+        """
+        Returns the fragment described by 'parts', calling 'render' to
+        render it if it isn't cached. The cache is only asked if prefetch()
+        hasn't already.
+        """
+        key = self.key(parts)
+        if key not in self.fragments:
+            html = None if key in self.fetched else self.cache.get(key)
+            if html is None:
+                html = self.new[key] = render()
+            self.fragments[key] = html
+        return self.fragments[key]
+
+    def save(self):
+        """Stores the fragments that were rendered since the last save()."""
+        if self.new:
+            self.cache.set_many(
+                self.new, getattr(settings, "CALENDAR_CACHE_TIMEOUT", 0))
+            self.new = {}
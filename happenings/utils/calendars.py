@@ -9,15 +9,23 @@ import sys
 # django:
 from django.conf import settings
 from django.core.urlresolvers import reverse
+from django.template.defaultfilters import (
+    date as date_filter, time as time_filter, truncatechars
+)
 from django.template.loader import render_to_string
 from django.utils.dates import WEEKDAYS, WEEKDAYS_ABBR
-from django.utils.html import mark_safe
+from django.utils.encoding import force_text
+from django.utils.html import conditional_escape, escape, mark_safe
+from django.utils.timezone import template_localtime
+from django.utils.translation import ugettext
 
 # thirdparties:
 import six
 
 # happenings:
+from .cache import get_fragment_cache
 from .common import get_now, get_next_and_prev
+from .occurrences import MonthIndex, MonthOccurrences
 
 URL = getattr(settings, "CALENDAR_URL", 'calendar')
 URLS_NAMESPACE = getattr(settings, "CALENDAR_URLS_NAMESPACE", 'calendar')
@@ -45,13 +53,42 @@ if not CALENDAR_HOUR_FORMAT:
         CALENDAR_HOUR_FORMAT = CALENDAR_HOUR_FORMAT.strip(':')
 
 
-class GenericCalendar(HTMLCalendar):
-    def __init__(self, year, month, count, all_month_events, firstweekday=0, request=None, base_context=None, *args, **kwargs):
+class MonthIndexMixin(object):
+    """
+    Gives a calendar a MonthIndex of its count and events, which is used to
+    find the events of each day. One can be passed in (e.g. by
+    render_month(), which shares it with add_occurrences()); otherwise
+    it's built when it's first needed.
+    """
+    _index = None
+
+    @property
+    def index(self):
+        # rebuilt if count or events have been replaced since
+        if self._index is None or self._index.count is not self.count or \
+                self._index.events is not self.events:
+            self._index = MonthIndex(self.count, self.events)
+        return self._index
+
+    @index.setter
+    def index(self, index):
+        self._index = index
+
+
+class GenericCalendar(MonthIndexMixin, HTMLCalendar):
+    # a FragmentCache while formatmonth() is rendering the month
+    fragments = None
+
+    def __init__(self, year, month, count, all_month_events, firstweekday=0, request=None, base_context=None, index=None, *args, **kwargs):
         super(GenericCalendar, self).__init__(firstweekday)
+        # cells only carry the ids of their popovers, which calendar.js
+        # fetches from EventPopoverView
+        self.lazy_popovers = getattr(settings, "CALENDAR_LAZY_POPOVERS", False)
         self.yr = year
         self.mo = month
-        self.count = count  # defaultdict in {date:[(title1, pk1), (title2, pk2),]} format
+        self.count = count  # MonthOccurrences, or a {date:[(title1, pk1), (title2, pk2),]} dict
         self.events = all_month_events
+        self.index = index
         self.request = request
         self.base_context = base_context or {}
         self._context = None
@@ -75,7 +112,10 @@ class GenericCalendar(HTMLCalendar):
                 'is_current_day': False,
                 'now': now,
                 'request': self.request,
+                'lazy_popovers': self.lazy_popovers,
             })
+            if self.lazy_popovers:
+                context['popovers_url'] = self.get_popovers_url()
             self._context = context
         return dict(self._context)
 
@@ -86,6 +126,14 @@ class GenericCalendar(HTMLCalendar):
             self.title += " (CANCELLED)"
         return is_cancelled
 
+    def get_popovers_url(self):
+        """Returns the url that lazy popovers are fetched from."""
+        if URLS_NAMESPACE:
+            url_name = '%s:popovers' % (URLS_NAMESPACE)
+        else:
+            url_name = 'popovers'
+        return reverse(url_name)
+
     def get_day_url(self, day):
         if URLS_NAMESPACE:
             url_name = '%s:day_list' % (URLS_NAMESPACE)
@@ -93,8 +141,26 @@ class GenericCalendar(HTMLCalendar):
             url_name = 'day_list'
         return reverse(url_name, args=(self.yr, self.mo, day))
 
+    def get_fragment(self, parts, render):
+        """
+        Returns the html fragment described by 'parts' (a tuple of what
+        it depends on) from the fragment cache, or from calling 'render'.
+        """
+        if self.fragments is None:
+            return render()
+        return mark_safe(self.fragments.get(parts, render))
+
+    def prefetch_fragments(self):
+        """Gets the fragments the month will need from the cache."""
+        pass
+
     def formatmonth(self, theyear, themonth, withyear=True, net=None, qs=None, template='happenings/partials/calendar/month_table.html'):
         """Return a formatted month as a table."""
+        # cells rendered with the page's context can't be shared
+        if not self.base_context:
+            self.fragments = get_fragment_cache()
+        if self.fragments is not None:
+            self.prefetch_fragments()
         context = self.get_context()
         context['month_start_date'] = date(self.yr, self.mo, 1)
         context['week_rows'] = []
@@ -109,10 +175,23 @@ class GenericCalendar(HTMLCalendar):
         context['prev_qs'] = mark_safe('?cal_prev=%d%s' % (prev, extra_qs))
         context['next_qs'] = mark_safe('?cal_next=%d%s' % (nxt, extra_qs))
         context['withyear'] = withyear
+        if self.fragments is not None:
+            self.fragments.save()
         return render_to_string(template, context)
 
 
 class EventCalendar(GenericCalendar):
+    day_template = 'happenings/partials/calendar/day_cell.html'
+    noday_template = 'happenings/partials/calendar/day_noday_cell.html'
+    popover_template = 'happenings/partials/calendar/popover.html'
+    # whether each event has a popover of its own (rather than one per day)
+    event_popovers = True
+
+    def __init__(self, *args, **kwargs):
+        super(EventCalendar, self).__init__(*args, **kwargs)
+        # each calendar renders its own popovers (see get_popover_html())
+        for event in self.events:
+            event._last_popover_html = None
 
     def popover_helper(self):
         self.when = ''
@@ -120,15 +199,114 @@ class EventCalendar(GenericCalendar):
         self.desc = ''
         self.title2 = ''
 
+    def get_today(self):
+        return self.get_context()['now'].date()
+
+    def get_day_events(self, day):
+        """
+        Returns the events on 'day', after checking whether they're
+        cancelled on it (which populates event.title_extra).
+        """
+        processed_date = date(self.yr, self.mo, day)
+        events = self.index.events_on(day)
+        for event in events:
+            event.check_if_cancelled(processed_date)
+        return events
+
+    def get_cell_parts(self, day, events, day_template, popover_template):
+        """Returns what the html of a day's cell depends on."""
+        processed_date = date(self.yr, self.mo, day)
+        return (
+            'cell', type(self).__name__, day_template, popover_template,
+            self.lazy_popovers, processed_date.isoformat(),
+            processed_date == self.get_today(),
+            tuple((event.pk, six.text_type(event.updated_at),
+                   event.last_check_if_cancelled) for event in events),
+        )
+
+    def get_popover_parts(self, event, popover_template):
+        """Returns what the html of an event's popover depends on."""
+        return (
+            'popover', type(self).__name__, popover_template, event.pk,
+            six.text_type(event.updated_at),
+        )
+
+    def prefetch_fragments(self):
+        """
+        Gets the month's cells from the cache, and then the popovers of
+        the events on the days whose cells weren't cached.
+        """
+        cells = {}
+        for day in self.itermonthdays(self.yr, self.mo):
+            if day:
+                cells[day] = self.get_cell_parts(
+                    day, self.get_day_events(day), self.day_template,
+                    self.popover_template
+                )
+        self.fragments.prefetch(cells.values())
+        if self.event_popovers and not self.lazy_popovers:
+            events = {}
+            for day, parts in cells.items():
+                if parts not in self.fragments:
+                    for event in self.index.events_on(day):
+                        events[event.pk] = event
+            self.fragments.prefetch(
+                self.get_popover_parts(event, self.popover_template)
+                for event in events.values()
+            )
+
+    def render_popover(self, event, popover_template):
+        context = self.get_context()
+        context['event'] = event
+        return render_to_string(popover_template, context)
+
+    def render_day_popover(self, events, popover_template=None):
+        """
+        Returns the html of a popover that lists a day's 'events', like
+        the mini calendar's.
+        """
+        context = self.get_context()
+        context['events'] = events
+        return render_to_string(
+            popover_template or self.popover_template, context)
+
+    def get_popover_html(self, event, popover_template=None):
+        """
+        Returns the html of the event's popover, which is the same on every
+        day. It's rendered once per calendar (and kept in
+        event.popover_html), or taken from the fragment cache.
+        """
+        popover_template = popover_template or self.popover_template
+        if event._last_popover_html is None:
+            event._last_popover_html = self.get_fragment(
+                self.get_popover_parts(event, popover_template),
+                lambda: self.render_popover(event, popover_template)
+            )
+        return event._last_popover_html
+
     def formatday(
             self, day, weekday,
-            day_template='happenings/partials/calendar/day_cell.html',
-            noday_template='happenings/partials/calendar/day_noday_cell.html',
-            popover_template='happenings/partials/calendar/popover.html',
+            day_template=None, noday_template=None, popover_template=None,
             ):
-        """Return a day as a table cell."""
-        super(EventCalendar, self).formatday(day, weekday)
-        now = get_now()
+        """
+        Return a day as a table cell. Cells are taken from the fragment
+        cache when the day and its events haven't changed.
+        """
+        day_template = day_template or self.day_template
+        noday_template = noday_template or self.noday_template
+        popover_template = popover_template or self.popover_template
+        if day == 0:
+            return self.render_day(
+                day, weekday, [], noday_template, popover_template)
+        events = self.get_day_events(day)
+        return self.get_fragment(
+            self.get_cell_parts(day, events, day_template, popover_template),
+            lambda: self.render_day(
+                day, weekday, events, day_template, popover_template)
+        )
+
+    def render_day(self, day, weekday, events, template, popover_template):
+        """Renders a day's cell ('template') with its 'events'."""
         context = self.get_context()
         context['events'] = []
         context['day'] = day
@@ -137,55 +315,253 @@ class EventCalendar(GenericCalendar):
         context['weekday'] = weekday
         context['cssclass'] = self.cssclasses[weekday]
         context['popover_template'] = popover_template
-        context['num_events'] = len(self.count.get(day, [])),
-        try:
-            processed_date = date(self.yr, self.mo, day)
-        except ValueError:
-            # day is out of range for month
-            processed_date = None
+        context['num_events'] = len(events)
 
-        context['month_start_date'] = date(self.yr, self.mo, 1)
-
-        if day == 0:
-            template = noday_template
-        else:
-            template = day_template
+        if day:
+            context['date'] = date(self.yr, self.mo, day)
+            if context['date'] == self.get_today():
+                context['is_current_day'] = True
 
-        if now.date() == processed_date:
-            context['is_current_day'] = True
-
-        if processed_date and (day in self.count):
-            for item in self.count[day]:
-                self.pk = item[1]
-                self.title = item[0]
-                for event in self.events:
-                    if event.pk == self.pk:
-                        event.check_if_cancelled(processed_date)
-                        # allow to use event.last_check_if_cancelled and populate event.title.extra
-
-                        context['events'].append(event)
+        for event in events:
+            self.pk = event.pk
+            self.title = event.title
+            # check_if_cancelled() has populated event.title_extra
+            if self.event_popovers and not self.lazy_popovers:
+                self.get_popover_html(event, popover_template)
+            context['events'].append(event)
 
         return render_to_string(template, context)
 
 
 class MiniEventCalendar(EventCalendar):
+    day_template = 'happenings/partials/calendar/mini_day_cell.html'
+    popover_template = 'happenings/partials/calendar/mini_popover.html'
+    # the popover lists the day's events
+    event_popovers = False
+
     def __init__(self, *args, **kwargs):
         super(MiniEventCalendar, self).__init__(*args, **kwargs)
         # Change count from a defaultdict to a regular dict, so that when we
         # try and check if there are days in count, they won't be added if they
-        # aren't there.
-        self.count = dict(self.count)
+        # aren't there. (A MonthOccurrences never adds days.)
+        if not isinstance(self.count, MonthOccurrences):
+            self.count = dict(self.count)
+
+    def get_popovers_url(self):
+        return super(MiniEventCalendar, self).get_popovers_url() + \
+            '?cal_mini=true'
+
+
+# The markup of the templates in happenings/partials/calendar/, used by
+# FastEventCalendar and FastMiniEventCalendar. Keep them in sync.
+FAST_DAY_CELL = (
+    '<td class="{cssclass} {today}"><div class="td-inner">'
+    '<a href="{url}">{day}</a>{contents}</div></td>'
+)
+FAST_NODAY_CELL = '<td class="noday">&nbsp;</td>'
+FAST_EVENT = (
+    '<a class="event-anch" href="{url}"><div title="{title}"'
+    ' {popover} data-container="body" data-toggle="popover"'
+    ' data-html="true" class="calendar-event"'
+    ' style="background:{bg};color:{fnt};">{time} {title}</div></a>'
+)
+FAST_POPOVER_WHEN = '<p><b>{label}</b> {date}, {start} - {end}</p>'
+FAST_POPOVER_WHERE = '<p><b>{label}</b> {names}</p>'
+FAST_POPOVER_DESCRIPTION = '<p><b>{label}</b> {description}</p>'
+FAST_POPOVER_LINK = '<br><a href="{url}">{label}</a>'
+FAST_MINI_EVENTS = (
+    '<div {popover} data-container="body"'
+    ' data-toggle="popover" data-html="true" class="calendar-event">'
+    '{num_events}</div>'
+)
+# the popover's html, or (if popovers are lazy) the item to fetch it with
+FAST_POPOVER_CONTENT = 'data-content="{html}"'
+FAST_POPOVER_LAZY = 'data-popover="{item}"'
+FAST_MINI_POPOVER = '<ul>{items}</ul>'
+FAST_MINI_POPOVER_ITEM = '<li><a href="{url}">{time} {title}</a></li>'
+
+
+class FastCalendarMixin(object):
+    """
+    Renders day cells with the string templates above instead of
+    day_cell.html and the popover templates, so the template engine is
+    only entered once per month (for month_table.html). The markup is the
+    same apart from whitespace, but overridden day/popover templates are
+    ignored, which is why it's only used if CALENDAR_FAST_RENDERER is set.
+    Everything that's the same for every cell (the day url) or for every
+    occurrence of an event (its url, times, colors and popover) is only
+    worked out once per month.
+    """
+    _fast = None
+
+    def get_day_url_parts(self):
+        """
+        Returns the (prefix, suffix) of the day urls, which are
+        prefix + day + suffix, or None if they can't be split like that.
+        """
+        first, second = self.get_day_url(11), self.get_day_url(22)
+        i = 0
+        while i < min(len(first), len(second)) and first[i] == second[i]:
+            i += 1
+        prefix, suffix = first[:i], first[i + 2:]
+        if first != prefix + '11' + suffix or second != prefix + '22' + suffix:
+            return None
+        return prefix, suffix
+
+    def get_fast(self):
+        """Returns what's shared by all of the month's cells."""
+        if self._fast is None:
+            self._fast = {
+                'url_parts': self.get_day_url_parts(),
+                'events': {},
+            }
+        return self._fast
+
+    def fast_day_url(self, day):
+        parts = self.get_fast()['url_parts']
+        if parts is None:
+            return self.get_day_url(day)
+        return parts[0] + str(day) + parts[1]
+
+    def fast_time(self, event):
+        """The event's start time, the way the day cells show it."""
+        start = template_localtime(event.l_start_date)
+        return conditional_escape(time_filter(
+            start,
+            CALENDAR_TIME_FORMAT if start.minute else CALENDAR_HOUR_FORMAT
+        ))
+
+    def fast_event(self, event):
+        """
+        Returns a dict of the parts of an event's markup that are the same
+        on every day it occurs on.
+        """
+        events = self.get_fast()['events']
+        if event.pk not in events:
+            events[event.pk] = {
+                'url': conditional_escape(event.get_absolute_url()),
+                'title': conditional_escape(event.title),
+                'time': self.fast_time(event),
+            }
+        return events[event.pk]
+
+    def fast_title(self, event):
+        return self.fast_event(event)['title'] + \
+            conditional_escape(force_text(event.title_extra))
+
+    def fast_popover_item(self, events):
+        """The item lazy popovers are fetched with, see EventPopoverView."""
+        return '%s:%s' % (
+            self._fast_date.isoformat(), ','.join(str(e.pk) for e in events))
+
+    def render_day(self, day, weekday, events, template, popover_template):
+        """Formats a day's cell with its 'events'; templates are ignored."""
+        if day == 0:
+            return mark_safe(FAST_NODAY_CELL)
+        # check_if_cancelled() has populated event.title_extra
+        self._fast_date = date(self.yr, self.mo, day)
+        today = self._fast_date == self.get_today()
+        return mark_safe(FAST_DAY_CELL.format(
+            cssclass=self.cssclasses[weekday],
+            today='calendar-today' if today else '',
+            url=conditional_escape(self.fast_day_url(day)),
+            day=day,
+            contents=self.format_events(events),
+        ))
+
+
+class FastEventCalendar(FastCalendarMixin, EventCalendar):
+    """An EventCalendar that renders its cells without templates."""
+    def render_popover(self, event, popover_template):
+        """Returns the html of popover.html for 'event'."""
+        start = template_localtime(event.l_start_date)
+        end = template_localtime(event.l_end_date)
+        html = FAST_POPOVER_WHEN.format(
+            label=conditional_escape(ugettext("When:")),
+            date=conditional_escape(date_filter(start, "F j")),
+            start=conditional_escape(time_filter(start, CALENDAR_TIME_FORMAT)),
+            end=conditional_escape(time_filter(end, CALENDAR_TIME_FORMAT)),
+        )
+        locations = event.location.all()
+        if locations:
+            html += FAST_POPOVER_WHERE.format(
+                label=conditional_escape(ugettext("Where:")),
+                names=' '.join(conditional_escape(l.name) for l in locations),
+            )
+        if event.description:
+            if len(event.description) > 105:
+                description = conditional_escape(
+                    truncatechars(event.description, 100)) + '\u2026'
+            else:
+                description = conditional_escape(event.description)
+            html += FAST_POPOVER_DESCRIPTION.format(
+                label=conditional_escape(ugettext("Description:")),
+                description=description,
+            )
+        return html + FAST_POPOVER_LINK.format(
+            url=conditional_escape(event.get_absolute_url()),
+            label=conditional_escape(ugettext("View details")),
+        )
 
-    def formatday(self, day, weekday):
-        """Return a day as a table cell."""
-        return super(MiniEventCalendar, self).formatday(
-            day, weekday,
-            day_template='happenings/partials/calendar/mini_day_cell.html',
-            popover_template='happenings/partials/calendar/mini_popover.html',
+    def format_events(self, events):
+        html = []
+        for event in events:
+            parts = self.fast_event(event)
+            if 'popover' not in parts:
+                if self.lazy_popovers:
+                    parts['popover'] = ''
+                else:
+                    parts['popover'] = FAST_POPOVER_CONTENT.format(
+                        html=escape(self.get_popover_html(event)))
+                parts['bg'], parts['fnt'] = (
+                    conditional_escape(c) for c in event.colors)
+            popover = parts['popover'] or FAST_POPOVER_LAZY.format(
+                item=self.fast_popover_item([event]))
+            html.append(FAST_EVENT.format(
+                url=parts['url'],
+                title=self.fast_title(event),
+                popover=popover,
+                bg=parts['bg'],
+                fnt=parts['fnt'],
+                time=parts['time'],
+            ))
+        return ''.join(html)
+
+
+class FastMiniEventCalendar(FastCalendarMixin, MiniEventCalendar):
+    """A MiniEventCalendar that renders its cells without templates."""
+    def format_events(self, events):
+        if self.lazy_popovers:
+            popover = FAST_POPOVER_LAZY.format(
+                item=self.fast_popover_item(events))
+        else:
+            popover = FAST_POPOVER_CONTENT.format(
+                html=escape(self.render_day_popover(events)))
+        return FAST_MINI_EVENTS.format(
+            popover=popover,
+            num_events=len(events),
         )
 
+    def render_day_popover(self, events, popover_template=None):
+        items = ''.join(FAST_MINI_POPOVER_ITEM.format(
+            url=self.fast_event(event)['url'],
+            time=self.fast_event(event)['time'],
+            title=self.fast_title(event),
+        ) for event in events)
+        return mark_safe(FAST_MINI_POPOVER.format(items=items))
 
-class LegacyGenericCalendar(LocaleHTMLCalendar):
+
+def get_calendar_class(mini=False):
+    """
+    Returns the class month calendars are rendered with (the template-free
+    ones if CALENDAR_FAST_RENDERER is set).
+    """
+    if getattr(settings, "CALENDAR_FAST_RENDERER", False):
+        return FastMiniEventCalendar if mini else FastEventCalendar
+    return MiniEventCalendar if mini else EventCalendar
+
+
+class LegacyGenericCalendar(MonthIndexMixin, LocaleHTMLCalendar):
     def __init__(self, year, month, count, all_month_events, *args):
         if len(args) < 2:
             args = args + (CALENDAR_LOCALE, )
@@ -199,7 +575,7 @@ class LegacyGenericCalendar(LocaleHTMLCalendar):
             self.encoding = None
         self.yr = year
         self.mo = month
-        self.count = count  # defaultdict in {date:[(title1, pk1), (title2, pk2),]} format
+        self.count = count  # MonthOccurrences, or a {date:[(title1, pk1), (title2, pk2),]} dict
         self.events = all_month_events
 
 #    def add_occurrence(self):
@@ -329,13 +705,13 @@ class LegacyEventCalendar(LegacyGenericCalendar):
         for item in self.count[day]:
             self.pk = item[1]
             self.title = item[0]
-            for event in self.events:
-                if event.pk == self.pk:
-                    self.event = event
-                    self.check_if_cancelled()
-                    # self.add_occurrence
-                    self.popover_helper()
-                    bg, fnt = self.event.get_colors()
+            event = self.index.get(self.pk)
+            if event is not None:
+                self.event = event
+                self.check_if_cancelled()
+                # self.add_occurrence
+                self.popover_helper()
+                bg, fnt = self.event.get_colors()
             out += ('<a class="event-anch" href="' + self.event_url + '">' +
                     extras % (
                         self.title,
@@ -360,18 +736,15 @@ class LegacyMiniEventCalendar(LegacyGenericCalendar):
     def popover_helper(self):
         num_events = len(self.count[self.day])
         titles = ''
-        for item in self.count[self.day]:
-            pk = item[1]
-            for event in self.events:
-                if event.pk == pk:
-                    self.event = event
-                    t = LEGACY_CALENDAR_TIME_FORMAT if event.l_start_date.minute else LEGACY_CALENDAR_HOUR_FORMAT
-                    self.title = event.l_start_date.strftime(t).lstrip('0') + \
-                        ' - ' + event.title
-                    self.check_if_cancelled()
-                    titles += "<li><a href=\'%s\'>%s</a></li>" % (
-                        event.get_absolute_url(), self.title
-                    )
+        for event in self.index.events_on(self.day):
+            self.event = event
+            t = LEGACY_CALENDAR_TIME_FORMAT if event.l_start_date.minute else LEGACY_CALENDAR_HOUR_FORMAT
+            self.title = event.l_start_date.strftime(t).lstrip('0') + \
+                ' - ' + event.title
+            self.check_if_cancelled()
+            titles += "<li><a href=\'%s\'>%s</a></li>" % (
+                event.get_absolute_url(), self.title
+            )
         self.cal_event = '<div data-content="<ul>%s</ul>"\
             data-container="body"\
             data-toggle="popover" class="calendar-event">%s</div>' % (
@@ -0,0 +1,99 @@
+# Looks up the cancellations of many events at once
+
+from __future__ import unicode_literals
+
+from calendar import monthrange
+from datetime import date
+
+from django.conf import settings
+
+from happenings.models import Cancellation
+from .routing import get_read_db
+
+
+def hide_cancelled():
+    """
+    Returns True if cancelled occurrences should be left off calendars and
+    day lists altogether, instead of being marked as cancelled
+    (CALENDAR_HIDE_CANCELLED).
+    """
+    return getattr(settings, "CALENDAR_HIDE_CANCELLED", False)
+
+
+class CancellationIndex(object):
+    """
+    The cancellations of a set of events from 'first' to 'last' (both
+    datetime.date(), inclusive; None means no limit), as a set of
+    (event pk, date) pairs.
+
+    Once attached to events (see attach()), Event.check_if_cancelled()
+    answers from it for the dates it covers, so rendering a calendar
+    doesn't run a query per event and day.
+    """
+    def __init__(self, cancelled, first=None, last=None):
+        self.cancelled = set(cancelled)
+        self.first = first
+        self.last = last
+
+    @classmethod
+    def load(cls, events, first=None, last=None):
+        """
+        Returns the index of the cancellations of 'events' from 'first' to
+        'last', loaded with a single query.
+        """
+        pks = set(event.pk for event in events)
+        if not pks:
+            return cls((), first, last)
+        cancellations = Cancellation.objects.using(get_read_db())
+        if first is not None or last is not None:
+            # Cancellations are few, so when the range is bounded all of
+            # the ones in it are fetched (using the index on 'date')
+            # rather than passing every pk to the database.
+            if first is not None:
+                cancellations = cancellations.filter(date__gte=first)
+            if last is not None:
+                cancellations = cancellations.filter(date__lte=last)
+        else:
+            cancellations = cancellations.filter(event__in=pks)
+        return cls(
+            ((pk, d) for pk, d in cancellations.values_list('event', 'date')
+             if pk in pks),
+            first, last
+        )
+
+    @classmethod
+    def for_month(cls, events, year, month):
+        """Returns the index of the cancellations of 'events' in a month."""
+        return cls.load(
+            events, date(year, month, 1),
+            date(year, month, monthrange(year, month)[1])
+        )
+
+    @classmethod
+    def from_cancellations(cls, cancellations):
+        """Returns an index of already loaded Cancellation objects."""
+        return cls((c.event_id, c.date) for c in cancellations)
+
+    def covers(self, d):
+        """Returns True if the index knows whether events are cancelled on 'd'."""
+        return (self.first is None or self.first <= d) and \
+            (self.last is None or d <= self.last)
+
+    def is_cancelled(self, event, d):
+        return (event.pk, d) in self.cancelled
+
+    def attach(self, events):
+        """Lets 'events' look up their cancellations in the index."""
+        for event in events:
+            event.cancellation_index = self
+        return events
+
+    def drop_cancelled(self, count):
+        """
+        Removes the cancelled days from 'count' (a MonthOccurrences), so
+        that cancelled occurrences aren't displayed at all.
+        """
+        for pk, d in self.cancelled:
+            if d.year == count.year and d.month == count.month:
+                count.discard(pk, d.day)
+        return count
@@ -1,5 +1,6 @@
 from __future__ import unicode_literals
 
+import heapq
 from datetime import date, timedelta
 from calendar import monthrange
 
@@ -15,6 +16,23 @@ now = get_now()
 # compatibility
 
 
+def merge_sorted(streams):
+    """
+    Merges 'streams', iterables of tuples that are each sorted by their
+    first item, into one iterable sorted the same way. Items are taken
+    from the streams lazily, as they're asked for. Ties are broken by the
+    order of 'streams', so the rest of the tuples (e.g. events) are never
+    compared.
+    """
+    def tagged(i, stream):
+        for item in stream:
+            yield item[0], i, item
+
+    merged = heapq.merge(*[tagged(i, s) for i, s in enumerate(streams)])
+    for key, i, item in merged:
+        yield item
+
+
 def inc_month(month, year):
     """
     Increment the month and, if neccessary, the year.
@@ -27,6 +45,38 @@ def inc_month(month, year):
     return month, year
 
 
+def _total_microseconds(delta):
+    """Returns the length of a timedelta in microseconds, as an int."""
+    return (delta.days * 86400 + delta.seconds) * 10 ** 6 + delta.microseconds
+
+
+def phase_steps(anchor, target, step, strict=False):
+    """
+    Returns the number of times 'step' (a timedelta) has to be added to
+    'anchor' to reach the first value that's on or after 'target' (or
+    strictly after it, if 'strict' is True). 'anchor' and 'target' can be
+    datetime.date() or datetime.datetime(), as long as they're comparable.
+    Never returns a negative number, so an anchor that's already past the
+    target is returned as is by phase_align().
+    """
+    delta = _total_microseconds(target - anchor)
+    size = _total_microseconds(step)
+    if delta < 0:
+        return 0
+    if strict:
+        return delta // size + 1
+    return -(-delta // size)
+
+
+def phase_align(anchor, target, step, strict=False):
+    """
+    Jumps straight from 'anchor' to the first value of the series
+    anchor, anchor + step, anchor + 2 * step, ... that falls on or after
+    'target' (strictly after, if 'strict' is True). See phase_steps().
+    """
+    return anchor + step * phase_steps(anchor, target, step, strict)
+
+
 def _inc_day(year, month, day, net):
     """Increments the day by converting to a datetime.date()."""
     d = date(year, month, day)
@@ -58,8 +108,36 @@ def get_net(req):
 
 
 def get_category_tag(req):
-    """Get value of any category and/or tag querystrings"""
-    return req.GET.get('cal_category', None), req.GET.get('cal_tag', None)
+    """
+    Get value of any category and/or tag querystrings. Several values can
+    be given, by repeating the querystring or separating them with commas
+    (e.g. '?cal_category=talks,music'), in which case a list is returned.
+    A title that contains a comma can't be given.
+    """
+    return get_values(req, 'cal_category'), get_values(req, 'cal_tag')
+
+
+def get_values(req, name):
+    """Get the value(s) of a querystring that can be given more than once."""
+    values = [
+        v.strip() for value in req.GET.getlist(name)
+        for v in value.split(',') if v.strip()
+    ]
+    if not values:
+        return None
+    return values[0] if len(values) == 1 else values
+
+
+def join_values(values):
+    """Joins the values get_values() returned back into a querystring value."""
+    if isinstance(values, (list, tuple)):
+        return ','.join(values)
+    return values
+
+
+def get_location(req):
+    """Get value of any location (pk or slug) querystring"""
+    return req.GET.get('cal_location', None) or None
 
 
 def get_qs(old_qs):
@@ -70,14 +148,19 @@ def get_qs(old_qs):
 
 
 # TODO change from d to something more descriptive
-def order_events(events, d=False):
+def order_events(events, d=False, index=None):
     """
     Group events that occur on the same day, then sort them alphabetically
     by title, then sort by day. Returns a list of tuples that looks like
     [(day: [events])], where day is the day of the event(s), and [events]
     is an alphabetically sorted list of the events for the day.
+    If the month's MonthIndex is given, the days' events are taken from it.
     """
     ordered_events = {}
+    if index is not None:
+        events = ()
+        for day in index.days():
+            ordered_events[day] = list(index.events_on(day))
     for event in events:
         try:
             for occ in event.occurrence:
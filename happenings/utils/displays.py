@@ -1,13 +1,20 @@
 from __future__ import unicode_literals
 
 import locale
+from datetime import date
 
 from django.conf import settings
 
-from happenings.models import Event
-from .handlers import CountHandler
-from .calendars import EventCalendar, MiniEventCalendar
+from happenings.models import Occurrence
+from .vectorized import get_occurrence_handler
+from .cache import (
+    get_calendar_cache, get_month_key, get_cached_month, set_cached_month
+)
+from .materialize import use_materialized
+from .calendars import get_calendar_class
+from .cancellations import CancellationIndex, hide_cancelled
 from .common import get_next_and_prev
+from .occurrences import MonthIndex, MonthOccurrences
 
 try:
     CALENDAR_LOCALE = str(getattr(settings, "CALENDAR_LOCALE", ""))
@@ -22,22 +29,18 @@ except Exception:
         raise
 
 
-def add_occurrences(events, count):
+def add_occurrences(events, index):
     """
     Adds an occurrence key to the event object w/ a list of occurrences
     and adds a popover (for use with twitter bootstrap).
     The occurrence is added so that each event can be aware of what
-    day(s) it occurs in the month.
+    day(s) it occurs in the month. 'index' should be a MonthIndex (or a
+    MonthOccurrences).
     """
-    for day in count:
-        for item in count[day]:
-            for event in events:
-                if event.pk == item[1]:
-                    try:
-                        event.occurrence.append(day)
-                    except AttributeError:
-                        event.occurrence = []
-                        event.occurrence.append(day)
+    for event in events:
+        days = index.occurrence_days(event)
+        if days:
+            event.occurrence = days
 
 
 def month_display(year, month, all_month_events,
@@ -48,21 +51,55 @@ def month_display(year, month, all_month_events,
     shown on the generated calendar. Start_day is the day the calendar
     should start on (default is Monday).
     """
-    # count the number of times events happen on a given day
-    count = CountHandler(year, month, all_month_events).get_count()
+    return build_month(year, month, all_month_events, start_day, net, qs,
+                       mini, request, context)[0]
 
-    # sort count by start date using all_month_events (which is already sorted)
-    for event in all_month_events[::-1]:
-        for l in count.values():
-            for item in l:
-                if item[1] == event.pk:
-                    l.insert(0, l.pop(l.index(item)))
 
-    args = (year, month, count, all_month_events, start_day)
-    if not mini:
-        html_cal = EventCalendar(request=request, context=context, *args).formatmonth(year, month, net=net, qs=qs)
+def build_month(year, month, events, start_day, net, qs, mini=False,
+                request=None, context=None, masks=None):
+    """
+    Works out the occurrences of a month's 'events' (which are sorted by
+    start date), renders its calendar and adds the occurrences to the
+    events (see add_occurrences()). Returns an (html, count, index) tuple,
+    where count is the MonthOccurrences and index their MonthIndex.
+    If the 'masks' of a cached month are given (see set_cached_month()),
+    the occurrences are rebuilt from them instead, and the calendar isn't
+    rendered again (html is None).
+    """
+    if masks is None:
+        # Events on each day are kept in the order of 'events'
+        count = get_occurrence_handler()(year, month, events).get_month()
     else:
-        html_cal = MiniEventCalendar(request=request, context=context, *args).formatmonth(year, month, net=net, qs=qs)
+        count = MonthOccurrences(year, month)
+        for event in events:
+            count.add(event, masks.get(event.pk, 0))
+    # shared by the calendar and add_occurrences(), so neither of them
+    # searches the month's events for the ones on each day
+    index = MonthIndex(count, events)
+    html_cal = None
+    if masks is None:
+        html_cal = render_month(year, month, count, events, start_day, net,
+                                qs, mini, request, context, index)
+    add_occurrences(events, index)
+    return html_cal, count, index
+
+
+def render_month(year, month, count, all_month_events, start_day, net, qs,
+                 mini=False, request=None, context=None, index=None):
+    """
+    Returns the html calendar of a month whose occurrences are 'count'.
+    The month's cancellations are loaded with one query and shared by the
+    events; if cancelled occurrences are hidden, they're removed from
+    'count' first. 'index' is the MonthIndex of 'count' and the events,
+    if the caller has one.
+    """
+    cancellations = CancellationIndex.for_month(all_month_events, year, month)
+    cancellations.attach(all_month_events)
+    if hide_cancelled():
+        cancellations.drop_cancelled(count)
+    args = (year, month, count, all_month_events, start_day)
+    calendar = get_calendar_class(mini)
+    html_cal = calendar(request=request, context=context, index=index, *args).formatmonth(year, month, net=net, qs=qs)
 
     nxt, prev = get_next_and_prev(net)
     extra_qs = ('&' + '&'.join(qs)) if qs else ''
@@ -77,24 +114,69 @@ def month_display(year, month, all_month_events,
         '%d</th><th colspan="1" class="month-arrow-right">\
         <a href="?cal_next=%d%s">&rarr;</a></th>' % (year, nxt, extra_qs)
     )
+    return html_cal
 
-    add_occurrences(all_month_events, count)
 
-    return html_cal
+def cached_month_display(year, month, get_events, start_day, net, qs,
+                         category=None, tag=None, mini=False, request=None,
+                         need_events=False, location=None):
+    """
+    Like month_display(), but the calendar is taken from (and stored in)
+    the shared calendar cache if CALENDAR_CACHE_TIMEOUT is set.
+    'get_events' is a callable returning the month's events, sorted the
+    way month_display() expects them. It's only called on a cache miss, or
+    when 'need_events' is True. Returns an (html, index) tuple, where index
+    is the MonthIndex of the events (index.events), or None if they weren't
+    needed.
+    """
+    cache = get_calendar_cache()
+    if cache is None:
+        html_cal, count, index = build_month(
+            year, month, get_events(), start_day, net, qs, mini, request)
+        return html_cal, index
 
+    key = get_month_key(cache, year, month, net, qs, category, tag, mini,
+                        start_day, location)
+    cached = get_cached_month(cache, key)
+    if cached is None:
+        html_cal, count, index = build_month(
+            year, month, get_events(), start_day, net, qs, mini, request)
+        set_cached_month(cache, key, html_cal, count)
+        return html_cal, index
 
-def day_display(year, month, all_month_events, day):
+    html_cal, masks = cached
+    index = None
+    if need_events:
+        index = build_month(year, month, get_events(), start_day, net, qs,
+                            masks=masks)[2]
+    return html_cal, index
+
+
+def day_display(year, month, events, day):
     """
-    Returns the events that occur on the given day.
-    Works by getting all occurrences for the month, then drilling
-    down to only those occurring on the given day.
+    Returns the events that occur on the given day. 'events' are the
+    candidates, e.g. from Event.objects.all_day_events(); each one is
+    checked on its own (or looked up in the Occurrence table, if
+    occurrences are materialized), so the rest of the month isn't worked
+    out. The day's cancellations are attached to the events (see
+    CancellationIndex).
     """
-    # Get a dict with all of the events for the month
-    count = CountHandler(year, month, all_month_events).get_count()
-    pks = [x[1] for x in count[day]]  # list of pks for events on given day
+    d = date(year, month, day)
     # List enables sorting.
     # See the comments in EventMonthView in views.py for more info
-    day_events = list(Event.objects.filter(pk__in=pks).order_by(
-        'start_date').prefetch_related('cancellations'))
+    if use_materialized(d):
+        day_events = list(events.filter(
+            pk__in=Occurrence.objects.filter(date=d).values('event')))
+    else:
+        day_events = [
+            event for event in events if event.recurrence.occurs_on(d)
+        ]
+    cancellations = CancellationIndex.load(day_events, d, d)
+    cancellations.attach(day_events)
+    if hide_cancelled():
+        day_events = [
+            event for event in day_events
+            if not cancellations.is_cancelled(event, d)
+        ]
     day_events.sort(key=lambda x: x.l_start_date.hour)
     return day_events
@@ -5,6 +5,8 @@ from datetime import date, timedelta
 
 from django.utils.six.moves import xrange
 
+from .common import phase_align
+
 
 class Repeater(object):
     def __init__(self, count, year, month, day=None, end_repeat=None,
@@ -111,9 +113,10 @@ class Repeater(object):
         defaultdict (the one holding all event occurrences for this month).
         """
         mycount = defaultdict(list)
-        d = self.event.l_start_date
-        while d.year != self.year or d.month != self.month:
-            d += timedelta(days=14)
+        d = phase_align(
+            self.event.l_start_date.date(), date(self.year, self.month, 1),
+            timedelta(days=14)
+        )
         r = self.__class__(
             mycount, self.year, self.month, d.day, self.event.end_repeat,
             self.event, num=self.num, count_first=True
@@ -0,0 +1,141 @@
+# Keeps the Occurrence table in sync with events
+
+from __future__ import unicode_literals
+
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Q
+
+from happenings.models import Cancellation, Event, Occurrence
+from .common import get_now
+from .occurrences import occurrence_days
+
+
+def materialize_enabled():
+    return getattr(settings, "CALENDAR_MATERIALIZE_OCCURRENCES", False)
+
+
+def get_horizon(now=None):
+    """
+    Returns the last date (datetime.date()) that events which repeat
+    forever are materialized up to.
+    """
+    if now is None:
+        now = get_now()
+    days = getattr(settings, "CALENDAR_OCCURRENCE_HORIZON", 730)
+    return now.date() + timedelta(days=days)
+
+
+def use_materialized(last):
+    """
+    Returns True if occurrences up to 'last' (a datetime.date()) can be
+    read from the Occurrence table instead of being worked out in Python,
+    i.e. if every event has been materialized up to 'last'. This depends
+    on how far the rows were actually written, not on the horizon they
+    should reach, so if materialize_occurrences hasn't run for a while
+    (or an event was saved with materializing turned off) the later
+    occurrences are still found.
+    """
+    if not materialize_enabled():
+        return False
+    return not Event.objects._read().filter(
+        Q(materialized_until=None) | Q(materialized_until__lt=last)
+    ).exists()
+
+
+def get_last_day(event, horizon):
+    """Returns the last day 'event' should be materialized up to."""
+    if event.repeats('NEVER'):
+        return event.l_end_date.date()
+    if event.end_repeat is not None:
+        return event.end_repeat
+    return horizon
+
+
+def get_materialized_until(event, horizon):
+    """
+    Returns how far the rows of 'event' are complete once it has been
+    materialized up to 'horizon': date.max, unless it repeats forever.
+    """
+    if event.repeats('NEVER') or event.end_repeat is not None:
+        return date.max
+    return horizon
+
+
+def set_materialized_until(events, horizon):
+    """Records that 'events' have been materialized up to 'horizon'."""
+    until = {}
+    for event in events:
+        event.materialized_until = get_materialized_until(event, horizon)
+        until.setdefault(event.materialized_until, []).append(event.pk)
+    for d, pks in until.items():
+        Event.objects.filter(pk__in=pks).update(materialized_until=d)
+
+
+def _build(event, first, last):
+    cancelled = set(c.date for c in event.cancellations.all())
+    return [
+        Occurrence(event=event, date=d, cancelled=d in cancelled)
+        for d in occurrence_days(event, first, last)
+    ]
+
+
+def materialize_event(event, horizon=None):
+    """
+    Replaces the Occurrence rows of 'event' with one row for each day it
+    happens on. Returns the number of rows written.
+    """
+    if horizon is None:
+        horizon = get_horizon()
+    rows = _build(
+        event, event.l_start_date.date(), get_last_day(event, horizon)
+    )
+    with transaction.atomic():
+        Occurrence.objects.filter(event=event).delete()
+        Occurrence.objects.bulk_create(rows)
+        set_materialized_until([event], horizon)
+    return len(rows)
+
+
+def extend_events(events, horizon=None):
+    """
+    Adds the missing Occurrence rows of each event in 'events', from the
+    day after its last materialized occurrence up to 'horizon'. Events that
+    have no rows yet are materialized from scratch. Returns the number of
+    rows written.
+    """
+    if horizon is None:
+        horizon = get_horizon()
+    events = list(events)
+    last_dates = dict(
+        Occurrence.objects.filter(event__in=events).values_list(
+            'event').annotate(Max('date'))
+    )
+    rows = []
+    for event in events:
+        if event.pk not in last_dates:
+            rows.extend(_build(
+                event, event.l_start_date.date(), get_last_day(event, horizon)
+            ))
+            continue
+        first = last_dates[event.pk] + timedelta(days=1)
+        last = get_last_day(event, horizon)
+        if first <= last:
+            rows.extend(_build(event, first, last))
+    with transaction.atomic():
+        Occurrence.objects.bulk_create(rows)
+        set_materialized_until(events, horizon)
+    return len(rows)
+
+
+def sync_cancellations(event_id):
+    """Sets Occurrence.cancelled for every materialized day of an event."""
+    cancelled = list(Cancellation.objects.filter(
+        event_id=event_id).values_list('date', flat=True))
+    with transaction.atomic():
+        Occurrence.objects.filter(event_id=event_id, cancelled=True).exclude(
+            date__in=cancelled).update(cancelled=False)
+        Occurrence.objects.filter(
+            event_id=event_id, date__in=cancelled).update(cancelled=True)
@@ -0,0 +1,93 @@
+# A small in-process LRU cache, used to memoize computed occurrences
+
+from __future__ import unicode_literals
+
+from collections import namedtuple, OrderedDict
+from threading import RLock
+
+from django.conf import settings
+from django.utils import timezone
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+
+class LRUCache(object):
+    """
+    A thread-safe, size-bounded cache that throws away the least recently
+    used entry when it's full. Keys must be tuples whose first item is the
+    pk of an event, so that all the entries of an event can be evicted at
+    once. A maxsize of 0 disables the cache.
+    """
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = self.misses = 0
+        self._data = OrderedDict()
+        self._keys = {}  # {pk: set of keys}
+        self._lock = RLock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data[key] = value  # move to the end (most recently used)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        if not self.maxsize:
+            return
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            self._keys.setdefault(key[0], set()).add(key)
+            while len(self._data) > self.maxsize:
+                old, _ = self._data.popitem(last=False)
+                self._discard_key(old)
+
+    def _discard_key(self, key):
+        keys = self._keys.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys[key[0]]
+
+    def evict(self, pk):
+        """Removes every entry that belongs to the event with the given pk."""
+        with self._lock:
+            for key in self._keys.pop(pk, ()):
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._keys.clear()
+            self.hits = self.misses = 0
+
+    def info(self):
+        with self._lock:
+            return CacheInfo(
+                self.hits, self.misses, self.maxsize, len(self._data)
+            )
+
+
+occurrence_memo = LRUCache(
+    getattr(settings, "CALENDAR_OCCURRENCE_MEMO_SIZE", 10000)
+)
+
+
+def get_memo_key(event, year, month):
+    """
+    Returns the key an event's occurrences for the given month are
+    memoized under, or None if they can't be. The key changes whenever the
+    event is saved, and the timezone is part of it since occurrence days
+    are local.
+    """
+    if event.pk is None or getattr(event, 'updated_at', None) is None:
+        return None
+    return (
+        event.pk, event.updated_at, timezone.get_current_timezone_name(),
+        year, month
+    )
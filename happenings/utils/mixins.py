@@ -1,12 +1,48 @@
 from __future__ import unicode_literals
 
+import re
 from datetime import datetime
 from json import dumps, loads
 
+from django.conf import settings
 from django.core import serializers
-from django.http import HttpResponse
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
 from django.utils.encoding import force_text
 from django.utils.functional import Promise
+from django.utils.http import parse_etags
+from django.utils.text import compress_string
+
+from happenings.models import Event
+from .cache import get_response_cache, get_response_etag
+from .common import get_now
+
+re_accepts_gzip = re.compile(r'\bgzip\b')
+
+# the headers of a view's response that aren't cached along with it (they're
+# set again for each cached response)
+UNCACHED_HEADERS = ('content-encoding', 'content-length', 'etag', 'set-cookie')
+# the cached headers a 304 repeats (RFC 7232, section 4.1)
+NOT_MODIFIED_HEADERS = ('cache-control', 'content-location', 'expires', 'vary')
+
+
+def serialize_events(events, exclude=()):
+    """
+    Returns a list of 'events' serialized to dicts, leaving out the fields
+    in 'exclude'. Many-to-many fields are filled in from the related
+    objects, so prefetching them saves a query per event and field
+    (Django's serializer doesn't use prefetched objects).
+    """
+    fields = [
+        f.name for f in Event._meta.local_fields
+        if not f.primary_key and f.name not in exclude
+    ]
+    m2m = [f.name for f in Event._meta.many_to_many if f.name not in exclude]
+    data = loads(serializers.serialize("json", events, fields=fields))
+    for event, obj in zip(events, data):
+        for name in m2m:
+            obj['fields'][name] = [x.pk for x in getattr(event, name).all()]
+    return data
 
 
 class JSONResponseMixin(object):
@@ -63,11 +99,9 @@ class JSONResponseMixin(object):
         )
 
         for k, v in context['events'].items():
-            context['events'][k] = loads(serializers.serialize("json", v))
+            # remove unnec. fields to shorten the json response
+            context['events'][k] = serialize_events(v, exclude=remove_these)
             for event in context['events'][k]:
-                # remove unnec. fields to shorten the json response
-                for item in remove_these:
-                    del event['fields'][item]
                 event['weekday'] = datetime(  # add weekday e.g Fri, Mon, etc.
                     y, m, k).strftime("%A")[:3]
         return dict(
@@ -76,7 +110,7 @@ class JSONResponseMixin(object):
 
     @staticmethod
     def get_day_context_dict(context):
-        events = loads(serializers.serialize("json", context['events']))
+        events = serialize_events(context['events'])
         return dict(
             events=events,
             year=context['year'],
@@ -86,3 +120,123 @@ class JSONResponseMixin(object):
             nxt=context['next'],
             prev=context['prev'],
         )
+
+
+class CachedResponseMixin(object):
+    """
+    A view mixin that stores whole responses in the calendar cache (if
+    CALENDAR_CACHE_RESPONSES is set), along with a gzipped copy of their
+    body. Responses get a strong ETag made from the calendar generation
+    and the request (see get_response_etag()), so a request whose
+    If-None-Match has the current ETag is answered with a 304 before the
+    view touches the database. The gzipped body has an ETag of its own
+    (see get_gzip_etag()), since it's a different representation.
+    Responses that depend on who's asking (ones that used the session or
+    the CSRF token, or set cookies) are neither cached nor given an ETag.
+    The headers the view set (e.g. Content-Language or Cache-Control) are
+    cached and restored with the body.
+    """
+    def get_response_cache_parts(self):
+        """
+        Returns what the response depends on besides the request and the
+        calendar's data, e.g. today's date (which calendars highlight).
+        """
+        return (get_now().date().isoformat(),)
+
+    def dispatch(self, request, *args, **kwargs):
+        cache = get_response_cache()
+        if cache is None or request.method != 'GET':
+            return super(CachedResponseMixin, self).dispatch(
+                request, *args, **kwargs)
+        etag = get_response_etag(
+            cache, request, self.get_response_cache_parts())
+        key = 'happenings:response:%s' % etag.strip('"')
+        matched = self.get_matching_etag(request, etag)
+        if matched is not None:
+            return self.get_not_modified_response(cache.get(key), matched)
+
+        cached = cache.get(key)
+        if cached is None:
+            response = super(CachedResponseMixin, self).dispatch(
+                request, *args, **kwargs)
+            if not self.can_cache_response(request, response):
+                return response
+            cached = {
+                'content': response.content,
+                'headers': [
+                    (header, value) for header, value in response.items()
+                    if header.lower() not in UNCACHED_HEADERS
+                ],
+            }
+            compressed = compress_string(response.content)
+            if len(compressed) < len(response.content):
+                cached['gzip'] = compressed
+            cache.set(
+                key, cached, getattr(settings, "CALENDAR_CACHE_TIMEOUT", 0))
+        return self.get_cached_response(request, cached, etag)
+
+    @staticmethod
+    def get_gzip_etag(etag):
+        """Returns the ETag of the gzipped body of the response 'etag'."""
+        return etag[:-1] + '-gzip"'
+
+    def get_matching_etag(self, request, etag):
+        """
+        Returns the ETag (of the response or of its gzipped body) that the
+        request's If-None-Match matches, or None. The comparison is weak,
+        as RFC 7232 says it should be for If-None-Match.
+        """
+        header = request.META.get('HTTP_IF_NONE_MATCH')
+        if not header:
+            return None
+        tags = parse_etags(header)
+        if '*' in tags:
+            return etag
+        tags = set(tag[2:] if tag.startswith('W/') else tag for tag in tags)
+        for candidate in (etag, self.get_gzip_etag(etag)):
+            if candidate in tags:
+                return candidate
+        return None
+
+    @staticmethod
+    def get_not_modified_response(cached, etag):
+        """
+        Returns a 304 for 'etag', with the headers of the 'cached' response
+        (if it's still cached) that a 200 would have had.
+        """
+        response = HttpResponseNotModified()
+        if cached is not None:
+            for header, value in cached['headers']:
+                if header.lower() in NOT_MODIFIED_HEADERS:
+                    response[header] = value
+        response['ETag'] = etag
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
+
+    @staticmethod
+    def can_cache_response(request, response):
+        if hasattr(response, 'render') and callable(response.render):
+            response.render()
+        session = getattr(request, 'session', None)
+        return (
+            response.status_code == 200 and not response.streaming and
+            not response.cookies and
+            not (session is not None and session.accessed) and
+            not request.META.get('CSRF_COOKIE_USED')
+        )
+
+    def get_cached_response(self, request, cached, etag):
+        """Returns a response with a cached body, gzipped if possible."""
+        accepts_gzip = re_accepts_gzip.search(
+            request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if 'gzip' in cached and accepts_gzip:
+            response = HttpResponse(cached['gzip'])
+            response['Content-Encoding'] = 'gzip'
+            etag = self.get_gzip_etag(etag)
+        else:
+            response = HttpResponse(cached['content'])
+        for header, value in cached['headers']:
+            response[header] = value
+        response['ETag'] = etag
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
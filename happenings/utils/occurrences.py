@@ -0,0 +1,349 @@
+from __future__ import unicode_literals
+
+from calendar import monthrange
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+try:
+    from collections.abc import Mapping
+except ImportError:  # Python 2
+    from collections import Mapping
+
+from django.utils import timezone
+from django.utils.timezone import make_aware
+
+from .memo import get_memo_key, occurrence_memo
+
+
+def make_local(value, tz=None):
+    """
+    Returns the naive local datetime 'value' made aware in 'tz' (the
+    current timezone by default). Around DST changes, a time that happens
+    twice gets the later (standard time) offset, and a time that's skipped
+    is moved forward by the gap, where make_aware() would raise.
+    """
+    tz = tz or timezone.get_current_timezone()
+    value = make_aware(value, tz, is_dst=False)
+    if hasattr(tz, 'normalize'):  # pytz
+        value = tz.normalize(value)
+    return value
+
+
+def get_first_span(event):
+    """
+    Returns the local start and end dates (as datetime.date()) of the
+    first occurrence of 'event'. The local dates stored on the event are
+    used when the current timezone is the one they're stored in, which
+    saves converting its datetimes.
+    """
+    if getattr(event, 'local_start_date', None) is not None and \
+            timezone.get_current_timezone_name() == \
+            timezone.get_default_timezone_name():
+        return event.local_start_date, event.local_end_date
+    return event.l_start_date.date(), event.l_end_date.date()
+
+
+def get_repeat_limit(event):
+    """
+    Returns the last date on which 'event' may occur, or None if it
+    repeats forever. Non-repeating events have no limit of their own.
+    """
+    if event.repeats('NEVER'):
+        return None
+    return event.end_repeat
+
+
+def _shift_month(d, months, day):
+    """
+    Returns the date 'months' months after 'd', on 'day' (or on the last day
+    of that month if it's shorter).
+    """
+    month = d.month + months
+    year = d.year + (month - 1) // 12
+    month = (month - 1) % 12 + 1
+    return date(year, month, min(day, monthrange(year, month)[1]))
+
+
+def get_occurrence_end(event, d):
+    """
+    Returns the last day of the occurrence of 'event' that starts on 'd'.
+    Monthly and yearly events end on the same day of the month as the first
+    occurrence did, so an event on the 25th-31st ends on the 30th in April,
+    and one on Mar. 28th-Apr. 2nd ends on Mar. 2nd when it starts Feb. 28th.
+    """
+    start, end = get_first_span(event)
+    if event.repeats('MONTHLY') or event.repeats('YEARLY'):
+        months = (end.year - start.year) * 12 + end.month - start.month
+        return _shift_month(d, months, end.day)
+    return d + timedelta(days=(end - start).days)
+
+
+def iter_occurrence_starts(event, first, last):
+    """
+    Yields, in order, the dates on which an occurrence of 'event' starts,
+    for every occurrence that touches at least one day between 'first' and
+    'last' (both datetime.date(), inclusive). Dates come from the event's
+    compiled Recurrence, only as they're needed.
+    """
+    start, end = get_first_span(event)
+    lookback = (end - start).days
+    if event.repeats('MONTHLY') or event.repeats('YEARLY'):
+        # months are up to 3 days shorter than the one the event began in
+        lookback += 3
+    lo = max(first - timedelta(days=lookback), start)
+    hi = last
+    limit = get_repeat_limit(event)
+    if limit is not None and limit < hi:
+        hi = limit
+    if lo > hi:
+        return
+
+    for d in event.recurrence.dates(lo, hi):
+        yield d
+
+
+def occurrence_starts(event, first, last):
+    """Like iter_occurrence_starts(), but returns a list."""
+    return list(iter_occurrence_starts(event, first, last))
+
+
+def iter_occurrences(event, start, end):
+    """
+    Yields a (local_start, local_end) tuple of datetimes for each
+    occurrence of 'event' that is going on at some point from 'start' up
+    to (but not including) 'end', in chronological order.
+    """
+    tz = timezone.get_current_timezone()
+    start_time = event.l_start_date.time()
+    end_time = event.l_end_date.time()
+    first = timezone.localtime(start).date()
+    last = timezone.localtime(end).date()
+    for d in iter_occurrence_starts(event, first, last):
+        local_start = make_local(datetime.combine(d, start_time), tz)
+        if local_start >= end:
+            return
+        local_end = make_local(
+            datetime.combine(get_occurrence_end(event, d), end_time), tz
+        )
+        if local_start >= start or local_end > start:
+            yield local_start, local_end
+
+
+def occurrence_days(event, first, last):
+    """
+    Returns a sorted list of the dates between 'first' and 'last'
+    (inclusive) on which 'event' happens. Every day covered by a multi-day
+    ('chunk') occurrence is included, but days past the event's end_repeat
+    are not.
+    """
+    limit = get_repeat_limit(event)
+    if limit is not None and limit < last:
+        last = limit
+    days = set()
+    for d in occurrence_starts(event, first, last):
+        day = max(d, first)
+        end = min(get_occurrence_end(event, d), last)
+        while day <= end:
+            days.add(day)
+            day += timedelta(days=1)
+    return sorted(days)
+
+
+class MonthOccurrences(Mapping):
+    """
+    The occurrences of a month's events, stored as one bitmask per event:
+    bit (day - 1) of an event's mask is set if it happens on that day.
+    Events keep the order they were added in, so the events on a given day
+    come back in that same order.
+
+    It can also be used like the {day: [(title, pk)]} dict returned by
+    CountHandler.get_count(), except that days without events are missing
+    instead of being empty lists.
+    """
+    def __init__(self, year, month):
+        self.year = year
+        self.month = month
+        self.events = []
+        self.masks = {}  # {pk: mask}
+        self._by_day = None
+
+    def add(self, event, mask):
+        """Adds the days in 'mask' to the occurrences of 'event'."""
+        if not mask:
+            return
+        if event.pk not in self.masks:
+            self.events.append(event)
+            self.masks[event.pk] = 0
+        self.masks[event.pk] |= mask
+        self._by_day = None
+
+    def discard(self, pk, day):
+        """Removes 'day' from the occurrences of the event with this pk."""
+        if pk not in self.masks:
+            return
+        self.masks[pk] &= ~(1 << (day - 1))
+        if not self.masks[pk]:
+            del self.masks[pk]
+            self.events = [event for event in self.events if event.pk != pk]
+        self._by_day = None
+
+    def get_mask(self):
+        """Returns the mask of all days that have at least one event."""
+        mask = 0
+        for m in self.masks.values():
+            mask |= m
+        return mask
+
+    @staticmethod
+    def mask_to_days(mask):
+        days = []
+        day = 1
+        while mask:
+            if mask & 1:
+                days.append(day)
+            mask >>= 1
+            day += 1
+        return days
+
+    def days_with_events(self):
+        return self.mask_to_days(self.get_mask())
+
+    def occurrence_days(self, event):
+        """Returns the days of the month that 'event' happens on."""
+        return self.mask_to_days(self.masks.get(event.pk, 0))
+
+    def events_on(self, day):
+        """Returns a list of the events that happen on 'day'."""
+        if self._by_day is None:
+            by_day = {}
+            for event in self.events:
+                for d in self.mask_to_days(self.masks[event.pk]):
+                    by_day.setdefault(d, []).append(event)
+            self._by_day = by_day
+        return self._by_day.get(day, [])
+
+    def __getitem__(self, day):
+        events = self.events_on(day)
+        if not events:
+            raise KeyError(day)
+        return [(event.title, event.pk) for event in events]
+
+    def __iter__(self):
+        return iter(self.days_with_events())
+
+    def __len__(self):
+        return len(self.days_with_events())
+
+
+class MonthIndex(object):
+    """
+    Lookups of the events displayed on a month calendar, built once per
+    render and shared by the calendar, add_occurrences() and
+    order_events(), so that none of them has to scan all of the month's
+    events to find the ones in a day's list:
+    the events by pk, the events on each day (in the order of 'count') and
+    the days each event occurs on.
+    'count' can be a MonthOccurrences, or a {day: [(title, pk)]} dict.
+    """
+    def __init__(self, count, events):
+        self.count = count
+        self.events = events
+        self.by_pk = {}
+        for event in events:
+            self.by_pk.setdefault(event.pk, event)
+        self._by_day = {}
+        self._days = None
+
+    def get(self, pk):
+        """Returns the event with this pk, or None."""
+        return self.by_pk.get(pk)
+
+    def events_on(self, day):
+        """Returns a list of the events that happen on 'day', in order."""
+        if day not in self._by_day:
+            if isinstance(self.count, MonthOccurrences):
+                pks = [event.pk for event in self.count.events_on(day)]
+            else:
+                pks = [pk for title, pk in self.count.get(day, ())]
+            self._by_day[day] = [
+                self.by_pk[pk] for pk in pks if pk in self.by_pk
+            ]
+        return self._by_day[day]
+
+    def days(self):
+        """Returns the days that have events, in order."""
+        return [day for day in sorted(self.count) if self.events_on(day)]
+
+    def occurrence_days(self, event):
+        """Returns the days of the month that 'event' happens on."""
+        if isinstance(self.count, MonthOccurrences):
+            return self.count.occurrence_days(event)
+        if self._days is None:
+            days = {}
+            for day in sorted(self.count):
+                for title, pk in self.count[day]:
+                    days.setdefault(pk, []).append(day)
+            self._days = days
+        return self._days.get(event.pk, [])
+
+
+class OccurrenceHandler(object):
+    """
+    Works out which days of the given month each event occurs on.
+    get_month() returns a MonthOccurrences; get_count() returns the same
+    {day: [(title, pk)]} defaultdict as CountHandler, but occurrences are
+    calculated with calendar arithmetic instead of Repeater objects.
+    """
+    def __init__(self, year, month, events):
+        self.year = year
+        self.month = month
+        self.events = events
+        self.count = defaultdict(list)
+
+    def get_first_and_last(self):
+        """Returns the first and last days of the month as datetime.date()."""
+        return (
+            date(self.year, self.month, 1),
+            date(self.year, self.month, monthrange(self.year, self.month)[1])
+        )
+
+    def get_masks(self, events):
+        """Returns a list of the month's day masks of each of 'events'."""
+        first, last = self.get_first_and_last()
+        masks = []
+        for event in events:
+            mask = 0
+            for d in occurrence_days(event, first, last):
+                mask |= 1 << (d.day - 1)
+            masks.append(mask)
+        return masks
+
+    def get_month(self):
+        """
+        Returns a MonthOccurrences. The masks of events that haven't changed
+        since they were last worked out for this month are taken from the
+        per-process memo, and only the rest are calculated.
+        """
+        events = list(self.events)
+        keys = [get_memo_key(event, self.year, self.month) for event in events]
+        masks = [
+            None if key is None else occurrence_memo.get(key) for key in keys
+        ]
+        missing = [i for i, mask in enumerate(masks) if mask is None]
+        if missing:
+            computed = self.get_masks([events[i] for i in missing])
+            for i, mask in zip(missing, computed):
+                masks[i] = mask
+                if keys[i] is not None:
+                    occurrence_memo.set(keys[i], mask)
+
+        occurrences = MonthOccurrences(self.year, self.month)
+        for event, mask in zip(events, masks):
+            occurrences.add(event, mask)
+        return occurrences
+
+    def get_count(self):
+        occurrences = self.get_month()
+        for day in occurrences:
+            self.count[day].extend(occurrences[day])
+        return self.count
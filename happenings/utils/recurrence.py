@@ -0,0 +1,208 @@
+# Compiles the recurrence of events into dateutil rrules
+
+from __future__ import unicode_literals
+
+from datetime import datetime, time, timedelta
+
+from dateutil import rrule
+from django.utils import timezone
+
+from .common import phase_align
+from .occurrences import _shift_month, make_local
+
+WEEKDAYS = (rrule.MO, rrule.TU, rrule.WE, rrule.TH, rrule.FR)
+
+# How far before a date before() looks for the previous occurrence first.
+# Monthly events can skip 2 months in a row (on the 31st); yearly events on
+# Feb. 29th can skip up to 7 years.
+LOOKBACK = {
+    'DAILY': timedelta(days=1),
+    'WEEKDAY': timedelta(days=3),
+    'WEEKLY': timedelta(days=7),
+    'BIWEEKLY': timedelta(days=14),
+    'MONTHLY': timedelta(days=92),
+    'YEARLY': timedelta(days=366 * 8),
+}
+
+
+def get_recurrence_key(event):
+    """
+    Returns what an event's Recurrence depends on, so that a compiled
+    Recurrence can tell whether it's still up to date.
+    """
+    return (
+        event.repeat, event.start_date, event.end_date, event.end_repeat,
+        timezone.get_current_timezone_name()
+    )
+
+
+class Recurrence(object):
+    """
+    The compiled recurrence of an event. Occurrences are generated by a
+    dateutil rrule working on naive local datetimes, whose dtstart is
+    moved up to the date being asked about (keeping the rule's phase), so
+    old series aren't stepped through from the beginning.
+
+    Datetimes passed in and returned are aware, in the current timezone.
+    Occurrences are the same as the ones worked out by the occurrence
+    engine: monthly events skip months that are too short, yearly events
+    on Feb. 29th skip non-leap years, and end_repeat is inclusive.
+    """
+    def __init__(self, event):
+        self.key = get_recurrence_key(event)
+        self.repeat = event.repeat
+        self.tz = timezone.get_current_timezone()
+        self.start = timezone.make_naive(event.start_date, self.tz)
+        self.end = timezone.make_naive(event.end_date, self.tz)
+        self.until = None
+        if self.repeat != 'NEVER' and event.end_repeat is not None:
+            self.until = datetime.combine(event.end_repeat, time.max)
+
+        start = self.start
+        self.step = None
+        if self.repeat in ('DAILY', 'WEEKDAY'):
+            self.step = timedelta(days=1)
+            self.options = dict(freq=rrule.DAILY)
+            if self.repeat == 'WEEKDAY':
+                self.options['byweekday'] = WEEKDAYS
+        elif self.repeat in ('WEEKLY', 'BIWEEKLY'):
+            interval = 2 if self.repeat == 'BIWEEKLY' else 1
+            self.step = timedelta(weeks=interval)
+            self.options = dict(freq=rrule.WEEKLY, interval=interval)
+        elif self.repeat == 'MONTHLY':
+            self.options = dict(freq=rrule.MONTHLY, bymonthday=start.day)
+        elif self.repeat == 'YEARLY':
+            self.options = dict(
+                freq=rrule.YEARLY, bymonth=start.month, bymonthday=start.day
+            )
+        else:
+            self.options = None
+
+    def get_rule(self, lo):
+        """
+        Returns an rrule (or a list, for events that don't repeat) that
+        generates every occurrence starting on or after the naive 'lo'.
+        """
+        start = self.start
+        if self.options is None:
+            return [start]
+        if lo <= start:
+            dtstart = start
+        elif self.step is not None:
+            dtstart = phase_align(start, lo, self.step)
+        elif self.repeat == 'MONTHLY':
+            dtstart = datetime.combine(lo.date().replace(day=1), start.time())
+        else:
+            dtstart = datetime.combine(
+                lo.date().replace(month=1, day=1), start.time())
+        return rrule.rrule(dtstart=dtstart, until=self.until, **self.options)
+
+    def to_naive(self, dt):
+        if timezone.is_naive(dt):
+            return dt
+        return timezone.make_naive(dt, self.tz)
+
+    def to_aware(self, dt):
+        # safe for the times DST repeats or skips, see make_local()
+        return make_local(dt, self.tz)
+
+    def iter_naive(self, lo):
+        """Yields the naive start of every occurrence on or after 'lo'."""
+        for dt in self.get_rule(lo):
+            if dt >= lo:
+                yield dt
+
+    def xafter(self, dt, inc=False):
+        """
+        Yields, in order, the start of every occurrence after 'dt' (or on
+        it, if 'inc' is True).
+        """
+        dt = self.to_naive(dt)
+        for start in self.iter_naive(dt):
+            if inc or start > dt:
+                yield self.to_aware(start)
+
+    def after(self, dt, inc=False):
+        """Returns the start of the first occurrence after 'dt', or None."""
+        return next(self.xafter(dt, inc), None)
+
+    def before(self, dt, inc=False):
+        """Returns the start of the last occurrence before 'dt', or None."""
+        naive = self.to_naive(dt)
+        last = None
+        lookback = LOOKBACK.get(self.repeat)
+        for lo in ([naive - lookback] if lookback else []) + [self.start]:
+            for start in self.iter_naive(lo):
+                if start > naive or start == naive and not inc:
+                    break
+                last = start
+            if last is not None:
+                return self.to_aware(last)
+        return None
+
+    def between(self, after, before, inc=False):
+        """
+        Returns a list of the starts of the occurrences between 'after' and
+        'before' (or on either of them, if 'inc' is True).
+        """
+        after, before = self.to_naive(after), self.to_naive(before)
+        starts = []
+        for start in self.iter_naive(after):
+            if start > before or start == before and not inc:
+                break
+            if inc or start > after:
+                starts.append(self.to_aware(start))
+        return starts
+
+    def dates(self, first, last):
+        """
+        Yields the dates (datetime.date()) on which an occurrence starts,
+        from 'first' to 'last' inclusive.
+        """
+        for start in self.iter_naive(datetime.combine(first, time.min)):
+            if start.date() > last:
+                return
+            yield start.date()
+
+    def get_lookback(self):
+        """
+        Returns how long before a day an occurrence that's still going on
+        that day may have started.
+        """
+        lookback = timedelta(days=(self.end.date() - self.start.date()).days)
+        if self.repeat in ('MONTHLY', 'YEARLY'):
+            # chunks can be up to 3 days longer in long months
+            lookback += timedelta(days=3)
+        return lookback
+
+    def iter_days(self, first):
+        """
+        Yields, in order, every day (datetime.date()) from 'first' on that
+        an occurrence is going on. Days past end_repeat never are.
+        """
+        lo = datetime.combine(first - self.get_lookback(), time.min)
+        day = first
+        for start in self.iter_naive(lo):
+            last = self.to_naive(self.get_end(start)).date()
+            if self.until is not None:
+                last = min(last, self.until.date())
+            day = max(day, start.date())
+            while day <= last:
+                yield day
+                day += timedelta(days=1)
+
+    def occurs_on(self, day):
+        """Returns True if an occurrence is going on at some point on 'day'."""
+        return next(self.iter_days(day), None) == day
+
+    def get_end(self, start):
+        """Returns the end of the occurrence that begins at 'start'."""
+        naive = self.to_naive(start)
+        first, end = self.start, self.end
+        if self.repeat in ('MONTHLY', 'YEARLY'):
+            months = (end.year - first.year) * 12 + end.month - first.month
+            day = _shift_month(naive.date(), months, end.day)
+        else:
+            # from the date rather than the time, which DST may have moved
+            day = naive.date() + timedelta(days=(end.date() - first.date()).days)
+        return self.to_aware(datetime.combine(day, end.time()))
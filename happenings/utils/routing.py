@@ -0,0 +1,60 @@
+# Sends the calendar's reads to another database, e.g. a read replica
+
+from __future__ import unicode_literals
+
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+# {alias: time until which the database isn't tried again}
+_unavailable = {}
+# set in the calendar cache for CALENDAR_READ_DB_LAG seconds by every write
+# to the calendar (see note_write())
+RECENT_WRITE_KEY = 'happenings:recent-write'
+
+
+def note_write(cache):
+    """
+    Sends the calendar's reads to the default database for the next
+    CALENDAR_READ_DB_LAG seconds (default 10), on all processes that share
+    'cache'. Called before a write invalidates the cached calendars, so
+    that nothing rendered from a read database that hasn't caught up with
+    the write yet gets cached under the new generation.
+    """
+    lag = getattr(settings, "CALENDAR_READ_DB_LAG", 10)
+    if lag and getattr(settings, "CALENDAR_READ_DB", None):
+        cache.set(RECENT_WRITE_KEY, True, lag)
+
+
+def wrote_recently():
+    from .cache import get_calendar_cache
+    cache = get_calendar_cache()
+    return cache is not None and cache.get(RECENT_WRITE_KEY) is not None
+
+
+def get_read_db():
+    """
+    Returns the alias of the database the calendar reads from: the one
+    named by CALENDAR_READ_DB, or the default database if it isn't set.
+    Writes always go to the default database.
+
+    If the read database can't be connected to, reads go to the default
+    database instead, and it isn't tried again for CALENDAR_READ_DB_RETRY
+    seconds (default 30). Reads also go to the default database for a
+    while after a write (see note_write()).
+    """
+    alias = getattr(settings, "CALENDAR_READ_DB", None)
+    if not alias or alias not in connections.databases:
+        return DEFAULT_DB_ALIAS
+    if _unavailable.get(alias, 0) > time.time():
+        return DEFAULT_DB_ALIAS
+    if wrote_recently():
+        return DEFAULT_DB_ALIAS
+    try:
+        connections[alias].ensure_connection()
+    except DatabaseError:
+        _unavailable[alias] = time.time() + getattr(
+            settings, "CALENDAR_READ_DB_RETRY", 30)
+        return DEFAULT_DB_ALIAS
+    return alias
@@ -0,0 +1,152 @@
+# NumPy-backed batch expansion of a month's occurrences
+
+from __future__ import unicode_literals
+
+from calendar import monthrange
+from datetime import date, timedelta
+
+from django.conf import settings
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .occurrences import OccurrenceHandler, get_first_span
+
+REPEAT_CODES = {
+    'NEVER': 0, 'DAILY': 1, 'WEEKDAY': 2, 'WEEKLY': 3, 'BIWEEKLY': 4,
+    'MONTHLY': 5, 'YEARLY': 6,
+}
+
+# How many days before the 1st of the month an occurrence that still
+# touches the month may start: chunks last at most 7 days, and monthly or
+# yearly ones can gain up to 3 more in a longer month.
+LOOKBACK = 10
+
+# Stands in for the end_repeat of events that repeat forever
+FOREVER = date.max.toordinal()
+
+
+def get_occurrence_handler():
+    """
+    Returns the occurrence handler class selected by the
+    CALENDAR_OCCURRENCE_BACKEND setting ('python' or 'numpy'). Falls back
+    to the pure-Python OccurrenceHandler when NumPy isn't installed.
+    """
+    backend = getattr(settings, "CALENDAR_OCCURRENCE_BACKEND", 'python')
+    if backend == 'numpy' and np is not None:
+        return NumpyOccurrenceHandler
+    return OccurrenceHandler
+
+
+class NumpyOccurrenceHandler(OccurrenceHandler):
+    """
+    Works out the month's occurrences of all events at once: an
+    (events x days) matrix is computed with array operations, so the cost
+    grows with the width of the arrays instead of with the number of
+    Python objects created per event.
+    """
+    def load_events(self, events):
+        """Returns the per-event arrays that the expansion works from."""
+        columns = dict((name, []) for name in (
+            'start', 'diff', 'repeat', 'limit', 'start_day', 'start_month',
+            'end_day', 'months'))
+        for event in events:
+            start, end = get_first_span(event)
+            repeat = REPEAT_CODES[event.repeat]
+            limit = FOREVER
+            if repeat and event.end_repeat is not None:
+                limit = event.end_repeat.toordinal()
+            columns['start'].append(start.toordinal())
+            columns['diff'].append((end - start).days)
+            columns['repeat'].append(repeat)
+            columns['limit'].append(limit)
+            columns['start_day'].append(start.day)
+            columns['start_month'].append(start.month)
+            columns['end_day'].append(end.day)
+            columns['months'].append(
+                (end.year - start.year) * 12 + end.month - start.month)
+        return dict(
+            (name, np.array(values, dtype=np.int64).reshape(-1, 1))
+            for name, values in columns.items()
+        )
+
+    def get_candidates(self, first, last):
+        """
+        Returns arrays describing every date an occurrence that touches
+        the month could start on.
+        """
+        dates = [
+            first + timedelta(days=i)
+            for i in range(-LOOKBACK, (last - first).days + 1)
+        ]
+        month_index = [d.year * 12 + d.month - 1 for d in dates]
+        # first day & length of each month an occurrence could end in
+        lo = month_index[0]
+        months = range(lo, month_index[-1] + 2)
+        month_first = [date(m // 12, m % 12 + 1, 1).toordinal() for m in months]
+        month_len = [monthrange(m // 12, m % 12 + 1)[1] for m in months]
+        return dict(
+            ordinal=np.array([d.toordinal() for d in dates], dtype=np.int64),
+            weekday=np.array([d.weekday() for d in dates], dtype=np.int64),
+            day=np.array([d.day for d in dates], dtype=np.int64),
+            month=np.array([d.month for d in dates], dtype=np.int64),
+            month_index=np.array(month_index, dtype=np.int64) - lo,
+            month_first=np.array(month_first, dtype=np.int64),
+            month_len=np.array(month_len, dtype=np.int64),
+        )
+
+    def get_starts(self, ev, c):
+        """
+        Returns an (events x candidates) boolean matrix that is True where
+        an occurrence of the event starts on the candidate date.
+        """
+        repeat = ev['repeat']
+        offset = c['ordinal'] - ev['start']
+        same_day = c['day'] == ev['start_day']
+        starts = (
+            ((repeat == 0) & (offset == 0)) |
+            (repeat == 1) |
+            ((repeat == 2) & (c['weekday'] < 5)) |
+            ((repeat == 3) & (offset % 7 == 0)) |
+            ((repeat == 4) & (offset % 14 == 0)) |
+            ((repeat == 5) & same_day) |
+            ((repeat == 6) & same_day & (c['month'] == ev['start_month']))
+        )
+        return starts & (offset >= 0) & (c['ordinal'] <= ev['limit'])
+
+    def get_ends(self, ev, c):
+        """
+        Returns an (events x candidates) matrix of the ordinal of the last
+        day of the occurrence that would start on each candidate date.
+        """
+        ends = c['ordinal'] + ev['diff']
+        # monthly & yearly events end on the same day of the month as the
+        # first occurrence did (or on the last day of a shorter month)
+        target = c['month_index'] + ev['months']
+        month_end = c['month_first'][target] + np.minimum(
+            ev['end_day'], c['month_len'][target]) - 1
+        by_month = (ev['repeat'] == 5) | (ev['repeat'] == 6)
+        return np.where(by_month, month_end, ends)
+
+    def get_masks(self, events):
+        if not events:
+            return []
+        first, last = self.get_first_and_last()
+        ev = self.load_events(events)
+        c = self.get_candidates(first, last)
+        starts = self.get_starts(ev, c)
+        ends = self.get_ends(ev, c)
+
+        num_days = last.day
+        days = c['ordinal'][LOOKBACK:]
+        covered = np.zeros((len(events), num_days), dtype=bool)
+        for back in range(LOOKBACK + 1):
+            # occurrences starting 'back' days before each day of the month
+            cols = slice(LOOKBACK - back, LOOKBACK - back + num_days)
+            covered |= starts[:, cols] & (ends[:, cols] >= days)
+        covered &= days <= ev['limit']
+
+        bits = np.left_shift(1, np.arange(num_days, dtype=np.int64))
+        return [int(mask) for mask in covered.astype(np.int64).dot(bits)]
@@ -2,11 +2,14 @@
 from __future__ import unicode_literals
 
 # python lib:
-from datetime import date, timedelta
+from datetime import date, datetime, time, timedelta
+from itertools import islice
+from json import dumps
 
 # django:
-from django.views.generic import ListView, DetailView
+from django.views.generic import ListView, DetailView, View
 from django.conf import settings
+from django.http import HttpResponse
 from django.shortcuts import get_object_or_404
 from django.utils.dates import MONTHS_ALT
 
@@ -15,16 +18,20 @@ import six
 
 # happenings:
 from .models import Event
-from happenings.utils.displays import month_display, day_display
+from happenings.utils.cache import get_fragment_cache
+from happenings.utils.calendars import get_calendar_class
+from happenings.utils.displays import cached_month_display, day_display
+from happenings.utils.cancellations import CancellationIndex
+from happenings.utils.routing import get_read_db
 from happenings.utils.next_event import get_next_event
-from happenings.utils.mixins import JSONResponseMixin
+from happenings.utils.mixins import CachedResponseMixin, JSONResponseMixin
 from happenings.utils import common as c
 
 
 CALENDAR_LOCALE = getattr(settings, 'CALENDAR_LOCALE', 'en_US.utf8')
 
 
-class GenericEventView(JSONResponseMixin, ListView):
+class GenericEventView(CachedResponseMixin, JSONResponseMixin, ListView):
     model = Event
 
     def render_to_response(self, context, **kwargs):
@@ -40,11 +47,14 @@ class GenericEventView(JSONResponseMixin, ListView):
         self.net, self.category, self.tag = c.get_net_category_tag(
             self.request
         )
+        self.location = c.get_location(self.request)
 
         if self.category is not None:
-            context['cal_category'] = self.category
+            context['cal_category'] = c.join_values(self.category)
         if self.tag is not None:
-            context['cal_tag'] = self.tag
+            context['cal_tag'] = c.join_values(self.tag)
+        if self.location is not None:
+            context['cal_location'] = self.location
         return context
 
 
@@ -113,28 +123,44 @@ class EventMonthView(GenericEventView):
         if error:  # send any year/month errors
             context['cal_error'] = error
 
-        # List enables sorting. As far as I can tell, .order_by() can't be used
-        # here because we need it ordered by l_start_date.hour (simply ordering
-        # by start_date won't work). The only alternative I've found is to use
-        # extra(), but this would likely require different statements for
-        # different databases...
-        all_month_events = list(self.get_month_events(
-            year, month, self.category, self.tag, loc=True, cncl=True
-        ))
-
-        all_month_events.sort(key=lambda x: x.l_start_date.hour)
-
+        show_events = getattr(settings, "CALENDAR_SHOW_LIST", False)
+        if show_events and self.request.is_ajax():
+            projection = 'full'  # the listed events are serialized
+        elif not mini:
+            projection = 'popover'
+        elif show_events:
+            projection = 'grid'  # the list shows the events' colors
+        else:
+            projection = 'mini'
+
+        def get_events():
+            # List enables sorting. As far as I can tell, .order_by() can't
+            # be used here because we need it ordered by l_start_date.hour
+            # (simply ordering by start_date won't work). The only
+            # alternative I've found is to use extra(), but this would
+            # likely require different statements for different databases...
+            events = list(self.get_month_events(
+                year, month, self.category, self.tag, loc=True,
+                projection=projection, location=self.location,
+            ))
+            events.sort(key=lambda x: x.l_start_date.hour)
+            return Event.objects.set_matched_filters(
+                events, self.category, self.tag)
+
+        # The events are only fetched if the calendar isn't cached, or if
+        # they're listed below it.
         start_day = getattr(settings, "CALENDAR_START_DAY", 0)
-        context['calendar'] = month_display(
-            year, month, all_month_events, start_day, self.net, qs, mini,
-            request=self.request,
+        context['calendar'], index = cached_month_display(
+            year, month, get_events, start_day, self.net, qs,
+            self.category, self.tag, mini, request=self.request,
+            need_events=show_events, location=self.location,
         )
 
         context['show_events'] = False
-        if getattr(settings, "CALENDAR_SHOW_LIST", False):
+        if show_events:
             context['show_events'] = True
-            context['events'] = c.order_events(all_month_events, d=True) \
-                if self.request.is_ajax() else c.order_events(all_month_events)
+            context['events'] = c.order_events(
+                index.events, d=self.request.is_ajax(), index=index)
 
         return context
 
@@ -145,12 +171,11 @@ class EventDayView(GenericEventView):
     def check_for_cancelled_events(self, d):
         """Check if any events are cancelled on the given date 'd'."""
         for event in self.events:
-            for cn in event.cancellations.all():
-                if cn.date == d:
-                    event.title += ' (CANCELLED)'
+            if event.check_if_cancelled(d):
+                event.title += ' (CANCELLED)'
 
-    def get_month_events(self, *args, **kwargs):
-        return Event.objects.all_month_events(*args, **kwargs)
+    def get_day_events(self, *args, **kwargs):
+        return Event.objects.all_day_events(*args, **kwargs)
 
     def get_context_data(self, **kwargs):
         context = super(EventDayView, self).get_context_data(**kwargs)
@@ -162,14 +187,23 @@ class EventDayView(GenericEventView):
         if error:
             context['cal_error'] = error
 
-        # Note that we don't prefetch 'cancellations' because they will be
-        # prefetched later (in day_display in displays.py)
-        all_month_events = self.get_month_events(
-            year, month, self.category, self.tag
+        # Note that we don't prefetch 'cancellations' because day_display()
+        # (in displays.py) loads the ones on the given day.
+        # The day list only shows titles, but ajax responses serialize the
+        # events.
+        day_events = self.get_day_events(
+            date(year, month, day), self.category, self.tag,
+            projection='full' if self.request.is_ajax() else 'mini',
+            location=self.location,
         )
+        if self.request.is_ajax():
+            # serialized along with the events
+            day_events = day_events.prefetch_related(
+                'location', 'categories', 'tags')
 
-        self.events = day_display(
-            year, month, all_month_events, day
+        self.events = Event.objects.set_matched_filters(
+            day_display(year, month, day_events, day),
+            self.category, self.tag
         )
 
         self.check_for_cancelled_events(d=date(year, month, day))
@@ -192,17 +226,23 @@ class EventDayView(GenericEventView):
         return context
 
 
-class EventDetailView(DetailView):
+class EventDetailView(CachedResponseMixin, DetailView):
     model = Event
     context_object_name = 'event'
 
+    def get_response_cache_parts(self):
+        # the next occurrence depends on the time of day
+        return (c.get_now().strftime('%Y-%m-%d %H:%M'),)
+
     def get_object(self):
-        return get_object_or_404(
-            Event.objects.prefetch_related(
-                'location', 'categories', 'tags', 'cancellations'
-            ),
-            pk=self.kwargs['pk']
+        events = Event.objects.prefetch_related(
+            'location', 'categories', 'tags', 'cancellations'
         )
+        try:
+            return events.using(get_read_db()).get(pk=self.kwargs['pk'])
+        except Event.DoesNotExist:
+            # a new event may not have reached the read database yet
+            return get_object_or_404(events, pk=self.kwargs['pk'])
 
     def get_cncl_days(self):
         now = c.get_now()
@@ -210,8 +250,10 @@ class EventDetailView(DetailView):
         return [(x.date, x.reason) for x in cncl if x.date >= now.date()]
 
     def check_cncl(self, d):
-        cncl = self.object.cancellations.all()
-        return True if [x for x in cncl if x.date == d] else False
+        if self.object.cancellation_index is None:
+            CancellationIndex.from_cancellations(
+                self.object.cancellations.all()).attach([self.object])
+        return self.object.check_if_cancelled(d)
 
     def get_context_data(self, **kwargs):
         now = c.get_now()
@@ -226,19 +268,19 @@ class EventDetailView(DetailView):
 
         event = [e]  # event needs to be an iterable, see get_next_event()
         if not e.repeats('NEVER'):  # event is ongoing; get next occurrence
-            if e.will_occur(now):
-                year, month, day = get_next_event(event, now)
-                next_event = date(year, month, day)
-                context['next_event'] = date(year, month, day)
+            next_day = get_next_event(event, now) if e.will_occur(now) \
+                else None
+            if next_day is not None:
+                next_event = date(*next_day)
+                context['next_event'] = next_event
                 context['next_or_prev_cncl'] = self.check_cncl(next_event)
             else:  # event is finished repeating; get last occurrence
-                end = e.end_repeat
-                last_event = end
-                if e.repeats('WEEKDAY'):
-                    year, month, day = c.check_weekday(
-                        end.year, end.month, end.day, reverse=True
-                    )
-                    last_event = date(year, month, day)
+                last_event = e.end_repeat
+                last = e.recurrence.before(
+                    datetime.combine(e.end_repeat, time.max), inc=True
+                )
+                if last is not None:
+                    last_event = last.date()
                 context['last_event'] = last_event
                 context['next_or_prev_cncl'] = self.check_cncl(last_event)
         else:
@@ -253,3 +295,94 @@ class EventDetailView(DetailView):
                 # cancelled
                 context['this_cncl'] = self.check_cncl(e.l_start_date.date())
         return context
+
+
+class EventPopoverView(CachedResponseMixin, View):
+    """
+    Returns the popovers of a calendar whose cells only carry the ids of
+    their events (see CALENDAR_LAZY_POPOVERS), as a JSON object mapping
+    each item that was asked for to its html. Each item ('p' querystring,
+    which can be repeated) is a date and one or more event pks, e.g.
+    '2014-05-02:3' for the popover of event 3 on May 2nd, or (with
+    cal_mini=true) '2014-05-02:3,4' for a mini calendar's popover listing
+    events 3 and 4.
+    Only the items in the same month as the first one are answered, and
+    at most 'max_pks' events are looked up in all, so a request can't ask
+    for more than a calendar shows.
+    """
+    max_items = 100
+    max_pks = 100
+
+    @staticmethod
+    def parse_pks(pks):
+        """Yields the valid pks of a comma-separated list."""
+        for pk in pks.split(','):
+            try:
+                yield int(pk)
+            except ValueError:
+                continue
+
+    def get_items(self):
+        """
+        Returns a list of the valid (item, date, pks) asked for, and the
+        (year, month) they're in.
+        """
+        items = []
+        month = None
+        num_pks = 0
+        for item in self.request.GET.getlist('p')[:self.max_items]:
+            d, _, pks = item.partition(':')
+            try:
+                d = datetime.strptime(d, '%Y-%m-%d').date()
+            except ValueError:
+                continue
+            if month is None:
+                month = (d.year, d.month)
+            elif (d.year, d.month) != month:
+                continue
+            pks = list(islice(self.parse_pks(pks), self.max_pks - num_pks))
+            if pks:
+                items.append((item, d, pks))
+                num_pks += len(pks)
+                if num_pks >= self.max_pks:
+                    break
+        return items, month
+
+    def get(self, request, *args, **kwargs):
+        mini = request.GET.get('cal_mini') == 'true'
+        items, month = self.get_items()
+        popovers = {}
+        if items:
+            events = Event.objects._read().filter(
+                pk__in=set(pk for item, d, pks in items for pk in pks)
+            ).only(*Event.objects.PROJECTIONS['mini' if mini else 'popover'])
+            if not mini:
+                events = events.prefetch_related('location')
+            events = dict((event.pk, event) for event in events)
+            CancellationIndex.for_month(
+                events.values(), *month).attach(events.values())
+            calendar = get_calendar_class(mini)(
+                month[0], month[1], {}, list(events.values()), request=request
+            )
+            calendar.fragments = get_fragment_cache()
+            if calendar.fragments is not None and not mini:
+                calendar.fragments.prefetch(
+                    calendar.get_popover_parts(event, calendar.popover_template)
+                    for event in events.values()
+                )
+            for item, d, pks in items:
+                day_events = [events[pk] for pk in pks if pk in events]
+                if not day_events:
+                    continue
+                for event in day_events:
+                    # populates event.title_extra
+                    event.check_if_cancelled(d)
+                if mini:
+                    popovers[item] = calendar.render_day_popover(day_events)
+                else:
+                    # an event's popover is the same on every day
+                    popovers[item] = calendar.get_popover_html(day_events[0])
+            if calendar.fragments is not None:
+                calendar.fragments.save()
+        return HttpResponse(
+            dumps({'popovers': popovers}), content_type='application/json')
@@ -33,8 +33,12 @@ setup(
         'Topic :: Software Development :: Libraries :: Python Modules'
     ],
     install_requires=[
-        'django >= 1.6',
+        'django >= 1.11',
         'pytz',
+        'python-dateutil',
         'six >= 1.9, <  2.0',
     ],
+    extras_require={
+        'numpy': ['numpy'],
+    },
 )
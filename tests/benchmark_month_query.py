@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+"""
+Shows how SQLite runs the query behind EventManager.all_month_events(),
+and how long it takes, on a table with many events.
+
+Usage (from the tests directory):
+
+    $ python benchmark_month_query.py [number of events]
+
+Every branch of the query plan should be a SEARCH using an index; a
+'SCAN happenings_event' line means the whole table is read.
+"""
+from __future__ import print_function, unicode_literals
+
+import os
+import random
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+if __name__ == "__main__":
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "settings")
+
+    import django
+    django.setup()
+
+    from django.contrib.auth.models import User
+    from django.db import connection
+    from django.test.runner import DiscoverRunner
+    from django.utils import timezone
+
+    num = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    runner = DiscoverRunner(verbosity=0)
+    old_config = runner.setup_databases()
+    try:
+        from happenings.models import Event
+
+        user = User.objects.create_user('bench', 'bench@example.com', 'x')
+        tz = timezone.get_default_timezone()
+        repeats = [r for r, _ in Event.REPEAT_CHOICES]
+        random.seed(0)
+        events = []
+        for i in range(num):
+            start = timezone.make_aware(
+                datetime(2000, 1, 1, 9) +
+                timedelta(days=random.randint(0, 365 * 20)), tz
+            )
+            repeat = random.choice(repeats)
+            end_repeat = None
+            if repeat != 'NEVER' and random.random() < .8:
+                end_repeat = (
+                    start + timedelta(days=random.randint(0, 365))).date()
+            event = Event(
+                start_date=start, end_date=start + timedelta(hours=1),
+                repeat=repeat, end_repeat=end_repeat, created_by=user,
+                title='event %d' % i, description='benchmark',
+            )
+            event.set_local_dates()  # bulk_create() doesn't call save()
+            events.append(event)
+        Event.objects.bulk_create(events, batch_size=40)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        qs = Event.objects.all_month_events(2015, 6)
+        sql, params = qs.query.sql_with_params()
+        print("Query plan (%d events):" % num)
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            for row in cursor.fetchall():
+                print('   ', row[-1])
+
+        runs = 20
+        seconds = timeit.timeit(
+            lambda: list(Event.objects.all_month_events(2015, 6)),
+            number=runs
+        )
+        print("%d matching events, %.2f ms per query" % (
+            qs.count(), seconds / runs * 1000))
+    finally:
+        runner.teardown_databases(old_config)
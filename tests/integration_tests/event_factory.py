@@ -28,6 +28,7 @@ class SetMeUp(TestCase):
     @classmethod
     def tearDownClass(cls):
         cls.user.delete()
+        super(SetMeUp, cls).tearDownClass()
 
     def clean_whitespace(self, response):
         """Remove all newlines and all occurances of multiple spaces."""
@@ -101,3 +102,17 @@ def create_event(created_by, title, description, all_day=False,
         event.full_clean()
         event.save()
     return event
+
+
+def create_recurring_event(created_by, start_date, end_date, repeat='NEVER',
+                           end_repeat=None, **kwargs):
+    """
+    Shorthand for create_event() when only the event's dates matter, e.g.
+    to test when it occurs. The other keyword arguments are passed on.
+    """
+    kwargs.setdefault('title', "event")
+    kwargs.setdefault('description', "Testing 1 2 3")
+    return create_event(
+        created_by, start_date=start_date, end_date=end_date, repeat=repeat,
+        end_repeat=end_repeat, **kwargs
+    )
@@ -2,6 +2,7 @@ from __future__ import unicode_literals
 
 from django.core.urlresolvers import reverse
 from django.test import TestCase
+from django.test.utils import override_settings
 from django.contrib.auth.models import User
 
 from .event_factory import create_event
@@ -61,6 +62,30 @@ class EventListViewCategoryTest(TestCase):
         self.assertNotContains(response, self.event3.title)
         self.assertContains(response, HTML)
 
+    def test_list_view_event_with_several_categories(self):
+        response = self.client.get(
+            reverse('calendar:list'), {'cal_category': 'foo,bar'}
+        )
+        self.assertContains(response, self.event.title)
+        self.assertContains(response, self.event2.title)
+        self.assertNotContains(response, self.event3.title)
+        self.assertContains(response, "cal_next=1&cal_category=foo%2Cbar")
+
+    @override_settings(CALENDAR_SHOW_LIST=True)
+    def test_listed_events_carry_the_categories_they_matched(self):
+        response = self.client.get(
+            reverse('calendar:list'), {'cal_category': 'foo,bar'}
+        )
+        matched = dict(
+            (event.title, event.matched_filters)
+            for day, events in response.context_data['events']
+            for event in events
+        )
+        self.assertEqual(matched, {
+            "Smith": [('category', 'foo')],
+            "Alison": [('category', 'bar')],
+        })
+
 #    def test_day_list_view_event_with_category(self):
 #        response = self.client.get(
 #            reverse('calendar:list'), {'cal_category': 'foo'}
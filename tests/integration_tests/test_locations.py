@@ -0,0 +1,118 @@
+from __future__ import unicode_literals
+
+from django.core.cache import caches
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+from django.test.client import RequestFactory
+from django.test.utils import override_settings
+from django.contrib.auth.models import User
+from django.utils import timezone
+
+from happenings.models import Location
+from happenings.templatetags.happenings_tags import (
+    show_calendar, upcoming_events
+)
+from .event_factory import create_event
+
+
+class EventListViewLocationTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            'foo', 'bar@example.com', 'secret'
+        )
+        self.hall = Location.objects.create(name="Town Hall", slug="hall")
+        self.park = Location.objects.create(name="Park", slug="park")
+        self.event = create_event(
+            created_by=self.user,
+            title="Smith",
+            description="Just an event.",
+        )
+        self.event.location.add(self.hall)
+        self.event2 = create_event(
+            created_by=self.user,
+            title="Alison",
+            description="Just an event.",
+            repeat="WEEKLY"
+        )
+        self.event2.location.add(self.park)
+        self.event3 = create_event(
+            created_by=self.user,
+            title="Tempz",
+            description="Another one"
+        )
+
+    def test_list_view_event_with_location_slug(self):
+        response = self.client.get(
+            reverse('calendar:list'), {'cal_location': 'hall'}
+        )
+        self.assertContains(response, self.event.title)
+        self.assertNotContains(response, self.event2.title)
+        self.assertNotContains(response, self.event3.title)
+
+    def test_list_view_event_with_location_pk(self):
+        response = self.client.get(
+            reverse('calendar:list'), {'cal_location': self.park.pk}
+        )
+        self.assertContains(response, self.event2.title)
+        self.assertNotContains(response, self.event.title)
+        self.assertNotContains(response, self.event3.title)
+
+    def test_list_view_with_unknown_location(self):
+        response = self.client.get(
+            reverse('calendar:list'), {'cal_location': 'nowhere'}
+        )
+        self.assertNotContains(response, self.event.title)
+        self.assertNotContains(response, self.event2.title)
+
+    def test_unicode_digits_are_a_slug(self):
+        """'²' isn't a pk, even though it's a digit."""
+        response = self.client.get(
+            reverse('calendar:list'), {'cal_location': '\u00b2'}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, self.event.title)
+        req = RequestFactory().get(
+            reverse('calendar:list'), {'cal_location': '\u00b2'})
+        self.assertNotIn(self.event.title, show_calendar({}, req))
+        self.assertEqual(
+            upcoming_events(location='\u00b2')['upcoming_events'], [])
+
+    def test_day_view_with_location(self):
+        now = timezone.localtime(self.event.start_date)
+        response = self.client.get(
+            reverse('calendar:day_list', args=(now.year, now.month, now.day)),
+            {'cal_location': 'park'}
+        )
+        self.assertContains(response, self.event2.title)
+        self.assertContains(response, 'id="cal-day-location"')
+        self.assertNotContains(response, self.event.title)
+
+    def test_show_calendar_with_location(self):
+        req = RequestFactory().get(
+            reverse('calendar:list'), {'cal_location': 'hall'})
+        cal = show_calendar({}, req)
+        self.assertIn(self.event.title, cal)
+        self.assertNotIn(self.event2.title, cal)
+
+    def test_upcoming_events_with_location(self):
+        now = timezone.localtime(self.event.start_date)
+        events = upcoming_events(now=now, location='park')['upcoming_events']
+        self.assertTrue(events)
+        self.assertEqual(
+            set(event for start, event in events), set([self.event2]))
+
+    @override_settings(
+        CALENDAR_CACHE_TIMEOUT=60,
+        CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'happenings-locations',
+        }},
+    )
+    def test_cached_calendars_per_location(self):
+        caches['default'].clear()
+        for location, title in (('hall', 'Smith'), ('park', 'Alison')):
+            req = RequestFactory().get('/')
+            req.GET = req.GET.copy()
+            req.GET['cal_location'] = location
+            cal = show_calendar({}, req)
+            self.assertIn(title, cal)
@@ -0,0 +1,113 @@
+from __future__ import unicode_literals
+
+import json
+from datetime import date
+
+from django.core.urlresolvers import reverse
+from django.test.client import RequestFactory
+from django.test.utils import override_settings
+
+from happenings.utils.displays import month_display
+from happenings.views import EventPopoverView
+from tests.unit_tests.test_utils.test_calendars import normalize
+from .event_factory import create_event, SetMeUp
+
+
+@override_settings(CALENDAR_LAZY_POPOVERS=True)
+class LazyPopoverTest(SetMeUp):
+    def setUp(self):
+        self.event = create_event(
+            start_date=(2014, 5, 15),
+            end_date=(2014, 5, 15),
+            created_by=self.user,
+            title="Big Event",
+            description="Wow! An event.",
+            repeat="WEEKLY"
+        )
+        self.event.location.create(name="Heck")
+        self.event.cancellations.create(date=date(2014, 5, 22), reason="x")
+        self.event2 = create_event(
+            start_date=(2014, 5, 22),
+            end_date=(2014, 5, 22),
+            created_by=self.user,
+            title="Other",
+            description="Short",
+        )
+
+    def render(self, mini):
+        events = [self.event, self.event2]
+        return month_display(2014, 5, events, 0, 0, [], mini=mini)
+
+    def get_popovers(self, items, **params):
+        params['p'] = items
+        response = self.client.get(reverse('calendar:popovers'), params)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content.decode('utf-8'))['popovers']
+
+    def test_cells_only_carry_ids(self):
+        html = self.render(mini=False)
+        self.assertIn('data-popovers-url="/calendar/popovers/"', html)
+        self.assertIn('data-popover="2014-05-15:%d"' % self.event.pk, html)
+        self.assertNotIn('data-content', html)
+        self.assertNotIn("Heck", html)
+
+        html = self.render(mini=True)
+        self.assertIn(
+            'data-popovers-url="/calendar/popovers/?cal_mini=true"', html)
+        self.assertIn('data-popover="2014-05-22:%d,%d"' % (
+            self.event.pk, self.event2.pk), html)
+        self.assertNotIn('data-content', html)
+
+    def test_fast_renderer(self):
+        for mini in (False, True):
+            html = self.render(mini)
+            with override_settings(CALENDAR_FAST_RENDERER=True):
+                fast_html = self.render(mini)
+            self.assertEqual(normalize(html), normalize(fast_html))
+
+    def test_popovers(self):
+        first = '2014-05-15:%d' % self.event.pk
+        second = '2014-05-22:%d' % self.event2.pk
+        popovers = self.get_popovers([
+            first, second, '2014-05-29:0', 'bad', '2014-13-01:1'
+        ])
+        self.assertEqual(set(popovers), set([first, second]))
+        self.assertIn("Heck", popovers[first])
+        self.assertIn("Wow! An event.", popovers[first])
+        self.assertIn("Short", popovers[second])
+        self.assertIn(self.event2.get_absolute_url(), popovers[second])
+
+    def test_mini_popovers(self):
+        item = '2014-05-22:%d,%d' % (self.event.pk, self.event2.pk)
+        popovers = self.get_popovers(
+            [item, '2014-05-29:%d' % self.event.pk], cal_mini='true')
+        self.assertIn("Big Event (CANCELLED)", popovers[item])
+        self.assertIn("Other", popovers[item])
+        self.assertNotIn(
+            "(CANCELLED)", popovers['2014-05-29:%d' % self.event.pk])
+
+    def test_invalid_pks_are_skipped(self):
+        item = '2014-05-15:\u00b2,x,%d' % self.event.pk
+        popovers = self.get_popovers([item, '2014-05-16:\u00b2'])
+        self.assertEqual(list(popovers), [item])
+
+    def test_no_items(self):
+        self.assertEqual(self.get_popovers([]), {})
+
+    def test_other_months_are_ignored(self):
+        first = '2014-05-15:%d' % self.event.pk
+        popovers = self.get_popovers([
+            first, '2014-06-05:%d' % self.event.pk,
+            '0001-01-01:%d' % self.event.pk,
+        ])
+        self.assertEqual(list(popovers), [first])
+
+    def test_number_of_pks_is_capped(self):
+        view = EventPopoverView()
+        view.request = RequestFactory().get('/', {'p': [
+            '2014-05-15:' + ','.join(['1'] * 500), '2014-05-16:2'
+        ]})
+        items, month = view.get_items()
+        self.assertEqual(month, (2014, 5))
+        self.assertEqual(
+            [len(pks) for item, d, pks in items], [view.max_pks])
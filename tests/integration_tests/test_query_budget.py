@@ -0,0 +1,159 @@
+from __future__ import unicode_literals
+
+from datetime import timedelta
+
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.template import Context, Template
+from django.test.client import RequestFactory
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+
+from happenings.models import Event, Location
+from happenings.templatetags.happenings_tags import show_calendar
+from .event_factory import SetMeUp
+
+# The numbers of events the views & tags are measured with
+SIZES = (1, 4, 12)
+
+
+def measure(func):
+    """
+    Calls 'func' and returns the number of SQL queries it ran, and how
+    long they took in total (in seconds).
+    """
+    with CaptureQueriesContext(connection) as context:
+        func()
+    queries = context.captured_queries
+    return len(queries), sum(float(q['time']) for q in queries)
+
+
+@override_settings(CALENDAR_SHOW_LIST=True)
+class QueryBudgetTest(SetMeUp):
+    """
+    Renders every view & template tag with more and more events, and
+    fails if the number of queries grows with the number of events (an
+    N+1 query, e.g. a relation that isn't prefetched being used in a
+    template).
+    """
+    def setUp(self):
+        self.events = []
+        self.now = timezone.localtime(timezone.now())
+
+    def add_events(self, num):
+        """
+        Adds events until there are 'num' of them. They're all going on
+        now (so they show up on this month's calendar, on today's day
+        list, and as happening now); every other one repeats weekly (so
+        it's upcoming) and is cancelled next week. Each has a location,
+        a category and a tag.
+        """
+        while len(self.events) < num:
+            i = len(self.events)
+            event = Event.objects.create(
+                start_date=self.now - timedelta(hours=1),
+                end_date=self.now + timedelta(hours=1),
+                created_by=self.user,
+                title="event %d" % i,
+                description="Testing 1 2 3",
+                repeat='WEEKLY' if i % 2 else 'NEVER',
+            )
+            event.location.add(Location.objects.create(name="place %d" % i))
+            event.categories.create(title="category %d" % i)
+            event.tags.create(name="tag %d" % i)
+            if i % 2:
+                event.cancellations.create(
+                    reason="Closed",
+                    date=(self.now + timedelta(days=7)).date()
+                )
+            self.events.append(event)
+
+    def assertQueriesDontGrow(self, func):
+        """
+        Calls 'func' with each of SIZES events (after one call to warm up)
+        and checks that it runs the same number of queries every time.
+        """
+        results = []
+        for num in SIZES:
+            self.add_events(num)
+            func()
+            count, seconds = measure(func)
+            results.append((num, count, seconds))
+        counts = set(count for num, count, seconds in results)
+        self.assertEqual(len(counts), 1, "queries grow with events: %s" % (
+            ', '.join('%d events: %d queries (%.1fms)' % (
+                num, count, seconds * 1000) for num, count, seconds in results)
+        ))
+
+    def get(self, url, ajax=False):
+        kwargs = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'} if ajax else {}
+
+        def get():
+            response = self.client.get(url, **kwargs)
+            self.assertEqual(response.status_code, 200)
+        return get
+
+    def render(self, template):
+        return lambda: Template(
+            '{% load happenings_tags %}' + template).render(Context())
+
+    def test_month_view(self):
+        self.assertQueriesDontGrow(self.get(reverse('calendar:list')))
+
+    def day_url(self):
+        return reverse('calendar:day_list', kwargs={
+            'year': self.now.year, 'month': self.now.month,
+            'day': self.now.day
+        })
+
+    def shift_url(self, name):
+        return reverse('calendar:%s' % name) + '?cal_next=0'
+
+    def test_day_view(self):
+        self.assertQueriesDontGrow(self.get(self.day_url()))
+
+    def test_day_view_ajax(self):
+        self.assertQueriesDontGrow(self.get(self.day_url(), ajax=True))
+
+    def test_detail_view(self):
+        self.add_events(1)
+        url = reverse('calendar:detail', kwargs={'pk': self.events[0].pk})
+        self.assertQueriesDontGrow(self.get(url))
+
+    def test_month_shift(self):
+        self.assertQueriesDontGrow(
+            self.get(self.shift_url('month_shift'), ajax=True))
+
+    def test_event_list_shift(self):
+        self.assertQueriesDontGrow(
+            self.get(self.shift_url('event_list_shift'), ajax=True))
+
+    def test_cal_and_list_shift(self):
+        self.assertQueriesDontGrow(
+            self.get(self.shift_url('cal_and_list_shift'), ajax=True))
+
+    def test_show_calendar(self):
+        request = RequestFactory().get(reverse('calendar:list'))
+        self.assertQueriesDontGrow(lambda: show_calendar({}, request))
+
+    def test_show_mini_calendar(self):
+        request = RequestFactory().get(reverse('calendar:list'))
+        self.assertQueriesDontGrow(
+            lambda: show_calendar({}, request, mini=True))
+
+    def test_upcoming_events(self):
+        self.assertQueriesDontGrow(self.render('{% upcoming_events %}'))
+
+    def test_current_happenings(self):
+        self.assertQueriesDontGrow(self.render('{% current_happenings %}'))
+
+    @override_settings(CALENDAR_LAZY_POPOVERS=True)
+    def test_popovers(self):
+        def get():
+            items = ['%s:%d' % (self.now.date().isoformat(), event.pk)
+                     for event in self.events]
+            for params in ({'p': items}, {'p': items, 'cal_mini': 'true'}):
+                response = self.client.get(
+                    reverse('calendar:popovers'), params)
+                self.assertEqual(response.status_code, 200)
+        self.assertQueriesDontGrow(get)
@@ -7,7 +7,12 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': 'test.db',
-    }
+    },
+    # only read from by the tests that set CALENDAR_READ_DB
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': 'test_replica.db',
+    },
 }
 
 # use a faster password hasher for tests
@@ -1,8 +1,11 @@
 from __future__ import unicode_literals
 
 from datetime import datetime, date
+from unittest import skipUnless
 
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import override_settings
 from django.contrib.auth.models import User
 from django.utils.timezone import make_aware, utc
 
@@ -64,3 +67,273 @@ class EventManagerTest(TestCase):
         self.assertEqual(events[0].pk, event.pk)
         self.assertEqual(events[1].title, event2.title)
         self.assertEqual(events[1].pk, event2.pk)
+
+        # events that don't start until after 'finish' are left out
+        finish = make_aware(datetime(2014, 5, 20), utc)
+        events = Event.objects.live(now, finish)
+        self.assertEqual([e.pk for e in events], [event.pk])
+
+    def test_occurrences_between(self):
+        """
+        Tests that Event.objects.occurrences_between() merges the
+        occurrences of all events in chronological order.
+        """
+        user = User.objects.create_user(
+            'foo', 'bar@example.com', 'secret'
+        )
+        weekly = create_event(
+            start_date=(2014, 5, 1, 9),
+            end_date=(2014, 5, 1, 10),
+            created_by=user,
+            title="weekly",
+            description="Testing 1 2 3",
+            repeat="WEEKLY",
+            utc=True
+        )
+        monthly = create_event(
+            start_date=(2014, 1, 8, 8),
+            end_date=(2014, 1, 8, 9),
+            created_by=user,
+            title="monthly",
+            description="Testing 1 2 3",
+            repeat="MONTHLY",
+            utc=True
+        )
+        create_event(
+            start_date=(2014, 4, 2),
+            end_date=(2014, 4, 4),
+            created_by=user,
+            title="over",
+            description="Testing 1 2 3",
+            repeat="WEEKLY",
+            end_repeat=date(2014, 5, 2),
+            utc=True
+        )
+        start = make_aware(datetime(2014, 5, 6), utc)
+        end = make_aware(datetime(2014, 5, 16), utc)
+        with self.settings(TIME_ZONE='UTC'):
+            occurrences = [
+                (s.day, s.hour, e.hour, event.title) for s, e, event in
+                Event.objects.occurrences_between(start, end)
+            ]
+        self.assertEqual(occurrences, [
+            (8, 8, 9, monthly.title),
+            (8, 9, 10, weekly.title),
+            (15, 9, 10, weekly.title),
+        ])
+
+    @override_settings(TIME_ZONE='America/Los_Angeles')
+    def test_all_month_events_uses_local_dates(self):
+        """
+        An event late on the last day of the month (in the default
+        timezone) belongs to that month, even though it's the next month
+        in UTC.
+        """
+        user = User.objects.create_user(
+            'foo', 'bar@example.com', 'secret'
+        )
+        event = create_event(
+            start_date=(2014, 5, 31, 22),
+            end_date=(2014, 5, 31, 23),
+            created_by=user,
+            title="late",
+            description="Testing 1 2 3",
+        )
+        yearly = create_event(
+            start_date=(2013, 5, 2),
+            end_date=(2013, 5, 2),
+            created_by=user,
+            title="yearly",
+            description="Testing 1 2 3",
+            repeat="YEARLY",
+        )
+        self.assertEqual(
+            list(Event.objects.all_month_events(2014, 5)), [yearly, event]
+        )
+        self.assertEqual(list(Event.objects.all_month_events(2014, 6)), [])
+
+    @skipUnless(connection.vendor == 'sqlite', "EXPLAIN QUERY PLAN is SQLite")
+    def test_month_query_uses_indexes(self):
+        """The month query never reads the whole event table."""
+        sql, params = Event.objects.all_month_events(
+            2014, 5).query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            plan = [row[-1] for row in cursor.fetchall()]
+        self.assertTrue(any('INDEX' in step for step in plan))
+        for step in plan:
+            self.assertFalse(step.startswith('SCAN'), step)
+
+    @override_settings(TIME_ZONE='America/Los_Angeles')
+    def test_all_day_events(self):
+        """
+        Single-day occurrences are only matched on the days they can fall
+        on; multi-day ones are left for day_display() to check.
+        """
+        user = User.objects.create_user(
+            'foo', 'bar@example.com', 'secret'
+        )
+        weekly = create_event(
+            start_date=(2014, 5, 2),
+            end_date=(2014, 5, 2),
+            created_by=user,
+            title="weekly",
+            description="Testing 1 2 3",
+            repeat="WEEKLY",
+        )
+        monthly = create_event(
+            start_date=(2014, 4, 9),
+            end_date=(2014, 4, 9),
+            created_by=user,
+            title="monthly",
+            description="Testing 1 2 3",
+            repeat="MONTHLY",
+        )
+        chunk = create_event(
+            start_date=(2014, 4, 8),
+            end_date=(2014, 4, 10),
+            created_by=user,
+            title="chunk",
+            description="Testing 1 2 3",
+            repeat="MONTHLY",
+        )
+        yearly = create_event(
+            start_date=(2014, 5, 9),
+            end_date=(2014, 5, 9),
+            created_by=user,
+            title="yearly",
+            description="Testing 1 2 3",
+            repeat="YEARLY",
+            end_repeat=date(2014, 12, 31),
+        )
+        events = Event.objects.all_day_events(date(2014, 5, 9))
+        self.assertEqual(list(events), [chunk, monthly, weekly, yearly])
+        events = Event.objects.all_day_events(date(2015, 5, 9))
+        self.assertEqual(list(events), [chunk, monthly])
+        events = Event.objects.all_day_events(date(2014, 5, 10))
+        self.assertEqual(list(events), [chunk])
+
+    @skipUnless(connection.vendor == 'sqlite', "EXPLAIN QUERY PLAN is SQLite")
+    def test_day_query_uses_indexes(self):
+        """The day query never reads the whole event table."""
+        sql, params = Event.objects.all_day_events(
+            date(2014, 5, 9)).query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            plan = [row[-1] for row in cursor.fetchall()]
+        for step in plan:
+            self.assertFalse(step.startswith('SCAN'), step)
+
+    def test_category_and_tag_filters(self):
+        """
+        Events are matched on category/tag case-insensitively, and only
+        returned once even if several of their categories match.
+        """
+        user = User.objects.create_user(
+            'foo', 'bar@example.com', 'secret'
+        )
+        both = create_event(
+            start_date=(2014, 5, 2),
+            end_date=(2014, 5, 2),
+            created_by=user,
+            title="both",
+            description="Testing 1 2 3",
+            categories=['Music', 'music'],
+            tags=['free'],
+        )
+        create_event(
+            start_date=(2014, 5, 3),
+            end_date=(2014, 5, 3),
+            created_by=user,
+            title="category",
+            description="Testing 1 2 3",
+            categories=['MUSIC'],
+        )
+        events = Event.objects.all_month_events(2014, 5, category='music')
+        self.assertEqual([e.title for e in events], ["both", "category"])
+        events = Event.objects.all_month_events(
+            2014, 5, category='music', tag='FREE')
+        self.assertEqual(list(events), [both])
+        events = Event.objects.all_month_events(2014, 5, tag='nope')
+        self.assertEqual(list(events), [])
+
+    def test_several_categories_and_tags(self):
+        """
+        Lists of categories/tags return the events in any of them, with a
+        single query, and each event knows which ones it matched.
+        """
+        user = User.objects.create_user(
+            'foo', 'bar@example.com', 'secret'
+        )
+        music = create_event(
+            start_date=(2014, 5, 2),
+            end_date=(2014, 5, 2),
+            created_by=user,
+            title="music",
+            description="Testing 1 2 3",
+            categories=['Music'],
+            tags=['free'],
+        )
+        talks = create_event(
+            start_date=(2014, 5, 3),
+            end_date=(2014, 5, 3),
+            created_by=user,
+            title="talks",
+            description="Testing 1 2 3",
+            categories=['Talks', 'music'],
+        )
+        create_event(
+            start_date=(2014, 5, 4),
+            end_date=(2014, 5, 4),
+            created_by=user,
+            title="sports",
+            description="Testing 1 2 3",
+            categories=['Sports'],
+        )
+        with self.assertNumQueries(1):
+            events = Event.objects.set_matched_filters(list(
+                Event.objects.all_month_events(
+                    2014, 5, category=['music', 'talks'], projection='mini')
+            ), category=['music', 'talks'])
+        self.assertEqual(events, [music, talks])
+        self.assertTrue(events[1].matched_categories_0)
+        self.assertEqual(events[0].matched_filters, [('category', 'music')])
+        self.assertEqual(events[1].matched_filters, [
+            ('category', 'music'), ('category', 'talks')
+        ])
+        events = list(Event.objects.all_month_events(
+            2014, 5, category=['talks', 'sports'], tag='free'))
+        self.assertEqual(events, [])
+        events = Event.objects.set_matched_filters(list(
+            Event.objects.all_month_events(
+                2014, 5, category=['music', 'sports'], tag='free')
+        ), category=['music', 'sports'], tag='free')
+        self.assertEqual(events, [music])
+        self.assertEqual(events[0].matched_filters, [
+            ('category', 'music'), ('tag', 'free')
+        ])
+        events = list(Event.objects.all_day_events(
+            date(2014, 5, 3), tag=['free', 'nope']))
+        self.assertEqual(events, [])
+
+    def test_projection(self):
+        user = User.objects.create_user(
+            'foo', 'bar@example.com', 'secret'
+        )
+        create_event(
+            start_date=(2014, 5, 2),
+            end_date=(2014, 5, 2),
+            created_by=user,
+            title="event",
+            description="A very long description",
+        )
+        event = Event.objects.all_month_events(2014, 5, projection='mini')[0]
+        deferred = event.get_deferred_fields()
+        self.assertIn('description', deferred)
+        self.assertIn('background_color', deferred)
+        self.assertNotIn('title', deferred)
+        event = Event.objects.all_month_events(2014, 5, projection='grid')[0]
+        self.assertIn('description', event.get_deferred_fields())
+        self.assertNotIn('background_color', event.get_deferred_fields())
+        event = Event.objects.all_month_events(2014, 5)[0]
+        self.assertEqual(event.get_deferred_fields(), set())
@@ -3,6 +3,7 @@ from __future__ import unicode_literals
 from datetime import timedelta, date
 
 from django.core.exceptions import ValidationError
+from django.test.utils import override_settings
 from django.utils import timezone
 
 from ..integration_tests.event_factory import create_event, SetMeUp
@@ -253,3 +254,24 @@ class ModelMethodsTest(SetMeUp):
             description="Special event"
         )
         self.assertEqual(1, event.get_start_end_diff())
+
+    @override_settings(TIME_ZONE='America/Los_Angeles')
+    def test_local_dates(self):
+        """
+        The local date columns are in the default timezone, not in UTC.
+        """
+        event = create_event(
+            start_date=(2014, 6, 1, 2),
+            end_date=(2014, 6, 2, 2),
+            created_by=self.user,
+            title="The Event",
+            description="Special event",
+            utc=True
+        )
+        event = Event.objects.get(pk=event.pk)
+        self.assertEqual(event.local_start_date, date(2014, 5, 31))
+        self.assertEqual(event.local_end_date, date(2014, 6, 1))
+        self.assertEqual(
+            (event.start_weekday, event.start_day, event.start_month),
+            (5, 31, 5)
+        )
@@ -56,3 +56,45 @@ class UpcomingEventsTemplateTagTest(TestCase):
         event2.save()
         events = upcoming_events(finish=2000)
         self.assertEqual(len(events['upcoming_events']), 2)
+
+    def test_events_merged_in_order(self):
+        """
+        Tests that the occurrences of different events are merged in
+        chronological order, and that only 'num' of them are returned.
+        """
+        user = User.objects.create_user(
+            'foo', 'bar@example.com', 'secret'
+        )
+        tz = get_default_timezone()
+        daily = Event.objects.create(
+            start_date=make_aware(datetime.datetime(2014, 5, 1, 12), tz),
+            end_date=make_aware(datetime.datetime(2014, 5, 1, 13), tz),
+            created_by=user,
+            title="daily",
+            description="daily event",
+            repeat="DAILY",
+        )
+        weekly = Event.objects.create(
+            start_date=make_aware(datetime.datetime(2014, 5, 2, 9), tz),
+            end_date=make_aware(datetime.datetime(2014, 5, 2, 10), tz),
+            created_by=user,
+            title="weekly",
+            description="weekly event",
+            repeat="WEEKLY",
+        )
+        Event.objects.create(
+            start_date=make_aware(datetime.datetime(2015, 5, 2, 9), tz),
+            end_date=make_aware(datetime.datetime(2015, 5, 2, 10), tz),
+            created_by=user,
+            title="far away",
+            description="past the finish",
+            repeat="NEVER",
+        )
+        now = make_aware(datetime.datetime(2014, 5, 1, 18), tz)
+        events = upcoming_events(now=now, finish=30, num=4)
+        self.assertEqual(
+            [(start.day, start.hour, event.pk)
+             for start, event in events['upcoming_events']],
+            [(2, 9, weekly.pk), (2, 12, daily.pk), (3, 12, daily.pk),
+             (4, 12, daily.pk)]
+        )
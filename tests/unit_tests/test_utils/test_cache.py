@@ -0,0 +1,342 @@
+from __future__ import unicode_literals
+
+import gzip
+import io
+from datetime import date
+
+from django.core.cache import caches
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.http import HttpResponse
+from django.test.client import RequestFactory
+from django.test.utils import override_settings, CaptureQueriesContext
+from django.views.generic import View
+
+from happenings.models import Cancellation, Event, Location, Tag
+from happenings.utils.cache import FragmentCache, get_filter_ids
+from happenings.utils.calendars import EventCalendar
+from happenings.utils.mixins import CachedResponseMixin
+from happenings.utils.occurrences import OccurrenceHandler
+from tests.integration_tests.event_factory import create_event, SetMeUp
+
+
+CACHE_SETTINGS = dict(
+    CALENDAR_CACHE_TIMEOUT=60, CALENDAR_CACHE_ALIAS='happenings',
+    CALENDAR_SHOW_LIST=False,
+    CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+        'happenings': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'happenings-tests',
+        },
+    }
+)
+
+
+@override_settings(**CACHE_SETTINGS)
+class CalendarCacheTest(SetMeUp):
+    def setUp(self):
+        caches['happenings'].clear()
+        self.event = create_event(
+            created_by=self.user,
+            title="The Event",
+            description="Testing 1 2 3",
+            repeat="WEEKLY",
+        )
+        self.url = reverse('calendar:list')
+
+    def get_and_count(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, params)
+        return response, len(queries)
+
+    def test_cached_calendar_skips_queries(self):
+        response, first = self.get_and_count()
+        self.assertContains(response, "The Event")
+        response, second = self.get_and_count()
+        self.assertContains(response, "The Event")
+        self.assertEqual(second, 0)
+        self.assertGreater(first, 0)
+
+    def test_filters_are_cached_separately(self):
+        self.get_and_count()
+        response, num = self.get_and_count(cal_tag='nope')
+        self.assertGreater(num, 0)
+        self.assertNotContains(response, "The Event")
+
+    def test_event_save_invalidates(self):
+        self.get_and_count()
+        self.event.title = "Renamed"
+        self.event.save()
+        response, num = self.get_and_count()
+        self.assertGreater(num, 0)
+        self.assertContains(response, "Renamed")
+
+    def test_cancellation_invalidates(self):
+        self.get_and_count()
+        Cancellation.objects.create(
+            event=self.event, date=self.event.l_start_date.date()
+        )
+        response, num = self.get_and_count()
+        self.assertGreater(num, 0)
+
+    def test_m2m_change_invalidates(self):
+        self.get_and_count()
+        self.event.tags.add(Tag.objects.create(name='new tag'))
+        response, num = self.get_and_count()
+        self.assertGreater(num, 0)
+
+    @override_settings(CALENDAR_SHOW_LIST=True)
+    def test_event_list_still_shown_on_hit(self):
+        self.get_and_count()
+        response, num = self.get_and_count()
+        self.assertGreater(num, 0)
+        self.assertTrue(response.context['show_events'])
+        self.assertEqual(
+            [e.title for day, events in response.context['events']
+             for e in events][:1],
+            ["The Event"]
+        )
+
+    def test_filter_ids_are_cached(self):
+        tag = Tag.objects.create(name='Music')
+        self.assertEqual(get_filter_ids(Tag, 'name', 'music'), [tag.pk])
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(get_filter_ids(Tag, 'name', 'MUSIC'), [tag.pk])
+        self.assertEqual(len(queries), 0)
+        other = Tag.objects.create(name='music')
+        self.assertEqual(
+            sorted(get_filter_ids(Tag, 'name', 'music')),
+            [tag.pk, other.pk]
+        )
+
+
+class RecordingCache(object):
+    """A dict-backed cache that records the lookups made on it."""
+    def __init__(self):
+        self.data = {}
+        self.lookups = []
+
+    def get(self, key, default=None):
+        self.lookups.append(key)
+        return self.data.get(key, default)
+
+    def get_many(self, keys):
+        self.lookups.append(tuple(keys))
+        return dict((k, self.data[k]) for k in keys if k in self.data)
+
+    def add(self, key, value, timeout=None):
+        self.data.setdefault(key, value)
+
+    def set_many(self, data, timeout=None):
+        self.data.update(data)
+
+
+class CountingCalendar(EventCalendar):
+    """Records the days whose cells it rendered."""
+    def __init__(self, *args, **kwargs):
+        super(CountingCalendar, self).__init__(*args, **kwargs)
+        self.rendered = []
+        self.popovers = []
+
+    def render_day(self, day, *args):
+        if day:
+            self.rendered.append(day)
+        return super(CountingCalendar, self).render_day(day, *args)
+
+    def render_popover(self, event, *args):
+        self.popovers.append(event.title)
+        return super(CountingCalendar, self).render_popover(event, *args)
+
+
+@override_settings(**CACHE_SETTINGS)
+class FragmentCacheTest(SetMeUp):
+    def setUp(self):
+        caches['happenings'].clear()
+        self.weekly = create_event(
+            start_date=(2014, 5, 7),
+            end_date=(2014, 5, 7),
+            created_by=self.user,
+            title="Weekly",
+            description="Testing 1 2 3",
+            repeat="WEEKLY",
+        )
+        self.once = create_event(
+            start_date=(2014, 5, 20),
+            end_date=(2014, 5, 20),
+            created_by=self.user,
+            title="Once",
+            description="Testing 1 2 3",
+        )
+
+    def render(self):
+        events = list(Event.objects.all_month_events(2014, 5, loc=True))
+        count = OccurrenceHandler(2014, 5, events).get_month()
+        calendar = CountingCalendar(2014, 5, count, events)
+        html = calendar.formatmonth(2014, 5, net=0)
+        return calendar, html
+
+    def test_only_changed_cells_are_rendered(self):
+        calendar, html = self.render()
+        self.assertEqual(len(calendar.rendered), 31)
+        self.assertEqual(sorted(calendar.popovers), ["Once", "Weekly"])
+
+        calendar, cached_html = self.render()
+        self.assertEqual(calendar.rendered, [])
+        self.assertEqual(calendar.popovers, [])
+        self.assertEqual(cached_html, html)
+
+        self.once.title = "Renamed"
+        self.once.save()
+        calendar, html = self.render()
+        self.assertEqual(calendar.rendered, [20])
+        self.assertEqual(calendar.popovers, ["Renamed"])
+        self.assertIn("Renamed", html)
+
+        Cancellation.objects.create(event=self.weekly, date=date(2014, 5, 14))
+        calendar, html = self.render()
+        self.assertEqual(calendar.rendered, [14])
+        self.assertEqual(calendar.popovers, [])
+        self.assertIn("(CANCELLED)", html)
+
+    def test_prefetched_misses_arent_looked_up_again(self):
+        cache = RecordingCache()
+        fragments = FragmentCache(cache)
+        cache.lookups = []
+        fragments.prefetch([('a',), ('b',)])
+        self.assertEqual(fragments.get(('a',), lambda: 'A'), 'A')
+        self.assertEqual(fragments.get(('b',), lambda: 'B'), 'B')
+        self.assertEqual(len(cache.lookups), 1)  # the get_many()
+        fragments.get(('c',), lambda: 'C')
+        self.assertEqual(len(cache.lookups), 2)
+        fragments.save()
+
+        fragments = FragmentCache(cache)
+        fragments.prefetch([('a',), ('b',), ('c',)])
+        self.assertEqual(fragments.get(('c',), lambda: 'new'), 'C')
+
+    def test_location_change_renders_again(self):
+        self.render()
+        self.weekly.location.add(Location.objects.create(name="Heck"))
+        calendar, html = self.render()
+        self.assertEqual(len(calendar.rendered), 31)
+        self.assertIn("Heck", html)
+
+
+class HeaderView(CachedResponseMixin, View):
+    """Sets headers of its own, and counts how often it's called."""
+    calls = 0
+
+    def get(self, request, *args, **kwargs):
+        HeaderView.calls += 1
+        response = HttpResponse("Bonjour", content_type='text/plain')
+        response['Content-Language'] = 'fr'
+        response['Cache-Control'] = 'max-age=60'
+        return response
+
+
+@override_settings(CALENDAR_CACHE_RESPONSES=True, **CACHE_SETTINGS)
+class ResponseCacheTest(SetMeUp):
+    def setUp(self):
+        caches['happenings'].clear()
+        self.event = create_event(
+            created_by=self.user,
+            title="The Event",
+            description="Testing 1 2 3",
+            repeat="WEEKLY",
+        )
+        self.url = reverse('calendar:list')
+
+    def get_and_count(self, url=None, **headers):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url or self.url, **headers)
+        return response, len(queries)
+
+    def test_cached_response(self):
+        response, first = self.get_and_count()
+        self.assertGreater(first, 0)
+        etag = response['ETag']
+        cached, num = self.get_and_count()
+        self.assertEqual(num, 0)
+        self.assertEqual(cached.content, response.content)
+        self.assertEqual(cached['ETag'], etag)
+
+    def test_not_modified(self):
+        response, num = self.get_and_count()
+        response, num = self.get_and_count(
+            HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(num, 0)
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+    def test_not_modified_parses_if_none_match(self):
+        etag = self.get_and_count()[0]['ETag']
+        for header in ('"other", W/%s' % etag, '*', '"x",%s' % etag):
+            response, num = self.get_and_count(HTTP_IF_NONE_MATCH=header)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response['ETag'], etag)
+        # a substring of the ETag isn't a match
+        response, num = self.get_and_count(HTTP_IF_NONE_MATCH=etag[2:-2])
+        self.assertEqual(response.status_code, 200)
+
+    def test_gzip(self):
+        response, num = self.get_and_count()
+        compressed, num = self.get_and_count(HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', compressed['Vary'])
+        self.assertNotEqual(compressed['ETag'], response['ETag'])
+        content = gzip.GzipFile(fileobj=io.BytesIO(compressed.content)).read()
+        self.assertEqual(content, response.content)
+
+        for etag in (response['ETag'], compressed['ETag']):
+            not_modified, num = self.get_and_count(
+                HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(not_modified.status_code, 304)
+            self.assertEqual(not_modified['ETag'], etag)
+
+    def test_event_save_changes_etag(self):
+        response, num = self.get_and_count()
+        self.event.title = "Renamed"
+        self.event.save()
+        changed, num = self.get_and_count(HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], response['ETag'])
+        self.assertContains(changed, "Renamed")
+
+    def test_ajax_and_detail_responses(self):
+        url = reverse('calendar:month_shift') + '?cal_next=1'
+        page, num = self.get_and_count(url)
+        ajax, num = self.get_and_count(
+            url, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertNotEqual(page['ETag'], ajax['ETag'])
+        self.assertEqual(ajax['Content-Type'], 'application/json')
+        url = reverse('calendar:detail', kwargs={'pk': self.event.pk})
+        response, first = self.get_and_count(url)
+        response, num = self.get_and_count(url)
+        self.assertContains(response, "The Event")
+        self.assertEqual(num, 0)
+
+    def test_view_headers_are_kept(self):
+        view = HeaderView.as_view()
+        HeaderView.calls = 0
+        for i in range(2):
+            response = view(RequestFactory().get('/headers/'))
+            self.assertEqual(response.content, b"Bonjour")
+            self.assertEqual(response['Content-Type'], 'text/plain')
+            self.assertEqual(response['Content-Language'], 'fr')
+            self.assertEqual(response['Cache-Control'], 'max-age=60')
+            self.assertTrue(response.has_header('ETag'))
+        self.assertEqual(HeaderView.calls, 1)
+
+        response = view(RequestFactory().get(
+            '/headers/', HTTP_IF_NONE_MATCH=response['ETag']))
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['Cache-Control'], 'max-age=60')
+        self.assertFalse(response.has_header('Content-Language'))
+
+    @override_settings(CALENDAR_CACHE_RESPONSES=False)
+    def test_turned_off(self):
+        response, num = self.get_and_count()
+        self.assertFalse(response.has_header('ETag'))
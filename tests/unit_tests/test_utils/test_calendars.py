@@ -1,10 +1,22 @@
 from __future__ import unicode_literals
 
+import re
 from datetime import date
 from collections import defaultdict
 
+from django.test.utils import override_settings
+
 from tests.integration_tests.event_factory import create_event, SetMeUp
-from happenings.utils.calendars import EventCalendar, MiniEventCalendar
+from happenings.utils.calendars import (
+    EventCalendar, MiniEventCalendar, FastEventCalendar, FastMiniEventCalendar
+)
+from happenings.utils.displays import month_display
+
+
+def normalize(html):
+    """Removes the whitespace differences between calendars' html."""
+    html = re.sub(r'\s+', ' ', html)
+    return re.sub(r'\s*(<|>|&lt;|&gt;)\s*', r'\1', html)
 
 
 class EventCalendarTest(SetMeUp):
@@ -72,3 +84,50 @@ class MiniEventCalendarTest(SetMeUp):
             cal.count = {day: [(event.title, event.pk)]}
             rendered_result = cal.formatday(day, 0)
             self.assertIn(event.title, rendered_result)
+
+
+class FastEventCalendarTest(SetMeUp):
+    def setUp(self):
+        self.event = create_event(
+            start_date=(2014, 5, 15),
+            end_date=(2014, 5, 15),
+            created_by=self.user,
+            title="Big <Event>",
+            description="Wow! An event & " * 10,
+            repeat="WEEKLY"
+        )
+        self.event.location.create(name="Heck")
+        self.event.cancellations.create(date=date(2014, 5, 22), reason="x")
+        self.event2 = create_event(
+            start_date=(2014, 5, 2),
+            end_date=(2014, 5, 3),
+            created_by=self.user,
+            title="Other",
+            description="Short",
+        )
+
+    def render(self, mini):
+        events = [self.event, self.event2]
+        return month_display(2014, 5, events, 0, 0, [], mini=mini)
+
+    def test_same_markup(self):
+        """The fast renderer's html is the same as the templates'."""
+        for mini in (False, True):
+            html = self.render(mini)
+            with override_settings(CALENDAR_FAST_RENDERER=True):
+                fast_html = self.render(mini)
+            self.assertEqual(normalize(html), normalize(fast_html))
+            self.assertIn("(CANCELLED)", fast_html)
+
+    def test_day_cell(self):
+        count = {15: [(self.event.title, self.event.pk)]}
+        cal = FastEventCalendar(2014, 5, count, [self.event])
+        html = cal.formatday(15, 3)
+        self.assertIn('href="/calendar/2014/5/15/"', html)
+        self.assertIn('title="Big &lt;Event&gt;"', html)
+        self.assertIn("Where:", html)
+        self.assertIn("Heck", html)
+        self.assertEqual(cal.formatday(0, 3), '<td class="noday">&nbsp;</td>')
+        cal = FastMiniEventCalendar(2014, 5, count, [self.event])
+        self.assertIn('>1</div>', cal.formatday(15, 3))
+        self.assertIn('>0</div>', cal.formatday(16, 4))
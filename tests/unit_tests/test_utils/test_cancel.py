@@ -3,8 +3,14 @@ from __future__ import unicode_literals
 from datetime import date
 from collections import defaultdict
 
+from django.test.utils import override_settings
+
 from tests.integration_tests.event_factory import create_event, SetMeUp
+from happenings.models import Event
 from happenings.utils.calendars import GenericCalendar
+from happenings.utils.cancellations import CancellationIndex
+from happenings.utils.displays import month_display
+from happenings.utils.occurrences import OccurrenceHandler
 
 
 class CancelledEventsTest(SetMeUp):
@@ -70,3 +76,65 @@ class CancelledEventsTest(SetMeUp):
                 self.assertEqual(event.title + ' (CANCELLED)', cal.title)
             else:
                 self.assertEqual(event.title, cal.title)
+
+
+class CancellationIndexTest(SetMeUp):
+    def setUp(self):
+        self.events = []
+        for i in range(3):
+            event = create_event(
+                start_date=(2014, 5, 1 + i),
+                end_date=(2014, 5, 1 + i),
+                created_by=self.user,
+                title="Event %d" % i,
+                description="Wow! An event.",
+                repeat="WEEKLY"
+            )
+            event.cancellations.create(reason="Closed", date=date(2014, 5, 8 + i))
+            self.events.append(event)
+        # outside of the month
+        self.events[0].cancellations.create(
+            reason="Closed", date=date(2014, 6, 5))
+
+    def test_one_query_for_the_month(self):
+        events = list(Event.objects.filter(pk__in=[e.pk for e in self.events]))
+        with self.assertNumQueries(1):
+            index = CancellationIndex.for_month(events, 2014, 5)
+        index.attach(events)
+        with self.assertNumQueries(0):
+            for i, event in enumerate(events):
+                for day in range(1 + i, 32, 7):
+                    self.assertEqual(
+                        event.check_if_cancelled(date(2014, 5, day)),
+                        day == 8 + i
+                    )
+        self.assertNotIn((events[0].pk, date(2014, 6, 5)), index.cancelled)
+
+    def test_title_extra_only_on_cancelled_days(self):
+        event = self.events[0]
+        CancellationIndex.for_month([event], 2014, 5).attach([event])
+        event.check_if_cancelled(date(2014, 5, 8))
+        self.assertEqual(event.title_extra, ' (CANCELLED)')
+        event.check_if_cancelled(date(2014, 5, 15))
+        self.assertEqual(event.title_extra, '')
+
+    def test_calendar_queries(self):
+        """Rendering a calendar runs one query for the cancellations."""
+        events = list(Event.objects.all_month_events(2014, 5))
+        with self.assertNumQueries(1):
+            month_display(2014, 5, events, 0, 0, [], mini=True)
+
+    def test_drop_cancelled(self):
+        events = list(Event.objects.all_month_events(2014, 5))
+        count = OccurrenceHandler(2014, 5, events).get_month()
+        self.assertIn(8, count.occurrence_days(self.events[0]))
+        CancellationIndex.for_month(events, 2014, 5).drop_cancelled(count)
+        self.assertEqual(count.occurrence_days(self.events[0]), [1, 15, 22, 29])
+        self.assertEqual(count.occurrence_days(self.events[2]), [3, 17, 24, 31])
+
+    @override_settings(CALENDAR_HIDE_CANCELLED=True)
+    def test_hide_cancelled(self):
+        events = list(Event.objects.all_month_events(2014, 5))
+        html = month_display(2014, 5, events, 0, 0, [])
+        self.assertNotIn('(CANCELLED)', html)
+        self.assertEqual(events[0].occurrence, [1, 15, 22, 29])
@@ -0,0 +1,34 @@
+from __future__ import unicode_literals
+
+from django.test import TestCase
+from django.core.urlresolvers import reverse
+from django.test.client import RequestFactory
+
+from happenings.utils.common import get_category_tag, join_values
+
+
+class GetCategoryTagTest(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.url = reverse('calendar:list')
+
+    def test_none(self):
+        req = self.factory.get(self.url)
+        self.assertEqual(get_category_tag(req), (None, None))
+
+    def test_single(self):
+        req = self.factory.get(self.url + '?cal_category=music&cal_tag=free')
+        self.assertEqual(get_category_tag(req), ('music', 'free'))
+
+    def test_comma_list(self):
+        req = self.factory.get(self.url + '?cal_category=music, talks,')
+        self.assertEqual(get_category_tag(req), (['music', 'talks'], None))
+
+    def test_repeated(self):
+        req = self.factory.get(self.url + '?cal_tag=free&cal_tag=kids,adults')
+        self.assertEqual(
+            get_category_tag(req), (None, ['free', 'kids', 'adults']))
+
+    def test_join_values(self):
+        self.assertEqual(join_values(['music', 'talks']), 'music,talks')
+        self.assertEqual(join_values('music'), 'music')
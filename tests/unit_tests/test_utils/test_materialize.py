@@ -0,0 +1,121 @@
+from __future__ import unicode_literals
+
+from datetime import date, timedelta
+
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.test.utils import override_settings
+
+from django.utils.six import StringIO
+
+from happenings.models import Event, Occurrence
+from happenings.utils.materialize import (
+    extend_events, get_horizon, use_materialized
+)
+from tests.integration_tests.event_factory import (
+    create_recurring_event, SetMeUp
+)
+
+# the dates and repetition of the event most tests materialize
+WEEKLY_IN_MAY = ((2014, 5, 1), (2014, 5, 2), 'WEEKLY', date(2014, 5, 31))
+
+
+@override_settings(
+    CALENDAR_MATERIALIZE_OCCURRENCES=True, CALENDAR_OCCURRENCE_HORIZON=60,
+    TIME_ZONE='UTC'
+)
+class MaterializeOccurrencesTest(SetMeUp):
+    def dates(self, event):
+        return list(Occurrence.objects.filter(
+            event=event).order_by('date').values_list('date', flat=True))
+
+    def test_saved_event_is_materialized(self):
+        event = create_recurring_event(self.user, *WEEKLY_IN_MAY)
+        self.assertEqual(self.dates(event), [
+            date(2014, 5, 1), date(2014, 5, 2), date(2014, 5, 8),
+            date(2014, 5, 9), date(2014, 5, 15), date(2014, 5, 16),
+            date(2014, 5, 22), date(2014, 5, 23), date(2014, 5, 29),
+            date(2014, 5, 30),
+        ])
+
+    def test_rematerialized_on_change(self):
+        event = create_recurring_event(self.user, *WEEKLY_IN_MAY)
+        event.end_repeat = date(2014, 5, 8)
+        event.save()
+        self.assertEqual(self.dates(event), [
+            date(2014, 5, 1), date(2014, 5, 2), date(2014, 5, 8)
+        ])
+
+    def test_cancellation(self):
+        event = create_recurring_event(self.user, *WEEKLY_IN_MAY)
+        cancellation = event.cancellations.create(
+            reason="Out of town", date=date(2014, 5, 8))
+        self.assertEqual(list(Occurrence.objects.filter(
+            cancelled=True).values_list('date', flat=True)),
+            [date(2014, 5, 8)])
+        cancellation.delete()
+        self.assertFalse(Occurrence.objects.filter(cancelled=True).exists())
+
+    def test_open_ended_series_stops_at_horizon(self):
+        event = create_recurring_event(
+            self.user, (2014, 5, 1), (2014, 5, 1), 'DAILY')
+        self.assertEqual(self.dates(event)[-1], get_horizon())
+        with self.settings(CALENDAR_OCCURRENCE_HORIZON=90):
+            extend_events([event])
+            self.assertEqual(self.dates(event)[-1], get_horizon())
+
+    def test_materialized_until(self):
+        event = create_recurring_event(self.user, *WEEKLY_IN_MAY)
+        self.assertEqual(
+            Event.objects.get(pk=event.pk).materialized_until, date.max)
+        event = create_recurring_event(
+            self.user, (2014, 5, 1), (2014, 5, 2), 'WEEKLY')
+        self.assertEqual(
+            Event.objects.get(pk=event.pk).materialized_until, get_horizon())
+        self.assertTrue(use_materialized(get_horizon()))
+        self.assertFalse(use_materialized(get_horizon() + timedelta(days=1)))
+
+    def test_late_extension_falls_back(self):
+        """
+        Occurrences past the last materialize_occurrences run are still
+        found, even though they're before the horizon.
+        """
+        event = create_recurring_event(
+            self.user, (2014, 5, 1), (2014, 5, 2), 'WEEKLY', title="Forever")
+        Occurrence.objects.filter(date__gt=date(2014, 5, 31)).delete()
+        Event.objects.filter(pk=event.pk).update(
+            materialized_until=date(2014, 5, 31))
+        self.assertTrue(use_materialized(date(2014, 5, 31)))
+        self.assertFalse(use_materialized(date(2014, 6, 30)))
+        response = self.client.get(reverse(
+            'calendar:list', kwargs={'year': '2014', 'month': '06'}))
+        self.assertContains(response, "Forever")
+        response = self.client.get(reverse(
+            'calendar:day_list',
+            kwargs={'year': '2014', 'month': '06', 'day': '05'}))
+        self.assertContains(response, "Forever")
+
+    def test_month_view_reads_occurrences(self):
+        event = create_recurring_event(
+            self.user, *WEEKLY_IN_MAY, title="Materialized")
+        Event.objects.filter(pk=event.pk).update(title="Moved")
+        Occurrence.objects.filter(date__gte=date(2014, 5, 8)).delete()
+        response = self.client.get(reverse(
+            'calendar:list', kwargs={'year': '2014', 'month': '05'}))
+        self.assertContains(response, "Moved")
+        response = self.client.get(reverse(
+            'calendar:day_list',
+            kwargs={'year': '2014', 'month': '05', 'day': '15'}))
+        self.assertNotContains(response, "Moved")
+
+    def test_command_backfills(self):
+        with self.settings(CALENDAR_MATERIALIZE_OCCURRENCES=False):
+            event = create_recurring_event(self.user, *WEEKLY_IN_MAY)
+        self.assertEqual(self.dates(event), [])
+        out = StringIO()
+        call_command('materialize_occurrences', stdout=out)
+        self.assertEqual(len(self.dates(event)), 10)
+        self.assertIn("Materialized 10 occurrence(s) of 1 event(s)",
+                      out.getvalue())
+        self.assertEqual(
+            Event.objects.get(pk=event.pk).materialized_until, date.max)
@@ -0,0 +1,58 @@
+from __future__ import unicode_literals
+
+from django.test.utils import override_settings
+
+from happenings.utils.memo import LRUCache, occurrence_memo
+from happenings.utils.occurrences import OccurrenceHandler
+from tests.integration_tests.event_factory import create_event, SetMeUp
+
+
+class LRUCacheTest(SetMeUp):
+    def test_least_recently_used_is_dropped(self):
+        cache = LRUCache(2)
+        cache.set((1, 'a'), 'a')
+        cache.set((2, 'b'), 'b')
+        cache.get((1, 'a'))
+        cache.set((3, 'c'), 'c')
+        self.assertEqual(cache.get((2, 'b')), None)
+        self.assertEqual(cache.get((1, 'a')), 'a')
+        self.assertEqual(cache.info(), (2, 1, 2, 2))
+
+    def test_evict(self):
+        cache = LRUCache(10)
+        cache.set((1, 'a'), 'a')
+        cache.set((1, 'b'), 'b')
+        cache.set((2, 'a'), 'c')
+        cache.evict(1)
+        self.assertEqual(cache.info().currsize, 1)
+        self.assertEqual(cache.get((2, 'a')), 'c')
+
+    def test_disabled(self):
+        cache = LRUCache(0)
+        cache.set((1, 'a'), 'a')
+        self.assertEqual(cache.get((1, 'a')), None)
+
+    @override_settings(TIME_ZONE='UTC')
+    def test_occurrences_are_memoized(self):
+        occurrence_memo.clear()
+        event = create_event(
+            start_date=(2014, 5, 1),
+            end_date=(2014, 5, 1),
+            created_by=self.user,
+            title="event",
+            description="Testing 1 2 3",
+            repeat="WEEKLY",
+            utc=True
+        )
+        OccurrenceHandler(2014, 5, [event]).get_month()
+        self.assertEqual(occurrence_memo.info()[:2], (0, 1))
+        count = OccurrenceHandler(2014, 5, [event]).get_month()
+        self.assertEqual(occurrence_memo.info()[:2], (1, 1))
+        self.assertEqual(count.occurrence_days(event), [1, 8, 15, 22, 29])
+
+        # saving the event throws away its memoized occurrences
+        event.repeat = "BIWEEKLY"
+        event.save()
+        self.assertEqual(occurrence_memo.info().currsize, 0)
+        count = OccurrenceHandler(2014, 5, [event]).get_month()
+        self.assertEqual(count.occurrence_days(event), [1, 15, 29])
@@ -0,0 +1,31 @@
+from __future__ import unicode_literals
+
+from itertools import count, islice
+
+from django.test import TestCase
+
+from happenings.utils.common import merge_sorted
+
+
+class Uncomparable(object):
+    def __lt__(self, other):
+        raise TypeError("compared")
+
+
+class MergeSortedTest(TestCase):
+    def test_merge(self):
+        merged = merge_sorted([[(1, 'a'), (4, 'a')], [], [(2, 'b'), (3, 'b')]])
+        self.assertEqual(
+            list(merged), [(1, 'a'), (2, 'b'), (3, 'b'), (4, 'a')])
+
+    def test_ties_keep_stream_order(self):
+        first, second = Uncomparable(), Uncomparable()
+        merged = list(merge_sorted([[(1, second)], [(1, first)]]))
+        self.assertEqual(merged, [(1, second), (1, first)])
+
+    def test_lazy(self):
+        endless = ((i, 'x') for i in count())
+        self.assertEqual(
+            list(islice(merge_sorted([endless, [(1, 'y')]]), 3)),
+            [(0, 'x'), (1, 'x'), (1, 'y')]
+        )
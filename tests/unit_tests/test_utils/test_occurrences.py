@@ -0,0 +1,206 @@
+from __future__ import unicode_literals
+
+from datetime import date, datetime
+
+from django.test.utils import override_settings
+from django.utils.timezone import localtime, make_aware, utc
+
+from happenings.utils.common import order_events
+from happenings.utils.displays import add_occurrences
+from happenings.utils.handlers import CountHandler
+from happenings.utils.occurrences import (
+    MonthIndex, OccurrenceHandler, iter_occurrences, occurrence_days
+)
+from tests.integration_tests.event_factory import (
+    create_recurring_event, SetMeUp
+)
+
+
+def dt_utc(*args):
+    return make_aware(datetime(*args), utc)
+
+
+@override_settings(TIME_ZONE='UTC')
+class OccurrenceHandlerTest(SetMeUp):
+    """Tests the closed-form occurrence engine."""
+    def test_same_count_as_count_handler(self):
+        events = [create_recurring_event(self.user, *args) for args in [
+            ((2014, 3, 5), (2014, 3, 5), 'DAILY'),
+            ((2014, 3, 6), (2014, 3, 6), 'WEEKDAY'),
+            ((2014, 3, 31), (2014, 4, 2), 'WEEKLY'),
+            ((2014, 3, 14), (2014, 3, 16), 'BIWEEKLY'),
+            ((2014, 3, 28), (2014, 4, 2), 'MONTHLY'),
+            ((2013, 5, 29), (2013, 6, 1), 'YEARLY'),
+            ((2014, 5, 30), (2014, 6, 2), 'NEVER'),
+        ]]
+        for month in (5, 6):
+            expected = CountHandler(2014, month, events).get_count()
+            count = OccurrenceHandler(2014, month, events).get_count()
+            # CountHandler may count a chunk day twice, so compare sets
+            self.assertEqual(
+                dict((k, set(v)) for k, v in count.items()),
+                dict((k, set(v)) for k, v in expected.items() if v)
+            )
+
+    def test_weekly_old_series(self):
+        """Old series are aligned directly to the month."""
+        event = create_recurring_event(
+            self.user, (2000, 1, 7), (2000, 1, 7), 'BIWEEKLY')
+        days = occurrence_days(event, date(2014, 5, 1), date(2014, 5, 31))
+        self.assertEqual(
+            days, [date(2014, 5, 9), date(2014, 5, 23)]
+        )
+
+    def test_end_repeat_cuts_chunk(self):
+        event = create_recurring_event(
+            self.user, (2014, 4, 26), (2014, 4, 29), 'MONTHLY',
+            date(2014, 6, 27)
+        )
+        count = OccurrenceHandler(2014, 6, [event]).get_count()
+        self.assertEqual(sorted(count), [26, 27])
+
+    def test_monthly_skips_short_months(self):
+        event = create_recurring_event(
+            self.user, (2014, 1, 31), (2014, 1, 31), 'MONTHLY')
+        self.assertEqual(OccurrenceHandler(2014, 4, [event]).get_count(), {})
+        self.assertEqual(
+            list(OccurrenceHandler(2014, 5, [event]).get_count()), [31]
+        )
+
+    def test_yearly_leap_day(self):
+        event = create_recurring_event(
+            self.user, (2012, 2, 29), (2012, 2, 29), 'YEARLY')
+        self.assertEqual(OccurrenceHandler(2014, 2, [event]).get_count(), {})
+        self.assertEqual(
+            list(OccurrenceHandler(2016, 2, [event]).get_count()), [29]
+        )
+
+    def test_month_occurrences(self):
+        weekly = create_recurring_event(
+            self.user, (2014, 5, 7), (2014, 5, 7), 'WEEKLY')
+        chunk = create_recurring_event(
+            self.user, (2014, 5, 20), (2014, 5, 22), 'NEVER')
+        occurrences = OccurrenceHandler(2014, 5, [chunk, weekly]).get_month()
+        self.assertEqual(occurrences.masks[weekly.pk], 1 << 6 | 1 << 13 |
+                         1 << 20 | 1 << 27)
+        self.assertEqual(occurrences.occurrence_days(chunk), [20, 21, 22])
+        self.assertEqual(
+            occurrences.days_with_events(), [7, 14, 20, 21, 22, 28]
+        )
+        self.assertEqual(occurrences.events_on(21), [chunk, weekly])
+        self.assertEqual(occurrences.events_on(1), [])
+        # it can still be used like the dict returned by get_count()
+        self.assertEqual(
+            occurrences[21], [('event', chunk.pk), ('event', weekly.pk)]
+        )
+        self.assertNotIn(1, occurrences)
+        self.assertEqual(len(occurrences), 6)
+
+    def test_month_index(self):
+        """
+        A MonthIndex answers the same way whether it's built from a
+        MonthOccurrences or from the dict returned by get_count().
+        """
+        weekly = create_recurring_event(
+            self.user, (2014, 5, 7), (2014, 5, 7), 'WEEKLY')
+        chunk = create_recurring_event(
+            self.user, (2014, 5, 20), (2014, 5, 22), 'NEVER')
+        events = [chunk, weekly]
+        for count in (
+            OccurrenceHandler(2014, 5, events).get_month(),
+            OccurrenceHandler(2014, 5, events).get_count(),
+        ):
+            index = MonthIndex(count, events)
+            self.assertIs(index.get(chunk.pk), chunk)
+            self.assertIsNone(index.get(0))
+            self.assertEqual(index.events_on(21), [chunk, weekly])
+            self.assertEqual(index.events_on(1), [])
+            self.assertEqual(index.days(), [7, 14, 20, 21, 22, 28])
+            self.assertEqual(index.occurrence_days(chunk), [20, 21, 22])
+            self.assertEqual(
+                index.occurrence_days(weekly), [7, 14, 21, 28])
+
+    def test_order_events_with_index(self):
+        weekly = create_recurring_event(
+            self.user, (2014, 5, 7), (2014, 5, 7), 'WEEKLY')
+        chunk = create_recurring_event(
+            self.user, (2014, 5, 20), (2014, 5, 22), 'NEVER')
+        events = [chunk, weekly]
+        index = MonthIndex(
+            OccurrenceHandler(2014, 5, events).get_month(), events)
+        add_occurrences(events, index)
+        self.assertEqual(order_events(events), order_events(
+            events, index=index))
+        self.assertEqual(order_events(events, d=True), order_events(
+            events, d=True, index=index))
+
+    def test_occurs_on(self):
+        """
+        Recurrence.occurs_on() (used by the day view) agrees with the days
+        worked out for the month.
+        """
+        events = [create_recurring_event(self.user, *args) for args in [
+            ((2014, 3, 6), (2014, 3, 6), 'WEEKDAY'),
+            ((2014, 3, 31), (2014, 4, 2), 'WEEKLY'),
+            ((2014, 3, 14), (2014, 3, 16), 'BIWEEKLY'),
+            ((2014, 3, 28), (2014, 4, 2), 'MONTHLY'),
+            ((2014, 1, 31), (2014, 1, 31), 'MONTHLY'),
+            ((2013, 5, 29), (2013, 6, 1), 'YEARLY'),
+            ((2014, 5, 30), (2014, 6, 2), 'NEVER'),
+            ((2014, 5, 2), (2014, 5, 2), 'DAILY', date(2014, 5, 20)),
+        ]]
+        for event in events:
+            days = occurrence_days(event, date(2014, 5, 1), date(2014, 5, 31))
+            self.assertEqual(
+                [d for d in (date(2014, 5, x) for x in range(1, 32))
+                 if event.recurrence.occurs_on(d)],
+                days, event.repeat
+            )
+
+
+@override_settings(TIME_ZONE='America/New_York')
+class DSTOccurrencesTest(SetMeUp):
+    """
+    Occurrences whose local time is ambiguous or skipped by DST, as found
+    by iter_occurrences() and by the event's Recurrence.
+    """
+    def test_fall_back(self):
+        # 1:30 happens twice on Nov. 2nd, 2014; the standard time one is used
+        event = create_recurring_event(
+            self.user, (2014, 10, 26, 1, 30), (2014, 10, 26, 2), 'WEEKLY')
+        occurrences = list(iter_occurrences(
+            event, dt_utc(2014, 11, 1), dt_utc(2014, 11, 4)))
+        self.assertEqual(occurrences, [
+            (dt_utc(2014, 11, 2, 6, 30), dt_utc(2014, 11, 2, 7))
+        ])
+        rec = event.recurrence
+        self.assertEqual(
+            rec.after(dt_utc(2014, 10, 27)), dt_utc(2014, 11, 2, 6, 30))
+        self.assertEqual(
+            rec.before(dt_utc(2014, 11, 3), inc=True),
+            dt_utc(2014, 11, 2, 6, 30)
+        )
+        self.assertEqual(
+            rec.get_end(dt_utc(2014, 11, 2, 6, 30)), dt_utc(2014, 11, 2, 7))
+        self.assertTrue(
+            event.is_happening(localtime(dt_utc(2014, 11, 2, 6, 45))))
+
+    def test_spring_forward(self):
+        # 2:30 doesn't happen on March 8th, 2015; it's moved to 3:30
+        event = create_recurring_event(
+            self.user, (2015, 3, 1, 2, 30), (2015, 3, 1, 4), 'DAILY')
+        occurrences = list(iter_occurrences(
+            event, dt_utc(2015, 3, 8), dt_utc(2015, 3, 9)))
+        self.assertEqual(occurrences, [
+            (dt_utc(2015, 3, 8, 7, 30), dt_utc(2015, 3, 8, 8))
+        ])
+        rec = event.recurrence
+        self.assertEqual(
+            rec.between(dt_utc(2015, 3, 8), dt_utc(2015, 3, 9)),
+            [dt_utc(2015, 3, 8, 7, 30)]
+        )
+        self.assertEqual(
+            rec.get_end(dt_utc(2015, 3, 8, 7, 30)), dt_utc(2015, 3, 8, 8))
+        self.assertEqual(list(rec.xafter(dt_utc(2015, 3, 7, 12)))[:2], [
+            dt_utc(2015, 3, 8, 7, 30), dt_utc(2015, 3, 9, 6, 30)
+        ])
@@ -0,0 +1,40 @@
+from __future__ import unicode_literals
+
+from datetime import date, datetime, timedelta
+
+from django.test import TestCase
+
+from happenings.utils.common import phase_align, phase_steps
+
+
+class PhaseAlignTest(TestCase):
+    def setUp(self):
+        self.step = timedelta(days=14)
+
+    def test_align_date(self):
+        d = phase_align(date(2015, 1, 2), date(2025, 6, 1), self.step)
+        self.assertEqual(d, date(2025, 6, 6))
+        self.assertEqual((d - date(2015, 1, 2)).days % 14, 0)
+
+    def test_align_on_target(self):
+        d = phase_align(date(2015, 1, 2), date(2015, 1, 16), self.step)
+        self.assertEqual(d, date(2015, 1, 16))
+
+    def test_align_strict(self):
+        d = phase_align(
+            date(2015, 1, 2), date(2015, 1, 16), self.step, strict=True
+        )
+        self.assertEqual(d, date(2015, 1, 30))
+
+    def test_anchor_after_target(self):
+        self.assertEqual(
+            phase_steps(date(2015, 1, 2), date(2014, 1, 1), self.step), 0
+        )
+
+    def test_align_datetime(self):
+        anchor = datetime(2015, 1, 2, 18)
+        target = datetime(2015, 1, 9, 18, 0, 0, 1)
+        self.assertEqual(
+            phase_align(anchor, target, timedelta(days=7)),
+            datetime(2015, 1, 16, 18)
+        )
@@ -0,0 +1,78 @@
+from __future__ import unicode_literals
+
+from datetime import date, datetime
+
+from django.test.utils import override_settings
+from django.utils.timezone import make_aware, utc
+
+from tests.integration_tests.event_factory import (
+    create_recurring_event, SetMeUp
+)
+
+
+def dt(*args):
+    return make_aware(datetime(*args), utc)
+
+
+@override_settings(TIME_ZONE='UTC')
+class RecurrenceTest(SetMeUp):
+    def test_between(self):
+        event = create_recurring_event(
+            self.user, (2014, 5, 1, 9), (2014, 5, 1, 10), 'WEEKLY')
+        self.assertEqual(
+            event.recurrence.between(dt(2014, 5, 8, 9), dt(2014, 5, 22, 9)),
+            [dt(2014, 5, 15, 9)]
+        )
+        self.assertEqual(
+            event.recurrence.between(
+                dt(2014, 5, 8, 9), dt(2014, 5, 22, 9), inc=True),
+            [dt(2014, 5, 8, 9), dt(2014, 5, 15, 9), dt(2014, 5, 22, 9)]
+        )
+
+    def test_after_and_before(self):
+        event = create_recurring_event(
+            self.user, (2000, 1, 7, 9), (2000, 1, 7, 10), 'BIWEEKLY')
+        rec = event.recurrence
+        self.assertEqual(rec.after(dt(2014, 5, 9, 9)), dt(2014, 5, 23, 9))
+        self.assertEqual(
+            rec.after(dt(2014, 5, 9, 9), inc=True), dt(2014, 5, 9, 9)
+        )
+        self.assertEqual(rec.before(dt(2014, 5, 9, 9)), dt(2014, 4, 25, 9))
+        self.assertEqual(rec.before(dt(2000, 1, 7, 9)), None)
+
+    def test_end_repeat(self):
+        event = create_recurring_event(
+            self.user, (2014, 1, 31, 9), (2014, 1, 31, 10), 'MONTHLY',
+            date(2014, 5, 31)
+        )
+        self.assertEqual(
+            event.recurrence.between(dt(2014, 1, 1), dt(2015, 1, 1)),
+            [dt(2014, 1, 31, 9), dt(2014, 3, 31, 9), dt(2014, 5, 31, 9)]
+        )
+        self.assertEqual(event.recurrence.after(dt(2014, 6, 1)), None)
+        self.assertEqual(
+            event.recurrence.before(dt(2015, 1, 1)), dt(2014, 5, 31, 9)
+        )
+
+    def test_iter_days(self):
+        event = create_recurring_event(
+            self.user, (2014, 5, 2), (2014, 5, 4), 'WEEKLY')
+        days = event.recurrence.iter_days(date(2014, 5, 10))
+        self.assertEqual(
+            [next(days) for i in range(4)],
+            [date(2014, 5, 10), date(2014, 5, 11), date(2014, 5, 16),
+             date(2014, 5, 17)]
+        )
+        self.assertTrue(event.recurrence.occurs_on(date(2014, 5, 18)))
+        self.assertFalse(event.recurrence.occurs_on(date(2014, 5, 19)))
+
+    def test_compiled_once(self):
+        event = create_recurring_event(
+            self.user, (2014, 5, 1), (2014, 5, 1), 'WEEKLY')
+        rec = event.recurrence
+        self.assertIs(event.recurrence, rec)
+        event.repeat = 'DAILY'
+        self.assertIsNot(event.recurrence, rec)
+        self.assertEqual(
+            event.recurrence.after(dt(2014, 5, 1)), dt(2014, 5, 2)
+        )
@@ -0,0 +1,128 @@
+from __future__ import unicode_literals
+
+from datetime import datetime
+
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.urlresolvers import reverse
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils.timezone import make_aware, utc
+
+from happenings.models import Event
+from happenings.templatetags.happenings_tags import upcoming_events
+from happenings.utils import routing
+from happenings.utils.routing import get_read_db
+from tests.integration_tests.event_factory import create_event
+from tests.unit_tests.test_utils.test_cache import CACHE_SETTINGS
+
+
+class ReplicaTestCase(TestCase):
+    """
+    Calendar reads go to the 'replica' database, which (unlike a real
+    replica) isn't kept in sync with the default one, so that it's clear
+    which database each read went to.
+    """
+    multi_db = True
+
+    def setUp(self):
+        routing._unavailable.clear()
+        self.user = User.objects.create_user(
+            'foo', 'bar@example.com', 'secret'
+        )
+        self.event = create_event(
+            start_date=(2014, 5, 2),
+            end_date=(2014, 5, 2),
+            created_by=self.user,
+            title="event",
+            description="Testing 1 2 3",
+            repeat="WEEKLY",
+        )
+
+    def replicate(self):
+        self.user.save(using='replica')
+        self.event.save(using='replica')
+
+
+@override_settings(CALENDAR_READ_DB='replica')
+class ReadDatabaseTest(ReplicaTestCase):
+
+    def test_reads_go_to_read_db(self):
+        self.assertEqual(get_read_db(), 'replica')
+        now = make_aware(datetime(2014, 5, 6), utc)
+        self.assertEqual(list(Event.objects.all_month_events(2014, 5)), [])
+        self.assertEqual(list(Event.objects.live(now)), [])
+        self.replicate()
+        self.assertEqual(
+            list(Event.objects.all_month_events(2014, 5)), [self.event])
+        self.assertEqual(list(Event.objects.live(now)), [self.event])
+        self.assertEqual(
+            len(upcoming_events(now=now)['upcoming_events']), 5)
+
+    def test_writes_go_to_primary(self):
+        self.assertTrue(Event.objects.filter(pk=self.event.pk).exists())
+        self.assertFalse(
+            Event.objects.using('replica').filter(pk=self.event.pk).exists())
+
+    def test_detail_view_falls_back_to_primary(self):
+        """An event that hasn't been replicated yet is still found."""
+        response = self.client.get(
+            reverse('calendar:detail', kwargs={'pk': self.event.pk}))
+        self.assertContains(response, self.event.title)
+
+    def test_unavailable_read_db(self):
+        connection = connections['replica']
+
+        def ensure_connection():
+            raise OperationalError("unable to open database file")
+
+        connection.ensure_connection = ensure_connection
+        try:
+            self.assertEqual(get_read_db(), DEFAULT_DB_ALIAS)
+        finally:
+            del connection.ensure_connection
+        # it isn't tried again straight away
+        self.assertEqual(get_read_db(), DEFAULT_DB_ALIAS)
+        routing._unavailable.clear()
+        self.assertEqual(get_read_db(), 'replica')
+
+    @override_settings(CALENDAR_READ_DB='missing')
+    def test_unknown_alias(self):
+        self.assertEqual(get_read_db(), DEFAULT_DB_ALIAS)
+
+
+@override_settings(CALENDAR_READ_DB='replica', **CACHE_SETTINGS)
+class LaggingReadDatabaseTest(ReplicaTestCase):
+    """With cached calendars, reads go to the default database for a while
+    after a write, so that what's cached under the new generation is
+    rendered from the written data."""
+
+    def setUp(self):
+        super(LaggingReadDatabaseTest, self).setUp()
+        self.replicate()
+        caches['happenings'].clear()
+
+    def get(self):
+        response = self.client.get(reverse(
+            'calendar:list', kwargs={'year': 2014, 'month': 5}))
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_reads_go_to_primary_after_write(self):
+        self.assertContains(self.get(), "Testing 1 2 3")
+        self.event.title = "Renamed"
+        # replicate() left the event on the replica, which keeps the old title
+        self.event.save(using=DEFAULT_DB_ALIAS)
+        self.assertEqual(get_read_db(), DEFAULT_DB_ALIAS)
+        self.assertContains(self.get(), "Renamed")
+
+        # the window is over, and the calendar cached during it is used
+        caches['happenings'].delete(routing.RECENT_WRITE_KEY)
+        self.assertEqual(get_read_db(), 'replica')
+        self.assertContains(self.get(), "Renamed")
+
+    @override_settings(CALENDAR_READ_DB_LAG=0)
+    def test_no_lag(self):
+        self.event.save(using=DEFAULT_DB_ALIAS)
+        self.assertEqual(get_read_db(), 'replica')
@@ -0,0 +1,60 @@
+from __future__ import unicode_literals
+
+from datetime import date
+from unittest import skipUnless
+
+from django.test.utils import override_settings
+
+from happenings.utils.occurrences import OccurrenceHandler
+from happenings.utils import vectorized
+from happenings.utils.vectorized import (
+    NumpyOccurrenceHandler, get_occurrence_handler
+)
+from tests.integration_tests.event_factory import (
+    create_recurring_event, SetMeUp
+)
+
+
+@override_settings(TIME_ZONE='UTC')
+class NumpyOccurrenceHandlerTest(SetMeUp):
+    @skipUnless(vectorized.np, "NumPy is not installed")
+    def test_same_masks_as_python(self):
+        events = [create_recurring_event(self.user, *args) for args in [
+            ((2014, 3, 5), (2014, 3, 5), 'DAILY'),
+            ((2014, 3, 6), (2014, 3, 6), 'WEEKDAY', date(2014, 5, 20)),
+            ((2014, 3, 31), (2014, 4, 2), 'WEEKLY'),
+            ((2014, 3, 14), (2014, 3, 16), 'BIWEEKLY'),
+            ((2014, 3, 28), (2014, 4, 2), 'MONTHLY'),
+            ((2014, 3, 25), (2014, 3, 31), 'MONTHLY'),
+            ((2013, 12, 30), (2014, 1, 2), 'YEARLY'),
+            ((2012, 2, 29), (2012, 2, 29), 'YEARLY'),
+            ((2014, 4, 30), (2014, 5, 2), 'NEVER'),
+        ]]
+        for year, month in ((2014, 4), (2014, 5), (2015, 1), (2016, 2)):
+            expected = OccurrenceHandler(year, month, events).get_month()
+            occurrences = NumpyOccurrenceHandler(
+                year, month, events).get_month()
+            self.assertEqual(occurrences.masks, expected.masks)
+            self.assertEqual(occurrences.events, expected.events)
+
+    @skipUnless(vectorized.np, "NumPy is not installed")
+    def test_no_events(self):
+        self.assertEqual(
+            len(NumpyOccurrenceHandler(2014, 5, []).get_month()), 0
+        )
+
+    def test_backend_setting(self):
+        with self.settings(CALENDAR_OCCURRENCE_BACKEND='python'):
+            self.assertIs(get_occurrence_handler(), OccurrenceHandler)
+        with self.settings(CALENDAR_OCCURRENCE_BACKEND='numpy'):
+            expected = NumpyOccurrenceHandler if vectorized.np else \
+                OccurrenceHandler
+            self.assertIs(get_occurrence_handler(), expected)
+
+    def test_falls_back_without_numpy(self):
+        np, vectorized.np = vectorized.np, None
+        try:
+            with self.settings(CALENDAR_OCCURRENCE_BACKEND='numpy'):
+                self.assertIs(get_occurrence_handler(), OccurrenceHandler)
+        finally:
+            vectorized.np = np